@@ -1,4 +1,5 @@
 import sys, time, math, re
+import multiprocessing
 import numpy as np
 from copy import copy
 from scipy import stats
@@ -6,8 +7,197 @@ from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
 import kepio, kepmsg, kepkey
 
+# -----------------------------------------------------------
+# grid of trial periods
+#
+# pgrid = 'linear'    - uniform steps of (maxper - minper) / nsearch
+#         'log'       - uniform steps in log(period)
+#         'frequency' - uniform steps in 1 / period
+
+def periodgrid(minper,maxper,nsearch,pgrid):
+
+    if pgrid == 'log':
+        trialPeriods = np.logspace(np.log10(minper),np.log10(maxper),nsearch+1)
+    elif pgrid == 'frequency':
+        trialPeriods = 1.0 / np.linspace(1.0 / minper,1.0 / maxper,nsearch+1)
+    else:
+        dPeriod = (maxper - minper) / nsearch
+        trialPeriods = np.arange(minper,maxper+dPeriod,dPeriod,dtype='float32')
+
+    return np.array(trialPeriods,dtype='float32')
+
+# -----------------------------------------------------------
+# BLS signal residue at one trial period
+#
+# The folded light curve is binned with np.bincount and every
+# (phase, duration) window is evaluated at once from prefix sums.
+# Windows that include an empty phase bin are rejected, as are
+# non-positive signal residues. Returns the maximum signal residue
+# and the duration and mid-phase of the best window in phase bins
+
+def blsperiod(time,flux,err,trialPeriod,nbins,mindur,maxdur):
+
+    trialFrequency = 1.0 / trialPeriod
+
+# minimum and maximum transit durations in quantized phase units
+
+    duration1 = max(int(float(nbins) * mindur / 24.0 / trialPeriod),2)
+    duration2 = max(int(float(nbins) * maxdur / 24.0 / trialPeriod) + 1,duration1 + 1)
+
+# 30 minutes in quantized phase units
+
+    halfHour = int(0.02083333 / trialPeriod * nbins + 1)
+
+# compute folded and binned time series with trial period
+
+    phase = np.array(((time * trialFrequency) - np.floor(time * trialFrequency)) * float(nbins),dtype='int')
+    npts = np.bincount(phase,minlength=nbins)[:nbins]
+    work4 = np.bincount(phase,weights=flux,minlength=nbins)[:nbins] / npts
+    work5 = np.sqrt(np.bincount(phase,weights=err**2,minlength=nbins)[:nbins] / npts)
+    work4 = np.array(work4,dtype='float32')
+    work5 = np.array(work5,dtype='float32')
+
+# extend the work arrays beyond nbins by wrapping
+
+    work4 = np.append(work4,work4[:duration2])
+    work5 = np.append(work5,work5[:duration2])
+
+# calculate weights of folded light curve points
+
+    sigmaSum = np.nansum(np.power(work5,-2))
+    omega = np.power(work5,-2) / sigmaSum
+
+# calculate weighted phased light curve
+
+    s = omega * work4
+
+# prefix sums of the window quantities, with empty bins counted separately
+
+    bad = ~np.isfinite(s) | ~np.isfinite(omega)
+    sum1 = np.zeros(len(s)+1,dtype='float64')
+    sum2 = np.zeros(len(s)+1,dtype='float64')
+    nbad = np.zeros(len(s)+1,dtype='int')
+    sum1[1:] = np.cumsum(np.where(bad,0.0,np.power(s,2)))
+    sum2[1:] = np.cumsum(np.where(bad,0.0,omega))
+    nbad[1:] = np.cumsum(bad)
+
+# signal residue for every phase start and transit duration
+
+    durations = np.arange(duration1,duration2+1,int(halfHour))
+    i1 = np.arange(nbins)[:,None]
+    i2 = np.minimum(i1 + durations[None,:],len(s))
+    sr1 = sum1[i2] - sum1[i1]
+    sr2 = sum2[i2] - sum2[i1]
+    sr = np.sqrt(sr1 / (sr2 * (1.0 - sr2)))
+    sr[(nbad[i2] - nbad[i1] > 0) | ~np.isfinite(sr)] = -np.inf
+
+# first window with the maximum signal residue
+
+    best = np.argmax(sr)
+    srMax = sr.flat[best]
+    if srMax > 0.0:
+        i1 = best // len(durations)
+        duration = durations[best % len(durations)]
+        i2 = i1 + duration
+        return srMax, float(duration), float((i1 + i2) // 2)
+    else:
+        return 0.0, np.nan, np.nan
+
+# -----------------------------------------------------------
+# write BLS search progress to the shell
+
+def blsprogress(trialPeriod,fracComplete):
+
+    txt  = '\r'
+    txt += 'Trial period = '
+    txt += str(int(trialPeriod))
+    txt += ' days ['
+    txt += str(int(fracComplete))
+    txt += '% complete]'
+    txt += ' ' * 20
+    sys.stdout.write(txt)
+    sys.stdout.flush()
+
+# -----------------------------------------------------------
+# time series shared read-only by the BLS worker processes
+
+blsdata = {}
+
+def blsinit(time,flux,err):
+
+    blsdata['time'] = np.frombuffer(time,dtype='float64')
+    blsdata['flux'] = np.frombuffer(flux,dtype='float64')
+    blsdata['err'] = np.frombuffer(err,dtype='float64')
+
+# -----------------------------------------------------------
+# BLS search over one contiguous chunk of trial periods within a worker
+
+def blschunk(args):
+
+    i1, trialPeriods, nbins, mindur, maxdur = args
+    srMax, transitDuration, transitPhase = \
+        blssearch(blsdata['time'],blsdata['flux'],blsdata['err'],
+                  trialPeriods,nbins,mindur,maxdur,False)
+
+    return i1, srMax, transitDuration, transitPhase
+
+# -----------------------------------------------------------
+# BLS search over a grid of trial periods
+#
+# With nproc > 1 the period grid is split into contiguous chunks which
+# are searched by a pool of nproc worker processes. The time series are
+# placed once in shared memory rather than pickled with every chunk and
+# progress is reported by the parent process as chunks complete.
+# nproc = 0 uses every available core
+
+def blssearch(time,flux,err,trialPeriods,nbins,mindur,maxdur,verbose,nproc=1):
+
+    nperiod = len(trialPeriods)
+    srMax = np.zeros(nperiod,dtype='float32')
+    transitDuration = np.zeros(nperiod,dtype='float32')
+    transitPhase = np.zeros(nperiod,dtype='float32')
+    if nproc < 1:
+        nproc = multiprocessing.cpu_count()
+    if nproc == 1 or nperiod < 2:
+        for i in range(nperiod):
+            if verbose:
+                blsprogress(trialPeriods[i],float(i) / float(max(nperiod - 1,1)) * 100.0)
+            srMax[i], transitDuration[i], transitPhase[i] = \
+                blsperiod(time,flux,err,trialPeriods[i],nbins,mindur,maxdur)
+    else:
+        shared = []
+        for work in [time, flux, err]:
+            array = multiprocessing.RawArray('d',len(work))
+            np.frombuffer(array,dtype='float64')[:] = work
+            shared.append(array)
+        nchunk = max(1,nperiod // (nproc * 16))
+        chunks = [(i,trialPeriods[i:i+nchunk],nbins,mindur,maxdur)
+                  for i in range(0,nperiod,nchunk)]
+        pool = multiprocessing.Pool(nproc,initializer=blsinit,initargs=shared)
+        try:
+            complete = 0
+            for i1, sr, dur, ph in pool.imap_unordered(blschunk,chunks):
+                i2 = i1 + len(sr)
+                srMax[i1:i2] = sr
+                transitDuration[i1:i2] = dur
+                transitPhase[i1:i2] = ph
+                complete += len(sr)
+                if verbose:
+                    blsprogress(trialPeriods[i2-1],float(complete) / float(nperiod) * 100.0)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    return srMax, transitDuration, transitPhase
+
+# -----------------------------------------------------------
+# BLS period search task
+
 def kepbls(infile,outfile,datacol,errcol,minper,maxper,mindur,maxdur,nsearch,
-           nbins,plot,clobber,verbose,logfile,status,cmdLine=False):
+           pgrid,nbins,nproc,plot,clobber,verbose,logfile,status,cmdLine=False):
 
 # startup parameters
 
@@ -36,7 +226,9 @@ def kepbls(infile,outfile,datacol,errcol,minper,maxper,mindur,maxdur,nsearch,
     call += 'mindur='+str(mindur)+' '
     call += 'maxdur='+str(maxdur)+' '
     call += 'nsearch='+str(nsearch)+' '
+    call += 'pgrid='+pgrid+' '
     call += 'nbins='+str(nbins)+' '
+    call += 'nproc='+str(nproc)+' '
     plotit = 'n'
     if (plot): plotit = 'y'
     call += 'plot='+plotit+ ' '
@@ -120,84 +312,11 @@ def kepbls(infile,outfile,datacol,errcol,minper,maxper,mindur,maxdur,nsearch,
 # start period search
 
     if status == 0:
-        srMax = np.array([],dtype='float32')
-        transitDuration = np.array([],dtype='float32')
-        transitPhase = np.array([],dtype='float32')
-        dPeriod = (maxper - minper) / nsearch
-        trialPeriods = np.arange(minper,maxper+dPeriod,dPeriod,dtype='float32')
-        complete = 0
+        trialPeriods = periodgrid(minper,maxper,nsearch,pgrid)
         print(' ')
-        for trialPeriod in trialPeriods:
-            fracComplete = float(complete) / float(len(trialPeriods) - 1) * 100.0
-            txt  = '\r'
-            txt += 'Trial period = '
-            txt += str(int(trialPeriod))
-            txt += ' days ['
-            txt += str(int(fracComplete))
-            txt += '% complete]'
-            txt += ' ' * 20
-            sys.stdout.write(txt)
-            sys.stdout.flush()
-            complete += 1
-            srMax = np.append(srMax,0.0)
-            transitDuration = np.append(transitDuration,np.nan)
-            transitPhase = np.append(transitPhase,np.nan)
-            trialFrequency = 1.0 / trialPeriod
-
-# minimum and maximum transit durations in quantized phase units
-
-            duration1 = max(int(float(nbins) * mindur / 24.0 / trialPeriod),2)
-            duration2 = max(int(float(nbins) * maxdur / 24.0 / trialPeriod) + 1,duration1 + 1)
-
-# 30 minutes in quantized phase units
-
-            halfHour = int(0.02083333 / trialPeriod * nbins + 1)
-
-# compute folded time series with trial period
-
-            work4 = np.zeros((nbins),dtype='float32')
-            work5 = np.zeros((nbins),dtype='float32')
-            phase = np.array(((work1 * trialFrequency) - np.floor(work1 * trialFrequency)) * float(nbins),dtype='int')
-            ptuple = np.array([phase, work2, inerr])
-            ptuple = np.rot90(ptuple,3)
-            phsort = np.array(sorted(ptuple,key=lambda ph: ph[2]))
-            for i in range(nbins):
-                elements = np.nonzero(phsort[:,2] == float(i))[0]
-                work4[i] = np.mean(phsort[elements,1])
-                work5[i] = math.sqrt(np.sum(np.power(phsort[elements,0], 2)) / len(elements))
-
-# extend the work arrays beyond nbins by wrapping
-
-            work4 = np.append(work4,work4[:duration2])
-            work5 = np.append(work5,work5[:duration2])
-
-# calculate weights of folded light curve points
-
-            sigmaSum = np.nansum(np.power(work5,-2))
-            omega = np.power(work5,-2) / sigmaSum
-
-# calculate weighted phased light curve
-
-            s = omega * work4
-
-# iterate through trial period phase
-
-            for i1 in range(nbins):
-
-# iterate through transit durations
-
-                for duration in range(duration1,duration2+1,int(halfHour)):
-
-# calculate maximum signal residue
-
-                    i2 = i1 + duration
-                    sr1 = np.sum(np.power(s[i1:i2],2))
-                    sr2 = np.sum(omega[i1:i2])
-                    sr = math.sqrt(sr1 / (sr2 * (1.0 - sr2)))
-                    if sr > srMax[-1]:
-                        srMax[-1] = sr
-                        transitDuration[-1] = float(duration)
-                        transitPhase[-1] = float((i1 + i2) / 2)
+        srMax, transitDuration, transitPhase = \
+            blssearch(work1,work2,inerr,trialPeriods,nbins,mindur,maxdur,True,
+                      nproc)
 
 # normalize maximum signal residue curve
 
@@ -350,9 +469,15 @@ if '--shell' in sys.argv:
     parser.add_argument('--nsearch', default=1000,
                         help='Number of test periods between minper and maxper',
                         type=int)
+    parser.add_argument('--pgrid', default='linear',
+                        help='Spacing of the trial period grid', type=str,
+                        choices=['linear','log','frequency'])
     parser.add_argument('--nbins', default=1000,
                         help='Number of bins in the folded time series at any test period',
                         type=int)
+    parser.add_argument('--nproc', default=1,
+                        help='Number of processes searching trial periods (0 = all cores)',
+                        type=int)
     parser.add_argument('--plot', action='store_true', help='Plot result?')
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?')
     parser.add_argument('--verbose', action='store_true', help='Write to a log file?')
@@ -363,8 +488,8 @@ if '--shell' in sys.argv:
     args = parser.parse_args()
     cmdLine=True
     kepbls(args.infile,args.outfile,args.datacol,args.errcol,args.minper,args.maxper,args.mindur,
-           args.maxdur,args.nsearch,args.nbins,args.plot,args.clobber,args.verbose,args.logfile,
-           args.status, cmdLine)
+           args.maxdur,args.nsearch,args.pgrid,args.nbins,args.nproc,args.plot,args.clobber,
+           args.verbose,args.logfile,args.status, cmdLine)
 else:
     from pyraf import iraf
     parfile = iraf.osfn("kepler$kepbls.par")
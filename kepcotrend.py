@@ -14,7 +14,7 @@ Changelog:
 __svnid__ = "$Id: kepcotrend.py 6165 2014-03-26 21:16:27Z mstill $"
 __url__ = "$URL: svn+ssh://mstill@murzim.amn.nasa.gov/data-repo/trunk/data/flight/go/PyKE/kepler/kepcotrend.py $"
 
-import sys
+import sys, os
 import matplotlib.pyplot as plt
 import numpy as np
 import math
@@ -60,22 +60,28 @@ def putInNans(bad_data,flux):
             newflux[i] = np.nan
     return newflux
 
-def get_pcomp_list_newformat(bvdat,pcomplist,newcad,short,scinterp):
+def get_pcomp_list_newformat(bvcad,bvvectors,pcomplist,newcad,short,scinterp):
     """
     Finds cotrending basis vectors which have been requested to be
     used by the user and adds them to an array.
     """
     status = False
+    pcomplist = np.array(pcomplist,dtype=int)
     pcomp = np.zeros((len(pcomplist),len(newcad)))
-    for i in range(len(np.array(pcomplist))):
-        j = int(np.array(pcomplist)[i])
-        dat = bvdat.field('VECTOR_%s' %j)[np.isnan(bvdat.field('CADENCENO')) == False]
-        bvcadfull = bvdat.field('CADENCENO')[np.isnan(bvdat.field('CADENCENO')) == False]
+    #the basis vector cadences found in newcad, looked up once for all vectors
+    if np.all(np.diff(bvcad) > 0) and len(bvcad) > 0:
+        idx = np.minimum(np.searchsorted(bvcad,newcad),len(bvcad) - 1)
+        incad = np.zeros(len(bvcad),dtype=bool)
+        incad[idx[bvcad[idx] == newcad]] = True
+    else:
+        incad = np.in1d(bvcad,newcad)
+    bv_cad = bvcad[incad]
+    for i in range(len(pcomplist)):
+        dat = bvvectors[pcomplist[i] - 1]
         #try:
         if short:
             #if the data is short cadence the interpolate the basis vectors
-            bv_data = dat[np.in1d(bvdat.field('CADENCENO'),newcad)]
-            bv_cad = bvcadfull[np.in1d(bvdat.field('CADENCENO'),newcad)]
+            bv_data = dat[incad]
             #funny things happen why I use interp1d for linear interpolation
             #so I have opted to use the numpy interp function for linear
             if scinterp == 'linear':
@@ -91,7 +97,7 @@ def get_pcomp_list_newformat(bvdat,pcomplist,newcad,short,scinterp):
                 pcomp[i][lower] = bv_data[0]
                 pcomp[i][upper] = bv_data[-1]
         else:
-            pcomp[i] = dat[np.in1d(bvdat.field('CADENCENO'),newcad)]
+            pcomp[i] = dat[incad]
     return pcomp,status
 
 def make_sc_lc(obs_cad,bv_cad,flux):
@@ -170,6 +176,22 @@ def do_lsq_uhat(pcomps,cad,flux,orthog=True):
 
     return coeffs
 
+def do_lsq_uhat_batch(pcomps,fluxes):
+    """
+    the 'matrix' linear least squares fit of one set of basis vectors to
+    many light curves sampled at the same cadences. The normal matrix is
+    factorized once and every light curve is solved as one column of the
+    right hand side. fluxes has one row per light curve, the coefficients
+    are returned with one column per light curve
+    """
+
+    U_hat = np.asarray(pcomps,dtype='float64')
+    alpha = np.dot(U_hat,U_hat.T)
+    beta = np.dot(U_hat,np.transpose(fluxes))
+    coeffs = np.linalg.solve(alpha,beta)
+
+    return 0. - coeffs
+
 def do_lsq_nlin(pcomps,cad,flux):
     """
     does a linear least squares fit of the basis vectors to the light curve
@@ -490,141 +512,27 @@ def split_on_nans(bad_data,cad):
             blocks.append(cad[-1])
     return blocks
 
-def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
-                 sigma,maskfile,scinterp,plot,clobber,verbose,logfile,
-                 status,cmdLine=False):
+def read_target(infile,bvfile,bvlist,maskfile,scinterp,bases,logfile,verbose):
     """
-    Setup the kepcotrend environment
-
-    infile:
-    the input file in the FITS format obtained from MAST
-
-    outfile:
-    The output will be a fits file in the same style as the input file but
-    with two additional columns: CBVSAP_MODL and CBVSAP_FLUX. The first of
-    these is the best fitting linear combination of basis vectors. The second
-    is the new flux with the basis vector sum subtracted. This is the new flux
-    value.
-
-    plot:
-    either True or False if you want to see a plot of the light curve
-    The top plot shows the original light curve in blue and the sum of basis
-    vectors in red
-    The bottom plot has had the basis vector sum subracted
-
-    bvfile:
-    the name of the FITS file containing the basis vectors
-
-    listbv:
-    the basis vectors to fit to the data
-
-    fitmethod:
-    fit using either the 'llsq' or the 'simplex' method. 'llsq' is usually the
-    correct one to use because as the basis vectors are orthogonal. Simplex
-    gives you option of using a different merit function - ie. you can
-    minimise the least absolute residual instead of the least squares which
-    weights outliers less
-
-    fitpower:
-    if using a simplex you can chose your own power in the metir function
-    - i.e. the merit function minimises abs(Obs - Mod)^P. P=2 is least
-    squares, P = 1 minimises least absolutes
-
-    iterate:
-    should the program fit the basis vectors to the light curve data then
-    remove data points further than 'sigma' from the fit and then refit
-
-    maskfile:
-    this is the name of a mask file which can be used to define regions of the
-    flux time series to exclude from the fit. The easiest way to create this
-    is by using keprange from the PyKE set of tools. You can also make this
-    yourself with two BJDs on each line in the file specifying the beginning
-    and ending date of the region to exclude.
-
-    scinterp:
-    the basis vectors are only calculated for long cadence data, therefore if
-    you want to use short cadence data you have to interpolate the basis
-    vectors. There are several methods to do this, the best of these probably
-    being nearest which picks the value of the nearest long cadence data
-    point.
-    The options available are None|linear|nearest|zero|slinear|quadratic|cubic
-    If you are using short cadence data don't choose none
+    reads a light curve, normalizes it and finds the basis vectors it is to
+    be fit with, with and without the mask applied. Basis vectors are kept
+    once in bases, keyed by the CBV mod.out, cadence type, interpolation and
+    cadences; the target holds the keys. Everything else the fit and the
+    output need is returned in a dictionary
     """
-    # log the call
-    hashline = '----------------------------------------------------------------------------'
-    kepmsg.log(logfile,hashline,verbose)
-    call = 'KEPCOTREND -- '
-    call += 'infile='+infile+' '
-    call += 'outfile='+outfile+' '
-    call += 'bvfile='+bvfile+' '
-#       call += 'numpcomp= '+str(numpcomp)+' '
-    call += 'listbv= '+str(listbv)+' '
-    call += 'fitmethod=' +str(fitmethod)+ ' '
-    call += 'fitpower=' + str(fitpower)+ ' '
-    iterateit = 'n'
-    if (iterate): iterateit = 'y'
-    call += 'iterate='+iterateit+ ' '
-    call += 'sigma_clip='+str(sigma)+' '
-    call += 'mask_file='+maskfile+' '
-    call += 'scinterp=' + str(scinterp)+ ' '
-    plotit = 'n'
-    if (plot): plotit = 'y'
-    call += 'plot='+plotit+ ' '
-    overwrite = 'n'
-    if (clobber): overwrite = 'y'
-    call += 'clobber='+overwrite+ ' '
-    chatter = 'n'
-    if (verbose): chatter = 'y'
-    call += 'verbose='+chatter+' '
-    call += 'logfile='+logfile
-    kepmsg.log(logfile,call+'\n',verbose)
-
-    # start time
-    kepmsg.clock('KEPCOTREND started at',logfile,verbose)
 
-    # test log file
-    logfile = kepmsg.test(logfile)
-
-    # clobber output file
-    if clobber:
-        status = kepio.clobber(outfile,logfile,verbose)
-    if kepio.fileexists(outfile):
-        message = 'ERROR -- KEPCOTREND: ' + outfile + ' exists. Use --clobber'
-        status = kepmsg.err(logfile,message,verbose)
+    status = 0
+    target = {'infile': infile}
 
     # open input file
-    if status == 0:
-        instr, status = kepio.openfits(infile,'readonly',logfile,verbose)
-        tstart, tstop, bjdref, cadence, status = kepio.timekeys(instr,infile,
-                logfile,verbose,status)
+    instr, status = kepio.openfits(infile,'readonly',logfile,verbose)
+    tstart, tstop, bjdref, cadence, status = kepio.timekeys(instr,infile,
+            logfile,verbose,status)
 
     # fudge non-compliant FITS keywords with no values
     if status == 0:
         instr = kepkey.emptykeys(instr,file,logfile,verbose)
 
-    if status == 0:
-        if not kepio.fileexists(bvfile):
-            message = 'ERROR -- KEPCOTREND: ' + bvfile + ' does not exist.'
-            status = kepmsg.err(logfile,message,verbose)
-
-        #lsq_sq - nonlinear least squares fitting and simplex_abs have been
-        #removed from the options in PyRAF but they are still in the code!
-    if status == 0:
-        if fitmethod not in ['llsq','matrix','lst_sq','simplex_abs','simplex']:
-            message = 'Fit method must either: llsq, matrix, lst_sq or simplex'
-            status = kepmsg.err(logfile,message,verbose)
-
-    if status == 0:
-        if not is_numlike(fitpower) and fitpower is not None:
-            message = 'Fit power must be an real number or None'
-            status = kepmsg.err(logfile,message,verbose)
-
-
-
-    if status == 0:
-        if fitpower is None:
-            fitpower = 1.
-
     # input data
     if status == 0:
         short = False
@@ -700,13 +608,15 @@ def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
                        'reccommend nearest if you are unsure.')
             status = kepmsg.err(logfile,message,verbose)
 
-        bvfiledata = pyfits.open(bvfile)
-        bvdata = bvfiledata['MODOUT_%s_%s' %(module,output)].data
+    if status == 0:
+        bvcad, bvvectors, bvquarter, status = kepio.readCBV(bvfile,module,output,
+                                                            logfile,verbose)
 
-        if int(bvfiledata[0].header['QUARTER']) != int(quarter):
+    if status == 0:
+        if int(bvquarter) != int(quarter):
             message = ('CBV file and light curve file are from different ' +
                        'quarters. CBV file is from Q%s and light curve is ' +
-                       'from Q%s' %(int(bvfiledata[0].header['QUARTER']),
+                       'from Q%s' %(int(bvquarter),
                                    int(quarter)))
             status = kepmsg.err(logfile,message,verbose)
 
@@ -722,29 +632,14 @@ def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
         #cut out infinites and zero flux columns
         lc_cad,lc_date,lc_flux,lc_err,bad_data = cutBadData(lc_cad_o,
                 lc_date_o,lc_flux_o,lc_err_o)
-        #get a list of basis vectors to use from the list given
-        #accept different seperators
-        listbv = listbv.strip()
-        if listbv[1] in [' ',',',':',';','|',', ']:
-            separator = str(listbv)[1]
-        else:
-            message = ('You must separate your basis vector numbers to use ' +
-                       'with \' \' \',\' \':\' \';\' or \'|\' and the '
-                       'first basis vector to use must be between 1 and 9')
-            status = kepmsg.err(logfile,message,verbose)
-
-
-    if status == 0:
-        bvlist = np.fromstring(listbv,dtype=int,sep=separator)
-        if bvlist[0] == 0:
-            message = 'Must use at least one basis vector'
-            status = kepmsg.err(logfile,message,verbose)
-    if status == 0:
         if short:
-            bvdata.field('CADENCENO')[:] = ((((bvdata.field('CADENCENO')[:] +
-                                        (7.5/15.) )* 30.) - 11540.).round())
-        bvectors,in1derror = get_pcomp_list_newformat(bvdata, bvlist, lc_cad,
-                                                      short, scinterp)
+            bvcad = ((((bvcad + (7.5/15.) )* 30.) - 11540.).round())
+        in1derror = False
+        basekey = (bvfile,module,output,short,scinterp,np.asarray(lc_cad).tobytes())
+        if basekey not in bases:
+            bases[basekey],in1derror = get_pcomp_list_newformat(bvcad, bvvectors,
+                                                                bvlist, lc_cad,
+                                                                short, scinterp)
         if in1derror:
             message = ('It seems that you have an old version of numpy ' +
                        'which does not have the in1d function included. ' +
@@ -793,55 +688,102 @@ def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
             lc_cad_masked = np.copy(lc_cad)
             n_err_masked = np.copy(n_err)
 
-        bvectors_masked,hasin1d = get_pcomp_list_newformat(bvdata,bvlist,
-                                                           lc_cad_masked,
-                                                           short,scinterp)
+        #light curves fit by the same basis vectors at the same cadences
+        #share one design matrix
+        designkey = (bvfile,module,output,short,scinterp,
+                     np.asarray(lc_cad_masked).tobytes())
+        if designkey not in bases:
+            bases[designkey],hasin1d = get_pcomp_list_newformat(bvcad,bvvectors,
+                                                                bvlist,lc_cad_masked,
+                                                                short,scinterp)
 
-        if iterate and sigma is None:
-            message = 'If fitting iteratively you must specify a clipping range'
-            status = kepmsg.err(logfile,message,verbose)
+    # close input file, it is reopened to write the output
+    if status == 0:
+        status = kepio.closefits(instr,logfile,verbose)
 
     if status == 0:
+        target.update(version=version,lc_cad=lc_cad,lc_date=lc_date,
+                      lc_flux=lc_flux,bad_data=bad_data,lc_cad_o=lc_cad_o,
+                      basekey=basekey,medflux=medflux,n_flux=n_flux,
+                      n_flux_masked=n_flux_masked,n_err_masked=n_err_masked,
+                      lc_cad_masked=lc_cad_masked,designkey=designkey)
+
+    return target,status
+
+def fit_targets(targets,bases,fitmethod,fitpower,iterate,sigma):
+    """
+    fits the basis vectors to every light curve. Linear least squares fits
+    of light curves sharing a design matrix are solved together, iterative
+    and nonlinear fits are done one light curve at a time
+    """
+
+    batch = {}
+    order = []
+    for target in targets:
+        bvectors_masked = bases[target['designkey']]
+        lc_cad_masked = target['lc_cad_masked']
+        n_flux_masked = target['n_flux_masked']
         #uses Pvals = yhat * U_transpose
         if (iterate):
-            coeffs,fittedmask = do_lst_iter(bvectors_masked,lc_cad_masked,
-                    n_flux_masked,sigma,50.,fitmethod,fitpower)
+            target['coeffs'],target['fittedmask'] = do_lst_iter(bvectors_masked,
+                    lc_cad_masked,n_flux_masked,sigma,50.,fitmethod,fitpower)
         else:
-            if fitmethod == 'matrix' and domasking:
-                coeffs = do_lsq_uhat(bvectors_masked,lc_cad_masked,
-                                     n_flux_masked,False)
-            if fitmethod == 'llsq' and domasking:
-                coeffs = do_lsq_uhat(bvectors_masked,lc_cad_masked,
-                                     n_flux_masked,False)
-            elif fitmethod == 'lst_sq':
-                coeffs = do_lsq_nlin(bvectors_masked,lc_cad_masked,
-                                     n_flux_masked)
+            if fitmethod == 'lst_sq':
+                target['coeffs'] = do_lsq_nlin(bvectors_masked,lc_cad_masked,
+                                               n_flux_masked)
             elif fitmethod == 'simplex_abs':
-                coeffs = do_lsq_fmin(bvectors_masked,lc_cad_masked,
-                                     n_flux_masked)
+                target['coeffs'] = do_lsq_fmin(bvectors_masked,lc_cad_masked,
+                                               n_flux_masked)
             elif fitmethod == 'simplex':
-                coeffs = do_lsq_fmin_pow(bvectors_masked,lc_cad_masked,
-                                         n_flux_masked,fitpower)
+                target['coeffs'] = do_lsq_fmin_pow(bvectors_masked,lc_cad_masked,
+                                                   n_flux_masked,fitpower)
             else:
-                coeffs = do_lsq_uhat(bvectors_masked,lc_cad_masked,
-                                     n_flux_masked)
-
-        flux_after = (get_newflux(n_flux,bvectors,coeffs) +1) * medflux
-        flux_after_masked = ((get_newflux(n_flux_masked, bvectors_masked,
-                                          coeffs) + 1) * medflux)
-        bvsum = get_pcompsum(bvectors, coeffs)
-        bvsum_masked = get_pcompsum(bvectors_masked, coeffs)
-        bvsum_nans = putInNans(bad_data, bvsum)
-        flux_after_nans = putInNans(bad_data, flux_after)
-
-        if plot and status == 0:
-            newmedflux = np.median(flux_after + 1)
-            bvsum_un_norm = newmedflux*(1-bvsum)
-            do_plot(lc_date, lc_flux, flux_after, bvsum_un_norm, lc_cad,
-                    bad_data, lc_cad_o, version, cmdLine)
+                key = target['designkey']
+                if key not in batch:
+                    batch[key] = []
+                    order.append(key)
+                batch[key].append(target)
+
+    for key in order:
+        group = batch[key]
+        coeffs = do_lsq_uhat_batch(bases[key],
+                                   [target['n_flux_masked'] for target in group])
+        for i in range(len(group)):
+            group[i]['coeffs'] = coeffs[:,i:i+1]
+
+def write_target(target,bases,outfile,iterate,plot,logfile,verbose,cmdLine=False):
+    """
+    subtracts the fitted basis vectors from a light curve, writes the output
+    file and reports the fit
+    """
 
+    status = 0
+    coeffs = target['coeffs']
+    medflux = target['medflux']
+    n_flux_masked = target['n_flux_masked']
+    bvectors = bases[target['basekey']]
+    bvectors_masked = bases[target['designkey']]
+
+    flux_after = (get_newflux(target['n_flux'],bvectors,coeffs) +1) * medflux
+    flux_after_masked = ((get_newflux(n_flux_masked, bvectors_masked,
+                                      coeffs) + 1) * medflux)
+    bvsum = get_pcompsum(bvectors, coeffs)
+    bvsum_masked = get_pcompsum(bvectors_masked, coeffs)
+    bvsum_nans = putInNans(target['bad_data'], bvsum)
+    flux_after_nans = putInNans(target['bad_data'], flux_after)
+
+    if plot:
+        newmedflux = np.median(flux_after + 1)
+        bvsum_un_norm = newmedflux*(1-bvsum)
+        do_plot(target['lc_date'], target['lc_flux'], flux_after, bvsum_un_norm,
+                target['lc_cad'], target['bad_data'], target['lc_cad_o'],
+                target['version'], cmdLine)
+
+    # reopen input file and write the output file
+    instr, status = kepio.openfits(target['infile'],'readonly',logfile,verbose)
     if status == 0:
-        make_outfile(instr,outfile,flux_after_nans,bvsum_nans,version)
+        instr = kepkey.emptykeys(instr,file,logfile,verbose)
+        make_outfile(instr,outfile,flux_after_nans,bvsum_nans,target['version'])
 
     # close input file
     if status == 0:
@@ -850,13 +792,14 @@ def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
         #print some results to screen:
         print '      -----      '
         if iterate:
+            fittedmask = target['fittedmask']
             flux_fit = n_flux_masked[fittedmask]
             sum_fit = bvsum_masked[fittedmask]
-            err_fit = n_err_masked[fittedmask]
+            err_fit = target['n_err_masked'][fittedmask]
         else:
             flux_fit = n_flux_masked
             sum_fit = bvsum_masked
-            err_fit = n_err_masked
+            err_fit = target['n_err_masked']
 
         print 'reduced chi2: ' + str(chi2_gtf(flux_fit,sum_fit,err_fit,len(flux_fit)-len(coeffs)))
         print 'rms: ' + str(medflux*rms(flux_fit,sum_fit))
@@ -865,6 +808,231 @@ def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
             print 'Coefficient of CBV #%s: %s' %(i+1,coeffs[i])
         print '      -----      '
 
+    return status
+
+def pair_files(infile,outfile,logfile,verbose):
+    """
+    expands infile into a list of input files and pairs each with its output
+    file. A single existing file is taken as it is and wildcard matches are
+    sorted so that runs are repeatable. Output files are named after their
+    input files within an output directory, or listed in the same order as
+    the input files
+    """
+
+    status = 0
+    outfiles = []
+    if kepio.fileexists(infile):
+        infiles = [infile]
+    else:
+        infiles, status = kepio.parselist(infile,logfile,verbose)
+        if infile.count('*') > 0:
+            infiles.sort()
+
+    if status == 0 and os.path.isdir(outfile):
+        outfiles = [os.path.join(outfile,os.path.basename(name)) for name in infiles]
+    elif status == 0 and outfile.count('*') > 0:
+        message = ('ERROR -- KEPCOTREND: outfile cannot be a wildcard, give ' +
+                   'an output directory or a list of output files')
+        status = kepmsg.err(logfile,message,verbose)
+    elif status == 0 and infile.count('*') > 0:
+        message = ('ERROR -- KEPCOTREND: a wildcard infile needs an output ' +
+                   'directory as outfile')
+        status = kepmsg.err(logfile,message,verbose)
+    elif status == 0 and len(infiles) == 1:
+        outfiles = [outfile]
+    elif status == 0:
+        outfiles, status = kepio.parselist(outfile,logfile,verbose)
+    if status == 0 and len(infiles) != len(outfiles):
+        message = ('ERROR -- KEPCOTREND: %d input files but %d output files'
+                   %(len(infiles),len(outfiles)))
+        status = kepmsg.err(logfile,message,verbose)
+    for i in range(len(outfiles)):
+        if status == 0 and os.path.abspath(outfiles[i]) == os.path.abspath(infiles[i]):
+            message = 'ERROR -- KEPCOTREND: output file ' + outfiles[i] + ' is its input file'
+            status = kepmsg.err(logfile,message,verbose)
+
+    return infiles, outfiles, status
+
+def kepcotrendsc(infile,outfile,bvfile,listbv,fitmethod,fitpower,iterate,
+                 sigma,maskfile,scinterp,plot,clobber,verbose,logfile,
+                 status,cmdLine=False):
+    """
+    Setup the kepcotrend environment
+
+    infile:
+    the input file in the FITS format obtained from MAST. Several light
+    curves can be cotrended in one call as a comma-separated list, a
+    wildcard or an @list file. Linear least squares fits of light curves
+    from the same module and output are then solved together
+
+    outfile:
+    the output file. For a list of input files, either a directory, where
+    each output file takes the name of its input file, or a comma-separated
+    or @list of output files in the same order as infile. A wildcard infile
+    needs an output directory.
+    The output will be a fits file in the same style as the input file but
+    with two additional columns: CBVSAP_MODL and CBVSAP_FLUX. The first of
+    these is the best fitting linear combination of basis vectors. The second
+    is the new flux with the basis vector sum subtracted. This is the new flux
+    value.
+
+    plot:
+    either True or False if you want to see a plot of the light curve
+    The top plot shows the original light curve in blue and the sum of basis
+    vectors in red
+    The bottom plot has had the basis vector sum subracted
+
+    bvfile:
+    the name of the FITS file containing the basis vectors
+
+    listbv:
+    the basis vectors to fit to the data
+
+    fitmethod:
+    fit using either the 'llsq' or the 'simplex' method. 'llsq' is usually the
+    correct one to use because as the basis vectors are orthogonal. Simplex
+    gives you option of using a different merit function - ie. you can
+    minimise the least absolute residual instead of the least squares which
+    weights outliers less
+
+    fitpower:
+    if using a simplex you can chose your own power in the metir function
+    - i.e. the merit function minimises abs(Obs - Mod)^P. P=2 is least
+    squares, P = 1 minimises least absolutes
+
+    iterate:
+    should the program fit the basis vectors to the light curve data then
+    remove data points further than 'sigma' from the fit and then refit
+
+    maskfile:
+    this is the name of a mask file which can be used to define regions of the
+    flux time series to exclude from the fit. The easiest way to create this
+    is by using keprange from the PyKE set of tools. You can also make this
+    yourself with two BJDs on each line in the file specifying the beginning
+    and ending date of the region to exclude.
+
+    scinterp:
+    the basis vectors are only calculated for long cadence data, therefore if
+    you want to use short cadence data you have to interpolate the basis
+    vectors. There are several methods to do this, the best of these probably
+    being nearest which picks the value of the nearest long cadence data
+    point.
+    The options available are None|linear|nearest|zero|slinear|quadratic|cubic
+    If you are using short cadence data don't choose none
+    """
+    # log the call
+    hashline = '----------------------------------------------------------------------------'
+    kepmsg.log(logfile,hashline,verbose)
+    call = 'KEPCOTREND -- '
+    call += 'infile='+infile+' '
+    call += 'outfile='+outfile+' '
+    call += 'bvfile='+bvfile+' '
+#       call += 'numpcomp= '+str(numpcomp)+' '
+    call += 'listbv= '+str(listbv)+' '
+    call += 'fitmethod=' +str(fitmethod)+ ' '
+    call += 'fitpower=' + str(fitpower)+ ' '
+    iterateit = 'n'
+    if (iterate): iterateit = 'y'
+    call += 'iterate='+iterateit+ ' '
+    call += 'sigma_clip='+str(sigma)+' '
+    call += 'mask_file='+maskfile+' '
+    call += 'scinterp=' + str(scinterp)+ ' '
+    plotit = 'n'
+    if (plot): plotit = 'y'
+    call += 'plot='+plotit+ ' '
+    overwrite = 'n'
+    if (clobber): overwrite = 'y'
+    call += 'clobber='+overwrite+ ' '
+    chatter = 'n'
+    if (verbose): chatter = 'y'
+    call += 'verbose='+chatter+' '
+    call += 'logfile='+logfile
+    kepmsg.log(logfile,call+'\n',verbose)
+
+    # start time
+    kepmsg.clock('KEPCOTREND started at',logfile,verbose)
+
+    # test log file
+    logfile = kepmsg.test(logfile)
+
+    # input files and the output file paired with each
+    infiles, outfiles, status = pair_files(infile,outfile,logfile,verbose)
+
+    # clobber output files
+    for outfile in outfiles:
+        if status == 0 and clobber:
+            status = kepio.clobber(outfile,logfile,verbose)
+        if status == 0 and kepio.fileexists(outfile):
+            message = 'ERROR -- KEPCOTREND: ' + outfile + ' exists. Use --clobber'
+            status = kepmsg.err(logfile,message,verbose)
+
+    if status == 0:
+        if not kepio.fileexists(bvfile):
+            message = 'ERROR -- KEPCOTREND: ' + bvfile + ' does not exist.'
+            status = kepmsg.err(logfile,message,verbose)
+
+        #lsq_sq - nonlinear least squares fitting and simplex_abs have been
+        #removed from the options in PyRAF but they are still in the code!
+    if status == 0:
+        if fitmethod not in ['llsq','matrix','lst_sq','simplex_abs','simplex']:
+            message = 'Fit method must either: llsq, matrix, lst_sq or simplex'
+            status = kepmsg.err(logfile,message,verbose)
+
+    if status == 0:
+        if not is_numlike(fitpower) and fitpower is not None:
+            message = 'Fit power must be an real number or None'
+            status = kepmsg.err(logfile,message,verbose)
+
+
+
+    if status == 0:
+        if fitpower is None:
+            fitpower = 1.
+
+    if status == 0:
+        #get a list of basis vectors to use from the list given
+        #accept different seperators
+        listbv = listbv.strip()
+        if listbv[1] in [' ',',',':',';','|',', ']:
+            separator = str(listbv)[1]
+        else:
+            message = ('You must separate your basis vector numbers to use ' +
+                       'with \' \' \',\' \':\' \';\' or \'|\' and the '
+                       'first basis vector to use must be between 1 and 9')
+            status = kepmsg.err(logfile,message,verbose)
+
+
+    if status == 0:
+        bvlist = np.fromstring(listbv,dtype=int,sep=separator)
+        if bvlist[0] == 0:
+            message = 'Must use at least one basis vector'
+            status = kepmsg.err(logfile,message,verbose)
+
+    if status == 0:
+        if iterate and sigma is None:
+            message = 'If fitting iteratively you must specify a clipping range'
+            status = kepmsg.err(logfile,message,verbose)
+
+    # read every light curve, basis vectors are stored once per mod.out
+    # and set of cadences
+    targets = []
+    bases = {}
+    for infile in infiles:
+        if status == 0:
+            target, status = read_target(infile,bvfile,bvlist,maskfile,
+                                         scinterp,bases,logfile,verbose)
+            targets.append(target)
+
+    # fit the basis vectors
+    if status == 0:
+        fit_targets(targets,bases,fitmethod,fitpower,iterate,sigma)
+
+    # write the cotrended light curves
+    for i in range(len(targets)):
+        if status == 0:
+            status = write_target(targets[i],bases,outfiles[i],iterate,plot,
+                                  logfile,verbose,cmdLine)
+
     # end time
     if status == 0:
         message = 'KEPCOTREND completed at'
@@ -883,8 +1051,8 @@ if '--shell' in sys.argv:
                                                   'vectors'))
     parser.add_argument('--shell', action='store_true',
                         help='Are we running from the shell?')
-    parser.add_argument('infile', help='Name of input file', type=str)
-    parser.add_argument('outfile', help='Name of FITS file to output',
+    parser.add_argument('infile', help='Name of input file or list of input files', type=str)
+    parser.add_argument('outfile', help='Name of FITS file to output, or output directory or list of FITS files',
                         type=str)
     parser.add_argument('cbvfile', help='Name of file containing the CBVs',
                         type=str)
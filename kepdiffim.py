@@ -61,29 +61,17 @@ def kepdiffim(infile,outfile,plotfile,imscale,colmap,filter,function,cutoff,
 # open TPF FITS file
 
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, barytime, status = \
-            kepio.readTPF(infile,'TIME',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, tcorr, status = \
-            kepio.readTPF(infile,'TIMECORR',logfile,verbose)
+        tpf, status = kepio.openTPF(infile,logfile,verbose)
     if status == 0:
         kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cadno, status = \
-            kepio.readTPF(infile,'CADENCENO',logfile,verbose)
+            ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+        barytime, status = tpf.readcol('TIME',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, fluxpixels, status = \
-            kepio.readTPF(infile,'FLUX',logfile,verbose)
+        fluxpixels, status = tpf.readcol('FLUX',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, errpixels, status = \
-            kepio.readTPF(infile,'FLUX_ERR',logfile,verbose)
+        errpixels, status = tpf.readcol('FLUX_ERR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, qual, status = \
-            kepio.readTPF(infile,'QUALITY',logfile,verbose)
+        qual, status = tpf.readcol('QUALITY',logfile,verbose)
 
 # read mask defintion data from TPF file
 
@@ -105,47 +93,30 @@ def kepdiffim(infile,outfile,plotfile,imscale,colmap,filter,function,cutoff,
         print '     Output:     %1s' % output
         print ''
 
-# how many quality = 0 rows?
+# quality = 0 rows with finite time and central pixel flux
 
     if status == 0:
-        npts = 0
-        nrows = len(fluxpixels)
-        for i in range(nrows):
-            if qual[i] == 0 and np.isfinite(barytime[i]) \
-                    and np.isfinite(fluxpixels[i,int(ydim*xdim/2)]):
-                npts += 1
-        time = np.empty((npts))
-        timecorr = np.empty((npts))
-        cadenceno = np.empty((npts))
-        quality = np.empty((npts))
-        pixseries = np.empty((ydim*xdim,npts))
-        errseries = np.empty((ydim*xdim,npts))
+        good = (qual == 0) & np.isfinite(barytime) & \
+            np.isfinite(fluxpixels[:,int(ydim*xdim/2)])
+        npts = good.sum()
 
-# construct output light curves
+# construct output light curves, only needed in memory when filtering
 
-    if status == 0:
-        nptsx = 0
-        for i in range(ydim*xdim):
-            npts = 0
-            for k in range(nrows):
-                if (qual[k] == 0 and
-                    np.isfinite(barytime[k]) and
-                    np.isfinite(fluxpixels[k,int(ydim*xdim/2)])):
-                    time[npts] = barytime[k]
-                    timecorr[npts] = tcorr[k]
-                    cadenceno[npts] = cadno[k]
-                    quality[npts] = qual[k]
-                    pixseries[i,npts] = fluxpixels[k,nptsx]
-                    errseries[i,npts] = errpixels[k,nptsx]
-                    npts += 1
-            nptsx += 1
+    if status == 0 and filter:
+        pixseries = np.empty((ydim*xdim,npts))
+        errseries = np.empty((ydim*xdim,npts))
+        npts = 0
+        for i1, i2, (fluxblk, errblk, goodblk) in \
+                kepio.cadenceblocks([fluxpixels,errpixels,good]):
+            n = goodblk.sum()
+            pixseries[:,npts:npts+n] = fluxblk[goodblk].T
+            errseries[:,npts:npts+n] = errblk[goodblk].T
+            npts += n
 
 # define data sampling
 
     if status == 0 and filter:
-        tpf, status = kepio.openfits(infile,'readonly',logfile,verbose)
-    if status == 0 and filter:
-        cadence, status = kepkey.cadence(tpf[1],infile,logfile,verbose)
+        cadence, status = kepkey.cadence(tpf.struct[1],infile,logfile,verbose)
         tr = 1.0 / (cadence / 86400)
         timescale = 1.0 / (cutoff / tr)
 
@@ -194,44 +165,38 @@ def kepdiffim(infile,outfile,plotfile,imscale,colmap,filter,function,cutoff,
                 outmedian = np.median(outdata)
                 pixseries[i,:] = pixseries[i,:] - outdata + outmedian
 
+# stream the cadences, filtered or straight from the TPF
+
+    if status == 0:
+        if filter:
+            columns = [pixseries.T, errseries.T, np.ones(npts,dtype='bool')]
+        else:
+            columns = [fluxpixels, errpixels, good]
+
 # sum pixels over cadence
 
     if status == 0:
         nptsx = 0
-        nrows = len(fluxpixels)
         pixsum = np.zeros((ydim*xdim))
         errsum = np.zeros((ydim*xdim))
-        for i in range(npts):
-            if quality[i] == 0:
-                pixsum += pixseries[:,i]
-                errsum += errseries[:,i]**2
-                nptsx += 1
+        for i1, i2, (fluxblk, errblk, goodblk) in kepio.cadenceblocks(columns):
+            pixsum += np.sum(fluxblk[goodblk],axis=0,dtype='float64')
+            errsum += np.sum(np.array(errblk[goodblk],dtype='float64')**2,axis=0)
+            nptsx += goodblk.sum()
         pixsum /= nptsx
         errsum = np.sqrt(errsum) / nptsx
 
-# calculate standard deviation pixels
+# calculate standard deviation pixels and chi distribution pixels
 
     if status == 0:
         pixvar = np.zeros((ydim*xdim))
-        for i in range(npts):
-            if quality[i] == 0:
-                pixvar += (pixsum - pixseries[:,i] / errseries[:,i])**2
-        pixvar = np.sqrt(pixvar)
-
-# median pixel errors
-
-    if status == 0:
-        errmed = np.empty((ydim*xdim))
-        for i in range(ydim*xdim):
-            errmed[i] = np.median(errseries[:,i])
-
-# calculate chi distribution pixels
-
-    if status == 0:
         pixdev = np.zeros((ydim*xdim))
-        for i in range(npts):
-            if quality[i] == 0:
-                pixdev += ((pixsum - pixseries[:,i]) / pixsum)**2
+        for i1, i2, (fluxblk, errblk, goodblk) in kepio.cadenceblocks(columns):
+            work1 = np.array(fluxblk[goodblk],dtype='float64')
+            work2 = np.array(errblk[goodblk],dtype='float64')
+            pixvar += np.sum((pixsum - work1 / work2)**2,axis=0)
+            pixdev += np.sum(((pixsum - work1) / pixsum)**2,axis=0)
+        pixvar = np.sqrt(pixvar)
         pixdev = np.sqrt(pixdev)
 
 # image scale and intensity limits
@@ -264,7 +229,7 @@ def kepdiffim(infile,outfile,plotfile,imscale,colmap,filter,function,cutoff,
 # construct output file
 
     if status == 0:
-        instruct, status = kepio.openfits(infile,'readonly',logfile,verbose)
+        instruct = tpf.struct
         status = kepkey.history(call,instruct[0],outfile,logfile,verbose)
         hdulist = pyfits.HDUList(instruct[0])
         hdulist.writeto(outfile)
@@ -1,11 +1,81 @@
 import sys, time, math, re
+import multiprocessing
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
 import numpy as np
 import kepio, kepmsg, kepkey, kepfit, kepstat, kepfourier, keplab
 
+# -----------------------------------------------------------
+# FT power of time slices x[i1[k]:i2[k]] transformed one at a time, each
+# with its median removed. With nproc > 1 the slices are transformed by a
+# pool of nproc worker processes sharing the time series. nproc = 0 uses
+# every available core
+
+def ftslices(x,y,i1,i2,fmin,fmax,deltaf,ftmethod,nproc=1):
+
+    nslice = len(i1)
+    fr = np.array(np.arange(fmin,fmax,deltaf),dtype='float32')
+    dynam = np.empty((nslice,len(fr)),dtype='float32')
+    if nproc < 1:
+        nproc = multiprocessing.cpu_count()
+    if nproc == 1 or nslice < 2:
+        for i in range(nslice):
+            dynam[i] = ftslice(x,y,i1[i],i2[i],fmin,fmax,deltaf,ftmethod)
+    else:
+        shared = []
+        for work in [x, y]:
+            array = multiprocessing.RawArray('d',len(work))
+            np.frombuffer(array,dtype='float64')[:] = work
+            shared.append(array)
+        slices = [(i,i1[i],i2[i],fmin,fmax,deltaf,ftmethod) for i in range(nslice)]
+        pool = multiprocessing.Pool(nproc,initializer=ftinit,initargs=shared)
+        try:
+            for i, power in pool.imap_unordered(ftchunk,slices):
+                dynam[i] = power
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    return fr, dynam
+
+# -----------------------------------------------------------
+# FT power of one time slice with its median removed
+
+def ftslice(x,y,i1,i2,fmin,fmax,deltaf,ftmethod):
+
+    x = x[i1:i2]
+    y = y[i1:i2] - np.median(y[i1:i2])
+    fr, power = kepfourier.ft(x,y,fmin,fmax,deltaf,False,ftmethod)
+
+    return power
+
+# -----------------------------------------------------------
+# time series shared read-only by the FT worker processes
+
+ftdata = {}
+
+def ftinit(x,y):
+
+    ftdata['x'] = np.frombuffer(x,dtype='float64')
+    ftdata['y'] = np.frombuffer(y,dtype='float64')
+
+# -----------------------------------------------------------
+# FT power of one time slice within a worker
+
+def ftchunk(args):
+
+    i, i1, i2, fmin, fmax, deltaf, ftmethod = args
+
+    return i, ftslice(ftdata['x'],ftdata['y'],i1,i2,fmin,fmax,deltaf,ftmethod)
+
+# -----------------------------------------------------------
+# dynamic power spectrum task
+
 def kepdynamic(infile, outfile, fcol, pmin, pmax, nfreq, deltat, nslice,
-               plot, plotscale, cmap, clobber, verbose, logfile, status,
+               ftmethod, nproc, plot, plotscale, cmap, clobber, verbose, logfile, status,
                cmdLine=False):
 
 # startup parameters
@@ -34,6 +104,8 @@ def kepdynamic(infile, outfile, fcol, pmin, pmax, nfreq, deltat, nslice,
     call += 'nfreq='+str(nfreq)+' '
     call += 'deltat='+str(deltat)+' '
     call += 'nslice='+str(nslice)+' '
+    call += 'ftmethod='+ftmethod+' '
+    call += 'nproc='+str(nproc)+' '
     plotit = 'n'
     if (plot): plotit = 'y'
     call += 'plot='+plotit+ ' '
@@ -121,42 +193,28 @@ def kepdynamic(infile, outfile, fcol, pmin, pmax, nfreq, deltat, nslice,
 # determine bounds of time slices
 
     if status == 0:
-        t1 = []; t2 = []
         dt = barytime[-1] - barytime[0]
         dt -= deltat
         if dt < 0:
             message = 'ERROR -- KEPDYNAMIC: time slices are larger than data range'
             status = kepmsg.err(logfile,message,verbose)
-        ds = dt / (nslice - 1)
-        for i in range(nslice):
-            t1.append(barytime[0] + ds * float(i))
-            t2.append(barytime[0] + deltat + ds * float(i))
+        ds = dt / max(nslice - 1,1)
+        t1 = barytime[0] + ds * np.arange(nslice)
+        t2 = barytime[0] + deltat + ds * np.arange(nslice)
+        i1 = np.searchsorted(barytime,t1,'left')
+        i2 = np.searchsorted(barytime,t2,'right')
 
-# loop through time slices
+# FT power of every time slice. Overlapping slices share the prefix sums of
+# the direct method, otherwise slices are transformed independently
 
     if status == 0:
-        dynam = []
+        signal = np.array(signal,dtype='float64')
+        if ftmethod == 'direct' and (ds < deltat or nproc == 1):
+            fr, dynam = kepfourier.ft_slices(barytime,signal,i1,i2,fmin,fmax,deltaf)
+        else:
+            fr, dynam = ftslices(barytime,signal,i1,i2,fmin,fmax,deltaf,ftmethod,nproc)
         for i in range(nslice):
-            x = []; y = []
-            for j in range(len(barytime)):
-                if (barytime[j] >= t1[i] and barytime[j] <= t2[i]):
-                    x.append(barytime[j])
-                    y.append(signal[j])
-            x = np.array(x,dtype='float64')
-            y = np.array(y,dtype='float')
-            y = y - np.median(y)
-
-# determine FT power
-
-            fr, power = kepfourier.ft(x,y,fmin,fmax,deltaf,False)
-            for j in range(len(power)):
-                dynam.append(power[j])
-            print 'Timeslice: %.4f  Pmax: %.2E' % ((t2[i] + t1[i]) / 2, power.max())
-
-# define shape of results array
-
-        dynam = np.array(dynam,dtype='float64')
-        dynam.shape = len(t1),len(power)
+            print 'Timeslice: %.4f  Pmax: %.2E' % ((t2[i] + t1[i]) / 2, dynam[i].max())
 
 # write output file
 
@@ -203,11 +261,8 @@ def kepdynamic(infile, outfile, fcol, pmin, pmax, nfreq, deltat, nslice,
         elif 'logoflog' in plotscale:
             dynam = np.log10(np.abs(np.log10(dynam)))
 #        dynam = -dynam
-        nstat = 2; pixels = []
-        for i in range(dynam.shape[0]):
-            for j in range(dynam.shape[1]):
-                pixels.append(dynam[i,j])
-        pixels = np.array(np.sort(pixels),dtype='float')
+        nstat = 2
+        pixels = np.array(np.sort(dynam,axis=None),dtype='float')
         if int(float(len(pixels)) * 0.1 + 0.5) > nstat:
             nstat = int(float(len(pixels)) * 0.1 + 0.5)
         zmin = np.median(pixels[:nstat])
@@ -262,6 +317,11 @@ if '--shell' in sys.argv:
     parser.add_argument('--nfreq', default=100, help='Number of frequency intervals', type=int)
     parser.add_argument('--deltat', default=10., help='Length of time slice [days]',type=float)
     parser.add_argument('--nslice', default=10., help='Number of time slices', type=int)
+    parser.add_argument('--ftmethod', default='direct', help='Fourier transform method', type=str,
+                        choices=['direct','nufft','loop'])
+    parser.add_argument('--nproc', default=1,
+                        help='Number of processes transforming time slices (0 = all cores)',
+                        type=int)
 
     parser.add_argument('--plot', action='store_true', help='Plot result?')
     parser.add_argument('--plotscale', default='logarithmic', help='type of image intensity scale',
@@ -280,8 +340,8 @@ if '--shell' in sys.argv:
 
     cmdLine=True
 
-    kepynamic(args.infile, args.outfile, args.fcol, args.pmin, args.pmax, args.nfreq, args.deltat, args.nslice,
-          args.plot,args.plotscale,args.cmap,args.clobber,args.verbose,args.logfile,args.status,cmdLine)
+    kepdynamic(args.infile, args.outfile, args.fcol, args.pmin, args.pmax, args.nfreq, args.deltat, args.nslice,
+          args.ftmethod,args.nproc,args.plot,args.plotscale,args.cmap,args.clobber,args.verbose,args.logfile,args.status,cmdLine)
 
 else:
     from pyraf import iraf
@@ -42,18 +42,32 @@ def kepextract(infile,maskfile,outfile,subback,clobber,verbose,logfile,status):
 
     logfile = kepmsg.test(logfile)
 
-# clobber output file
+# parse mask and output file lists, one output light curve per aperture
 
-    if clobber: status = kepio.clobber(outfile,logfile,verbose)
-    if kepio.fileexists(outfile):
-        message = 'ERROR -- KEPEXTRACT: ' + outfile + ' exists. Use --clobber'
+    outfiles = []
+    maskfiles, status = kepio.parselist(maskfile,logfile,verbose)
+    if status == 0:
+        outfiles, status = kepio.parselist(outfile,logfile,verbose)
+    if status == 0 and len(maskfiles) != len(outfiles):
+        message = ('ERROR -- KEPEXTRACT: %d mask files but %d output files'
+                   %(len(maskfiles),len(outfiles)))
         status = kepmsg.err(logfile,message,verbose)
 
+# clobber output files
+
+    for outfile in outfiles:
+        if status == 0 and clobber:
+            status = kepio.clobber(outfile,logfile,verbose)
+        if status == 0 and kepio.fileexists(outfile):
+            message = 'ERROR -- KEPEXTRACT: ' + outfile + ' exists. Use --clobber'
+            status = kepmsg.err(logfile,message,verbose)
+
 # open input file
 
-    status = 0
-    instr = pyfits.open(infile,mode='readonly',memmap=True)
     if status == 0:
+        tpf, status = kepio.openTPF(infile,logfile,verbose)
+    if status == 0:
+        instr = tpf.struct
         tstart, tstop, bjdref, cadence, status = kepio.timekeys(instr,infile,logfile,verbose,status)
 
 # fudge non-compliant FITS keywords with no values
@@ -74,47 +88,17 @@ def kepextract(infile,maskfile,outfile,subback,clobber,verbose,logfile,status):
 
     if status == 0:
         kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, time, status = \
-            kepio.readTPF(infile,'TIME',logfile,verbose)
+            ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+        time, status = tpf.readcol('TIME',logfile,verbose)
         time = np.array(time,dtype='float64')
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, timecorr, status = \
-            kepio.readTPF(infile,'TIMECORR',logfile,verbose)
+        timecorr, status = tpf.readcol('TIMECORR',logfile,verbose)
         timecorr = np.array(timecorr,dtype='float32')
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cadenceno, status = \
-            kepio.readTPF(infile,'CADENCENO',logfile,verbose)
+        cadenceno, status = tpf.readcol('CADENCENO',logfile,verbose)
         cadenceno = np.array(cadenceno,dtype='int')
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, raw_cnts, status = \
-            kepio.readTPF(infile,'RAW_CNTS',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, flux, status = \
-            kepio.readTPF(infile,'FLUX',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, flux_err, status = \
-            kepio.readTPF(infile,'FLUX_ERR',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, flux_bkg, status = \
-            kepio.readTPF(infile,'FLUX_BKG',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, flux_bkg_err, status = \
-            kepio.readTPF(infile,'FLUX_BKG_ERR',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cosmic_rays, status = \
-            kepio.readTPF(infile,'COSMIC_RAYS',logfile,verbose)
-    if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, quality, status = \
-            kepio.readTPF(infile,'QUALITY',logfile,verbose)
+        quality, status = tpf.readcol('QUALITY',logfile,verbose)
         quality = np.array(quality,dtype='int')
     if status == 0:
         try:
@@ -126,18 +110,166 @@ def kepextract(infile,maskfile,outfile,subback,clobber,verbose,logfile,status):
         except:
             pos_corr2 = np.empty(len(time)); pos_corr2[:] = np.nan   # ---temporary before FITS wave #2
 
-# dummy columns for output file
 
-        psf_centr1 = np.empty(len(time)); psf_centr1[:] = np.nan
-        psf_centr1_err = np.empty(len(time)); psf_centr1_err[:] = np.nan
-        psf_centr2 = np.empty(len(time)); psf_centr2[:] = np.nan
-        psf_centr2_err = np.empty(len(time)); psf_centr2_err[:] = np.nan
-        mom_centr1_err = np.empty(len(time)); mom_centr1_err[:] = np.nan
-        mom_centr2_err = np.empty(len(time)); mom_centr2_err[:] = np.nan
+# subimage physical WCS data
+
+    if status == 0:
+        crpix1p = cards2['CRPIX1P'].value
+        crpix2p = cards2['CRPIX2P'].value
+        crval1p = cards2['CRVAL1P'].value
+        crval2p = cards2['CRVAL2P'].value
+        cdelt1p = cards2['CDELT1P'].value
+        cdelt2p = cards2['CDELT2P'].value
+
+# pixel positions of the subimage, row by row
+
+    if status == 0:
+        jpix, ipix = np.meshgrid(np.arange(maskmap.shape[1]),np.arange(maskmap.shape[0]))
+        aperx = (crval1p + (jpix.ravel() + 1 - crpix1p) * cdelt1p)
+        apery = (crval2p + (ipix.ravel() + 1 - crpix2p) * cdelt2p)
+
+# aperture bitmap of each mask
+
+    if status == 0:
+        apertures = []
+        for mask in maskfiles:
+            if status == 0:
+                aperb, apermap, status = aperture(mask,maskmap,aperx,apery,logfile,verbose)
+            if status == 0:
+                apix = np.where(aperb == 3)[0]
+                apertures.append({'maskmap': apermap,
+                                  'apix': apix,
+                                  'modx': aperx[apix],
+                                  'mody': apery[apix],
+                                  'naper': len(apix)})
+
+# maximum flux over each cadence and all later cadences, used to seed the PSF fits
+
+    if status == 0:
+        ntime = len(time)
+        fluxmax = np.empty(ntime)
+        blocks, status = tpf.readblocks(['FLUX'],logfile,verbose)
+    if status == 0:
+        for i1, i2, (fluxblk,) in blocks:
+            fluxmax[i1:i2] = np.nanmax(fluxblk,axis=1)
+        fluxmax = np.fmax.accumulate(fluxmax[::-1])[::-1]
+
+# stream the pixel data in blocks of cadences, reducing every aperture from each block
+
+    if status == 0:
+        blocks, status = tpf.readblocks(['FLUX','FLUX_ERR','FLUX_BKG','FLUX_BKG_ERR','RAW_CNTS'],
+                                        logfile,verbose)
+    if status == 0:
+        sky = np.zeros(ntime,'float32')
+        for ap in apertures:
+            for name in ['sap_flux','sap_flux_err','sap_bkg','sap_bkg_err','raw_flux']:
+                ap[name] = np.zeros(ntime,'float32')
+            for name in ['mom_centr1','mom_centr2','mom_centr1_err','mom_centr2_err',
+                         'psf_centr1','psf_centr2','psf_centr1_err','psf_centr2_err']:
+                ap[name] = np.zeros(shape=(ntime))
+        for i1, i2, (flux, flux_err, flux_bkg, flux_bkg_err, raw_cnts) in blocks:
+
+# subtract median pixel value for background?
+
+            if subback:
+                sky[i1:i2] = np.median(flux,axis=1)
+            for ap in apertures:
+                apix = ap['apix']
+                modx = ap['modx']
+                mody = ap['mody']
+                naper = ap['naper']
+
+# construct new table flux data
+
+                work1 = np.array(flux[:,apix] - sky[i1:i2,None],'float64')
+                ap['sap_flux'][i1:i2] = work1.sum(axis=1)
+                ap['sap_flux_err'][i1:i2] = kepstat.sumerrs(flux_err[:,apix])
+                ap['sap_bkg'][i1:i2] = np.array(flux_bkg[:,apix],'float64').sum(axis=1)
+                ap['sap_bkg_err'][i1:i2] = kepstat.sumerrs(flux_bkg_err[:,apix])
+                ap['raw_flux'][i1:i2] = np.array(raw_cnts[:,apix],'float64').sum(axis=1)
+
+# construct new table moment data
+
+                xf = modx * flux[:,apix]
+                yf = mody * flux[:,apix]
+                f = np.array(flux[:,apix],'float64')
+                xfe = modx * flux_err[:,apix]
+                yfe = mody * flux_err[:,apix]
+                fe = np.array(flux_err[:,apix],'float64')
+                xfsum = xf.sum(axis=1)
+                yfsum = yf.sum(axis=1)
+                fsum = f.sum(axis=1)
+                xfsume = np.sqrt((xfe * xfe).sum(axis=1) / naper)
+                yfsume = np.sqrt((yfe * yfe).sum(axis=1) / naper)
+                fsume = np.sqrt((fe * fe).sum(axis=1) / naper)
+                mom_centr1 = ap['mom_centr1']
+                mom_centr2 = ap['mom_centr2']
+                mom_centr1[i1:i2] = xfsum / fsum
+                mom_centr2[i1:i2] = yfsum / fsum
+                ap['mom_centr1_err'][i1:i2] = np.sqrt((xfsume / xfsum)**2 + ((fsume / fsum)**2))
+                ap['mom_centr2_err'][i1:i2] = np.sqrt((yfsume / yfsum)**2 + ((fsume / fsum)**2))
+
+                psf_centr1 = ap['psf_centr1']
+                psf_centr2 = ap['psf_centr2']
+                psf_centr1_err = ap['psf_centr1_err']
+                psf_centr2_err = ap['psf_centr2_err']
+                for i in range(i1,i2):
+                    ib = i - i1
+
+# construct new table PSF data
+
+                    modf = np.array(flux[ib,apix],'float64')
+                    guess = [mom_centr1[i], mom_centr2[i], fluxmax[i], 1.0, 1.0, 0.0, 0.0]
+                    args = (modx, mody, modf)
+                    try:
+                        ans = leastsq(kepfunc.PRFgauss2d,guess,args=args,xtol=1.0e-8,ftol=1.0e-4,full_output=True)
+                        s_sq = (ans[2]['fvec']**2).sum() / (ntime-len(guess))
+                        psf_centr1[i] = ans[0][0]
+                        psf_centr2[i] = ans[0][1]
+                    except:
+                        pass
+                    try:
+                        psf_centr1_err[i] = sqrt(diag(ans[1] * s_sq))[0]
+                    except:
+                        psf_centr1_err[i] = np.nan
+                    try:
+                        psf_centr2_err[i] = sqrt(diag(ans[1] * s_sq))[1]
+                    except:
+                        psf_centr2_err[i] = np.nan
+        for ap in apertures:
+            ap['mom_centr1_err'] = ap['mom_centr1_err'] * ap['mom_centr1']
+            ap['mom_centr2_err'] = ap['mom_centr2_err'] * ap['mom_centr2']
+
+# write one output light curve file per aperture
+
+    if status == 0:
+        columns = {'time': time, 'timecorr': timecorr, 'cadenceno': cadenceno,
+                   'quality': quality, 'pos_corr1': pos_corr1, 'pos_corr2': pos_corr2}
+        for outfile, ap in zip(outfiles,apertures):
+            if status == 0:
+                columns.update(ap)
+                status = writeextract(outfile,call,cards0,cards1,cards2,columns,logfile,verbose)
+
+# close input structure
+
+    if status == 0:
+        status = kepio.closefits(instr,logfile,verbose)
+
+# end time
+
+    kepmsg.clock('KEPEXTRACT finished at',logfile,verbose)
+
+# -----------------------------------------------------------
+# aperture bitmap from a mask definition file, the pipeline aperture or all pixels
+
+def aperture(maskfile,maskmap,aperx,apery,logfile,verbose):
+
+    status = 0
+    maskmap = copy(maskmap)
 
 # read mask definition file
 
-    if status == 0 and 'aper' not in maskfile.lower() and maskfile.lower() != 'all':
+    if 'aper' not in maskfile.lower() and maskfile.lower() != 'all':
         maskx = np.array([],'int')
         masky = np.array([],'int')
         lines, status = kepio.openascii(maskfile,'r',logfile,verbose)
@@ -158,78 +290,24 @@ def kepextract(infile,maskfile,outfile,subback,clobber,verbose,logfile,status):
             message = 'ERROR -- KEPEXTRACT: ' + maskfile + ' contains no pixels.'
             status = kepmsg.err(logfile,message,verbose)
 
-# subimage physical WCS data
-
-    if status == 0:
-        crpix1p = cards2['CRPIX1P'].value
-        crpix2p = cards2['CRPIX2P'].value
-        crval1p = cards2['CRVAL1P'].value
-        crval2p = cards2['CRVAL2P'].value
-        cdelt1p = cards2['CDELT1P'].value
-        cdelt2p = cards2['CDELT2P'].value
-
 # define new subimage bitmap...
 
     if status == 0 and 'aper' not in maskfile.lower() and maskfile.lower() != 'all':
-        aperx = np.array([],'int')
-        apery = np.array([],'int')
-        aperb = np.array([],'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperx = np.append(aperx,crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = np.append(apery,crval2p + (i + 1 - crpix2p) * cdelt2p)
-                if maskmap[i,j] == 0:
-                    aperb = np.append(aperb,0)
-                else:
-                    aperb = np.append(aperb,1)
-                    maskmap[i,j] = 1
-                    for k in range(len(maskx)):
-                        if aperx[-1] == maskx[k] and apery[-1] == masky[k]:
-                            aperb[-1] = 3
-                            maskmap[i,j] = 3
-
-# trap case where no aperture needs to be defined but pixel positions are still required for centroiding
-
-    if status == 0 and maskfile.lower() == 'all':
-        aperx = np.array([],'int')
-        apery = np.array([],'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperx = np.append(aperx,crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = np.append(apery,crval2p + (i + 1 - crpix2p) * cdelt2p)
+        inmask = ((aperx[:,None] == maskx[None,:]) & (apery[:,None] == masky[None,:])).any(axis=1)
+        aperb = np.where(maskmap.ravel() == 0,0,np.where(inmask,3,1))
+        maskmap[maskmap != 0] = 1
+        maskmap[inmask.reshape(maskmap.shape) & (maskmap != 0)] = 3
 
 # ...or use old subimage bitmap
 
     if status == 0 and 'aper' in maskfile.lower():
-        aperx = np.array([],'int')
-        apery = np.array([],'int')
-        aperb = np.array([],'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperb = np.append(aperb,maskmap[i,j])
-                aperx = np.append(aperx,crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = np.append(apery,crval2p + (i + 1 - crpix2p) * cdelt2p)
+        aperb = np.array(maskmap.ravel(),'int')
 
 # ...or use all pixels
 
     if status == 0 and maskfile.lower() == 'all':
-        aperb = np.array([],'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                if maskmap[i,j] == 0:
-                    aperb = np.append(aperb,0)
-                else:
-                    aperb = np.append(aperb,3)
-                    maskmap[i,j] = 3
-
-# subtract median pixel value for background?
-
-    if status == 0:
-        sky = np.array([],'float32')
-        for i in range(len(time)):
-            sky = np.append(sky,np.median(flux[i,:]))
-        if not subback:
-            sky[:] = 0.0
+        aperb = np.where(maskmap.ravel() == 0,0,3)
+        maskmap[maskmap != 0] = 3
 
 # legal mask defined?
 
@@ -237,112 +315,37 @@ def kepextract(infile,maskfile,outfile,subback,clobber,verbose,logfile,status):
         if len(aperb) == 0:
             message = 'ERROR -- KEPEXTRACT: no legal pixels within the subimage are defined.'
             status = kepmsg.err(logfile,message,verbose)
+    if status != 0:
+        aperb = np.array([],'int')
 
-# construct new table flux data
+    return aperb, maskmap, status
 
-    if status == 0:
-        naper = (aperb == 3).sum()
-        ntime = len(time)
-        sap_flux = np.array([],'float32')
-        sap_flux_err = np.array([],'float32')
-        sap_bkg = np.array([],'float32')
-        sap_bkg_err = np.array([],'float32')
-        raw_flux = np.array([],'float32')
-        for i in range(len(time)):
-            work1 = np.array([],'float64')
-            work2 = np.array([],'float64')
-            work3 = np.array([],'float64')
-            work4 = np.array([],'float64')
-            work5 = np.array([],'float64')
-            for j in range(len(aperb)):
-                if (aperb[j] == 3):
-                    work1 = np.append(work1,flux[i,j]-sky[i])
-                    work2 = np.append(work2,flux_err[i,j])
-                    work3 = np.append(work3,flux_bkg[i,j])
-                    work4 = np.append(work4,flux_bkg_err[i,j])
-                    work5 = np.append(work5,raw_cnts[i,j])
-            sap_flux = np.append(sap_flux,kepstat.sum(work1))
-            sap_flux_err = np.append(sap_flux_err,kepstat.sumerr(work2))
-            sap_bkg = np.append(sap_bkg,kepstat.sum(work3))
-            sap_bkg_err = np.append(sap_bkg_err,kepstat.sumerr(work4))
-            raw_flux = np.append(raw_flux,kepstat.sum(work5))
+# -----------------------------------------------------------
+# write an extracted light curve and its aperture bitmap to a FITS file
 
-# construct new table moment data
+def writeextract(outfile,call,cards0,cards1,cards2,columns,logfile,verbose):
 
-    if status == 0:
-        mom_centr1 = np.zeros(shape=(ntime))
-        mom_centr2 = np.zeros(shape=(ntime))
-        mom_centr1_err = np.zeros(shape=(ntime))
-        mom_centr2_err = np.zeros(shape=(ntime))
-        for i in range(ntime):
-            xf = np.zeros(shape=(naper))
-            yf = np.zeros(shape=(naper))
-            f = np.zeros(shape=(naper))
-            xfe = np.zeros(shape=(naper))
-            yfe = np.zeros(shape=(naper))
-            fe = np.zeros(shape=(naper))
-            k = -1
-            for j in range(len(aperb)):
-                if (aperb[j] == 3):
-                    k += 1
-                    xf[k] = aperx[j] * flux[i,j]
-                    xfe[k] = aperx[j] * flux_err[i,j]
-                    yf[k] = apery[j] * flux[i,j]
-                    yfe[k] = apery[j] * flux_err[i,j]
-                    f[k] = flux[i,j]
-                    fe[k] = flux_err[i,j]
-            xfsum = kepstat.sum(xf)
-            yfsum = kepstat.sum(yf)
-            fsum = kepstat.sum(f)
-            xfsume = math.sqrt(kepstat.sum(xfe * xfe) / naper)
-            yfsume = math.sqrt(kepstat.sum(yfe * yfe) / naper)
-            fsume = math.sqrt(kepstat.sum(fe * fe) / naper)
-            mom_centr1[i] = xfsum / fsum
-            mom_centr2[i] = yfsum / fsum
-            mom_centr1_err[i] = math.sqrt((xfsume / xfsum)**2 + ((fsume / fsum)**2))
-            mom_centr2_err[i] = math.sqrt((yfsume / yfsum)**2 + ((fsume / fsum)**2))
-        mom_centr1_err = mom_centr1_err * mom_centr1
-        mom_centr2_err = mom_centr2_err * mom_centr2
-
-# construct new table PSF data
-
-    if status == 0:
-        psf_centr1 = np.zeros(shape=(ntime))
-        psf_centr2 = np.zeros(shape=(ntime))
-        psf_centr1_err = np.zeros(shape=(ntime))
-        psf_centr2_err = np.zeros(shape=(ntime))
-        modx = np.zeros(shape=(naper))
-        mody = np.zeros(shape=(naper))
-        k = -1
-        for j in range(len(aperb)):
-            if (aperb[j] == 3):
-                k += 1
-                modx[k] = aperx[j]
-                mody[k] = apery[j]
-        for i in range(ntime):
-            modf = np.zeros(shape=(naper))
-            k = -1
-            guess = [mom_centr1[i], mom_centr2[i], np.nanmax(flux[i:]), 1.0, 1.0, 0.0, 0.0]
-            for j in range(len(aperb)):
-                if (aperb[j] == 3):
-                    k += 1
-                    modf[k] = flux[i,j]
-                    args = (modx, mody, modf)
-            try:
-                ans = leastsq(kepfunc.PRFgauss2d,guess,args=args,xtol=1.0e-8,ftol=1.0e-4,full_output=True)
-                s_sq = (ans[2]['fvec']**2).sum() / (ntime-len(guess))
-                psf_centr1[i] = ans[0][0]
-                psf_centr2[i] = ans[0][1]
-            except:
-                pass
-            try:
-                psf_centr1_err[i] = sqrt(diag(ans[1] * s_sq))[0]
-            except:
-                psf_centr1_err[i] = np.nan
-            try:
-                psf_centr2_err[i] = sqrt(diag(ans[1] * s_sq))[1]
-            except:
-                psf_centr2_err[i] = np.nan
+    status = 0
+    time = columns['time']
+    timecorr = columns['timecorr']
+    cadenceno = columns['cadenceno']
+    quality = columns['quality']
+    pos_corr1 = columns['pos_corr1']
+    pos_corr2 = columns['pos_corr2']
+    sap_flux = columns['sap_flux']
+    sap_flux_err = columns['sap_flux_err']
+    sap_bkg = columns['sap_bkg']
+    sap_bkg_err = columns['sap_bkg_err']
+    raw_flux = columns['raw_flux']
+    psf_centr1 = columns['psf_centr1']
+    psf_centr1_err = columns['psf_centr1_err']
+    psf_centr2 = columns['psf_centr2']
+    psf_centr2_err = columns['psf_centr2_err']
+    mom_centr1 = columns['mom_centr1']
+    mom_centr1_err = columns['mom_centr1_err']
+    mom_centr2 = columns['mom_centr2']
+    mom_centr2_err = columns['mom_centr2_err']
+    maskmap = columns['maskmap']
 
 # construct output primary extension
 
@@ -474,14 +477,7 @@ def kepextract(infile,maskfile,outfile,subback,clobber,verbose,logfile,status):
     if status == 0:
         outstr.writeto(outfile,checksum=True)
 
-# close input structure
-
-    if status == 0:
-        status = kepio.closefits(instr,logfile,verbose)
-
-# end time
-
-    kepmsg.clock('KEPEXTRACT finished at',logfile,verbose)
+    return status
 
 # main
 
@@ -492,8 +488,10 @@ if '--shell' in sys.argv:
         'Derive a light curve from a target pixel file, with user-defined apertures')
     parser.add_argument('--shell', action='store_true', help='Are we running from the shell?')
     parser.add_argument('infile', help='Name of input target pixel file', type=str)
-    parser.add_argument('maskfile', help='Name of mask defintion ASCII file', type=str)
-    parser.add_argument('outfile', help='Name of output light curve FITS file', type=str)
+    parser.add_argument('maskfile', help='Comma-separated list or @list of mask definition ASCII files, aper or all',
+                        type=str)
+    parser.add_argument('outfile', help='Comma-separated list or @list of output light curve FITS files, one per mask',
+                        type=str)
     parser.add_argument('--background', action='store_true', help='Subtract background from data?')
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?')
     parser.add_argument('--verbose', action='store_true', help='Write to a log file?')
@@ -8,15 +8,18 @@ from scipy.ndimage.interpolation import shift
 from keparray import rebin2D
 
 # -----------------------------------------------------------
-# linear least square polynomial fit using scipy
+# polynomial function types that are linear in their coefficients. Value is
+# the polynomial order, poly1con fits a constant offset to y - x
 
-def leastsquare(functype,pinit,xdata,ydata,yerr,logfile,verbose):
+LINEARFUNCS = {'poly0': 0, 'poly1': 1, 'poly2': 2, 'poly3': 3, 'poly4': 4,
+               'poly5': 5, 'poly6': 6, 'poly7': 7, 'poly8': 8, 'poly1con': 0}
 
-    status = 0
-    coeffs = []
+# -----------------------------------------------------------
+# function form for a leastsquare function type
 
-# functional form
+def fitfunction(functype):
 
+    fitfunc = None
     if (functype == 'poly0'): fitfunc = kepfunc.poly0()
     if (functype == 'poly1'): fitfunc = kepfunc.poly1()
     if (functype == 'poly2'): fitfunc = kepfunc.poly2()
@@ -33,6 +36,69 @@ def leastsquare(functype,pinit,xdata,ydata,yerr,logfile,verbose):
     if (functype == 'sine'): fitfunc = kepfunc.sine()
     if (functype == 'moffat0'): fitfunc = kepfunc.moffat0()
     if (functype == 'conmoffat'): fitfunc = kepfunc.conmoffat()
+    return fitfunc
+
+# -----------------------------------------------------------
+# weighted linear least square solution for the polynomial function types.
+# Returns the coefficients and covariance matrix in the same form as
+# optimize.leastsq with full_output, i.e. a scalar coefficient for
+# single-parameter fits and covar = None for a singular design matrix.
+# Abscissae are scaled to [-1,1] before the QR decomposition to keep the
+# Vandermonde matrix well-conditioned
+
+def linearleastsq(functype,xdata,ydata,yerr):
+
+    order = LINEARFUNCS[functype]
+    x = np.asarray(xdata,dtype='float64')
+    y = np.asarray(ydata,dtype='float64')
+    w = 1.0 / np.asarray(yerr,dtype='float64')
+    if functype == 'poly1con':
+        y = y - x
+    scale = np.abs(x).max()
+    if not scale > 0.0: scale = 1.0
+    A = np.vander(x / scale,order+1,increasing=True) * w[:,None]
+    b = y * w
+    pscale = scale ** -np.arange(order+1.0)
+    q, r = np.linalg.qr(A)
+    rdiag = np.abs(np.diag(r))
+    if rdiag.min() > rdiag.max() * 1e-12:
+        p = np.linalg.solve(r,np.dot(q.T,b))
+        rinv = np.linalg.inv(r)
+        covar = np.dot(rinv,rinv.T) * np.outer(pscale,pscale)
+    else:
+        p = np.linalg.lstsq(A,b,rcond=-1)[0]
+        covar = None
+    p *= pscale
+    if order == 0:
+        p = p[0]
+    return p, covar
+
+# -----------------------------------------------------------
+# fit points for plotting, 10000 samples over the data range
+
+def fitcurve(functype,coeffs,xdata):
+
+    plotx = np.linspace(xdata.min(),xdata.max(),10000)
+    if (len(coeffs) == 1):
+        ploty = np.zeros(len(plotx)) + coeffs[0]
+    else:
+        ploty = fitfunction(functype)(coeffs,plotx)
+    return plotx, ploty
+
+# -----------------------------------------------------------
+# linear least square polynomial fit using scipy
+
+def leastsquare(functype,pinit,xdata,ydata,yerr,logfile,verbose,plot=True):
+
+    status = 0
+    coeffs = []
+
+# functional form
+
+    fitfunc = fitfunction(functype)
+    linear = functype in LINEARFUNCS
+    xdata = np.asarray(xdata)
+    ydata = np.asarray(ydata)
 
 # define error coefficent calculation
 
@@ -41,41 +107,52 @@ def leastsquare(functype,pinit,xdata,ydata,yerr,logfile,verbose):
 # if no data errors, substitude rms of fit
 
     if yerr is None:
-        yerr = []
-        rerr = []
-        for i in range(len(ydata)):
-            rerr.append(1.e10)
+        rerr = np.zeros(len(ydata)) + 1.e10
         try:
-            out = optimize.leastsq(errfunc,pinit,args=(xdata,ydata,rerr),full_output=1)
+            if linear:
+                out = linearleastsq(functype,xdata,ydata,rerr)
+            else:
+                out = optimize.leastsq(errfunc,pinit,args=(xdata,ydata,rerr),full_output=1)
         except:
             message = 'ERROR -- KEPFIT.LEASTSQUARE: failed to fit data'
             status = kepmsg.err(logfile,message,verbose)
             if functype == 'poly0':
                 out = [np.mean(ydata),math.sqrt(np.mean(ydata))]
-        if (functype == 'poly0' or functype == 'sineCompareBinPSF'):
+        if (functype == 'poly0' or functype == 'poly1con' or
+            functype == 'sineCompareBinPSF'):
             coeffs.append(out[0])
         else:
             coeffs = out[0]
         if (len(coeffs) > 1):
             fit = fitfunc(coeffs,xdata)
         else:
-            fit = np.zeros(len(xdata))
-            for i in range(len(fit)):
-                fit[i] = coeffs[0]
+            fit = np.zeros(len(xdata)) + coeffs[0]
         sigma, status = kepstat.rms(ydata,fit,logfile,verbose)
-        for i in range(len(ydata)):
-            yerr.append(sigma)
+        yerr = np.zeros(len(ydata)) + sigma
 
 # fit data
 
     try:
-        out = optimize.leastsq(errfunc, pinit, args=(xdata, ydata, yerr), full_output=1)
+        if linear:
+            out = linearleastsq(functype,xdata,ydata,yerr)
+        else:
+            out = optimize.leastsq(errfunc, pinit, args=(xdata, ydata, yerr), full_output=1)
     except:
         message = 'ERROR -- KEPFIT.LEASTSQUARE: failed to fit data'
         status = kepmsg.err(logfile,message,verbose)
         if functype == 'poly0':
             out = [np.mean(ydata),math.sqrt(np.mean(ydata))]
 
+    return fitresult(functype,out,xdata,ydata,yerr,logfile,verbose,plot)
+
+# -----------------------------------------------------------
+# coefficients, errors, rms, reduced chi^2 and plotting points of a
+# leastsquare solution out = (coefficients, covariance matrix)
+
+def fitresult(functype,out,xdata,ydata,yerr,logfile,verbose,plot):
+
+    fitfunc = fitfunction(functype)
+
 # define coefficients
 
     coeffs = []
@@ -105,51 +182,66 @@ def leastsquare(functype,pinit,xdata,ydata,yerr,logfile,verbose):
     if (len(coeffs) > 1):
         fit = fitfunc(coeffs,xdata)
     else:
-        fit = np.zeros(len(xdata))
-        for i in range(len(fit)):
-            fit[i] = coeffs[0]
+        fit = np.zeros(len(xdata)) + coeffs[0]
     sigma, status = kepstat.rms(ydata,fit,logfile,verbose)
 
 # generate fit points for plotting
 
-    dx = xdata[len(xdata)-1] - xdata[0]
-    plotx = np.linspace(xdata.min(),xdata.max(),10000)
-    ploty = fitfunc(coeffs,plotx)
-    if (len(coeffs) == 1):
-        ploty = []
-        for i in range(len(plotx)):
-            ploty.append(coeffs[0])
-        ploty = np.array(ploty)
+    plotx = None; ploty = None
+    if plot:
+        plotx, ploty = fitcurve(functype,coeffs,xdata)
 
 # reduced chi^2 calculation
 
-    chi2 = 0
     dof = len(ydata) - len(coeffs)
-    for i in range(len(ydata)):
-        chi2 += (ydata[i] - fit[i])**2 / yerr[i]
-    chi2 /= dof
+    chi2 = np.sum((ydata - fit)**2 / np.asarray(yerr)) / dof
 
     return coeffs, errors, covar, sigma, chi2, dof, fit, plotx, ploty, status
 
 # -----------------------------------------------------------
-# linear least square fit with sigma-clipping
+# solution of the normal equations alpha p = beta of a linear function type,
+# accumulated over the abscissae scaled by 1/pscale[1]. Returns the same
+# tuple as leastsquare, or None if the normal matrix is too poorly
+# conditioned, in which case the caller should fall back to leastsquare
 
-def lsqclip(functype,pinit,x,y,yerr,rej_lo,rej_hi,niter,logfile,verbose):
+def normalfit(functype,alpha,beta,pscale,xdata,ydata,yerr,logfile,verbose):
 
-# functype = unctional form
-# pinit = initial guess for parameters
-# x = list of x data
-# y = list of y data
-# yerr = list of 1-sigma y errors
-# order = polynomial order
-# rej_lo = lower rejection threshold (units=sigma)
-# rej_hi = upper rejection threshold (units=sugma)
-# niter = number of sigma-clipping iterations
+    if not np.linalg.cond(alpha) < 1.0e10:
+        return None
+    cinv = np.linalg.inv(alpha)
+    p = np.dot(cinv,beta) * pscale
+    covar = cinv * np.outer(pscale,pscale)
+    if LINEARFUNCS[functype] == 0:
+        p = p[0]
+
+# if no data errors, the fit is unweighted and the covariance scales with
+# the rms of the fit
+
+    if yerr is None:
+        if LINEARFUNCS[functype] > 0:
+            fit = fitfunction(functype)(p,xdata)
+        else:
+            fit = np.zeros(len(xdata)) + p
+        sigma, status = kepstat.rms(ydata,fit,logfile,verbose)
+        covar = covar * sigma**2
+        yerr = np.zeros(len(ydata)) + sigma
+    return fitresult(functype,(p,covar),xdata,ydata,yerr,logfile,verbose,False)
+
+# -----------------------------------------------------------
+# linear least square fit with sigma-clipping over a boolean mask of the
+# data. Returns the lsqclip fit together with the mask of points used in the
+# final fit and the mask of points that passed the final sigma-clipping test.
+# For the polynomial function types the normal equations are downdated for
+# the rejected points rather than refit from scratch
+
+def lsqclipmask(functype,pinit,x,y,yerr,rej_lo,rej_hi,niter,logfile,verbose):
 
-    npts = []
     iiter = 0
-    iterstatus = 1
     status = 0
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if yerr is not None:
+        yerr = np.asarray(yerr)
 
 # error catching
 
@@ -160,34 +252,84 @@ def lsqclip(functype,pinit,x,y,yerr,rej_lo,rej_hi,niter,logfile,verbose):
     if (len(x) < len(pinit)):
         kepmsg.warn(logfile,'WARNING -- KEPFIT.LSQCLIP: no degrees of freedom')
 
-
-# sigma-clipping iterations
-
-    while (iiter < niter and len(x) > len(pinit) and iterstatus > 0):
-        iterstatus = 0
-        tmpx = []
-        tmpy = []
-        tmpyerr = []
-        npts.append(len(x))
-        coeffs,errors,covar,sigma,chi2,dof,fit,plotx,ploty,status = \
-            leastsquare(functype,pinit,x,y,yerr,logfile,verbose)
+# normal equations of the polynomial function types
+
+    linear = functype in LINEARFUNCS and len(x) > 0
+    if linear:
+        order = LINEARFUNCS[functype]
+        xscale = np.abs(x).max()
+        if not xscale > 0.0: xscale = 1.0
+        pscale = xscale ** -np.arange(order+1.0)
+        design = np.vander(x / xscale,order+1,increasing=True)
+        ylin = np.array(y,dtype='float64')
+        if functype == 'poly1con':
+            ylin = ylin - x
+        if yerr is None:
+            weight = np.ones(len(y))
+        else:
+            weight = 1.0 / np.asarray(yerr,dtype='float64')**2
+        alpha = np.dot(design.T * weight,design)
+        beta = np.dot(design.T * weight,ylin)
+
+# sigma-clipping iterations, until no more points are rejected
+
+    mask = np.ones(len(x),dtype='bool')
+    used = mask
+    changed = True
+    while (iiter < niter and mask.sum() > len(pinit) and changed):
+        used = mask
+        xfit = x[used]
+        yfit = y[used]
+        efit = None
+        if yerr is not None: efit = yerr[used]
+        result = None
+        if linear:
+            result = normalfit(functype,alpha,beta,pscale,xfit,yfit,efit,logfile,verbose)
+        if result is None:
+            result = leastsquare(functype,pinit,xfit,yfit,efit,logfile,verbose,False)
+        coeffs,errors,covar,sigma,chi2,dof,fit,plotx,ploty,status = result
         pinit = coeffs
 
 # point-by-point sigma-clipping test
 
-        for ix in range(npts[iiter]):
-            if (y[ix] - fit[ix] < rej_hi * sigma and
-                fit[ix] - y[ix] < rej_lo * sigma):
-                tmpx.append(x[ix])
-                tmpy.append(y[ix])
-                if (yerr is not None): tmpyerr.append(yerr[ix])
-            else:
-                iterstatus = 1
-        x = np.array(tmpx)
-        y = np.array(tmpy)
-        if (yerr is not None): yerr = np.array(tmpyerr)
+        resid = yfit - fit
+        keep = (resid < rej_hi * sigma) & (-resid < rej_lo * sigma)
+        changed = not keep.all()
+        mask = used.copy()
+        mask[used] = keep
+        if linear and changed:
+            out = used & ~mask
+            alpha = alpha - np.dot(design[out].T * weight[out],design[out])
+            beta = beta - np.dot(design[out].T * weight[out],ylin[out])
         iiter += 1
 
+    return coeffs, errors, covar, iiter, sigma, chi2, dof, fit, used, mask, status
+
+# -----------------------------------------------------------
+# linear least square fit with sigma-clipping
+
+def lsqclip(functype,pinit,x,y,yerr,rej_lo,rej_hi,niter,logfile,verbose,plot=True):
+
+# functype = unctional form
+# pinit = initial guess for parameters
+# x = list of x data
+# y = list of y data
+# yerr = list of 1-sigma y errors
+# order = polynomial order
+# rej_lo = lower rejection threshold (units=sigma)
+# rej_hi = upper rejection threshold (units=sugma)
+# niter = number of sigma-clipping iterations
+# plot = generate fit points for plotting
+
+    coeffs, errors, covar, iiter, sigma, chi2, dof, fit, used, mask, status = \
+        lsqclipmask(functype,pinit,x,y,yerr,rej_lo,rej_hi,niter,logfile,verbose)
+
+# generate fit points for plotting from the final iteration
+
+    plotx = None; ploty = None
+    if plot:
+        plotx, ploty = fitcurve(functype,coeffs,np.asarray(x)[used])
+
 # coeffs = best fit coefficients
 # covar = covariance matrix
 # iiter = number of sigma clipping iteration before convergence
@@ -195,6 +337,96 @@ def lsqclip(functype,pinit,x,y,yerr,rej_lo,rej_hi,niter,logfile,verbose):
     return coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status
 
 
+# -----------------------------------------------------------
+# sigma-clipped polynomial fits over many cadence windows [cstep1,cstep2] of
+# a time series, the batched equivalent of lsqclip on each window. Windows
+# are sorted by length and solved in batches of normal equations, each
+# window's time axis scaled to its length. Yields for every batch the window
+# numbers, their cadence index and validity arrays, the fit at each window
+# cadence, the final rms, whether the window could be fit and the cadences
+# that passed the final sigma-clipping test. Windows with no degrees of
+# freedom or a singular fit are not fit
+
+WINBATCH = 2**18
+
+def lsqclipwin(x,y,cstep1,cstep2,npoly,rej_lo,rej_hi,niter):
+
+    ndata = len(y)
+    npar = npoly + 1
+    cstep1 = np.array(cstep1,dtype='int')
+    cstep2 = np.array(cstep2,dtype='int')
+    length = cstep2 - cstep1 + 1
+    order = np.argsort(length,kind='mergesort')
+    w1 = 0
+    while w1 < len(order):
+        nbatch = max(WINBATCH // max(length[order[min(w1 + WINBATCH,len(order)) - 1]],1),1)
+        wins = order[w1:w1+nbatch]
+        w1 += nbatch
+        c1 = cstep1[wins]
+        nwin = len(wins)
+        nlen = length[wins]
+        lmax = nlen.max()
+
+# window cadences, padded to the longest window in the batch
+
+        valid = np.arange(lmax) < nlen[:,None]
+        index = np.minimum(c1[:,None] + np.arange(lmax),ndata - 1)
+        xw = x[index] - x[c1][:,None]
+        yw = np.array(y[index],dtype='float64')
+        scale = xw[np.arange(nwin),nlen-1]
+        scale[scale <= 0.0] = 1.0
+        basis = (xw / scale[:,None])[:,:,None] ** np.arange(npar)
+
+# normal equations, downdated for the rejected cadences in each
+# sigma-clipping iteration. Windows drop out as they converge
+
+        fit = np.zeros((nwin,lmax))
+        sigma = np.zeros((nwin))
+        active = nlen > npar
+        fitted = active.copy()
+        mask = valid & active[:,None]
+        vw = basis * mask[:,:,None]
+        alpha = np.einsum('wlp,wlq->wpq',vw,basis)
+        beta = np.einsum('wlp,wl->wp',vw,yw)
+        iiter = 0
+        while iiter < niter and active.any():
+            win = np.where(active)[0]
+            a = alpha[win]
+            b = beta[win]
+            try:
+                coeffs = np.linalg.solve(a,b[:,:,None])[:,:,0]
+            except np.linalg.LinAlgError:
+                coeffs = np.zeros(b.shape)
+                for k in range(len(win)):
+                    try:
+                        coeffs[k] = np.linalg.solve(a[k],b[k])
+                    except np.linalg.LinAlgError:
+                        coeffs[k] = np.nan
+            bad = ~np.isfinite(coeffs).all(axis=1)
+            if bad.any():
+                fitted[win[bad]] = False
+                active[win[bad]] = False
+                win = win[~bad]
+                coeffs = coeffs[~bad]
+            model = np.einsum('wlp,wp->wl',basis[win],coeffs)
+            resid = yw[win] - model
+            npts = mask[win].sum(axis=1)
+            sig = np.sqrt(np.sum(np.where(mask[win],resid**2,0.0),axis=1) / npts)
+            keep = mask[win] & (resid < rej_hi * sig[:,None]) & (-resid < rej_lo * sig[:,None])
+            fit[win] = model
+            sigma[win] = sig
+            active[win] = (keep != mask[win]).any(axis=1) & (keep.sum(axis=1) > npar)
+            wr, lr = np.nonzero(mask[win] & ~keep)
+            if len(wr) > 0:
+                vr = basis[win[wr],lr]
+                np.subtract.at(alpha,win[wr],vr[:,:,None] * vr[:,None,:])
+                np.subtract.at(beta,win[wr],vr * yw[win[wr],lr][:,None])
+            mask[win] = keep
+            iiter += 1
+
+        yield wins, index, valid, fit, sigma, fitted, mask
+
+
 # linear least square polynomial fit with sigma-clipping
 # -----------------------------------------------------------
 
@@ -207,38 +439,29 @@ def poly(x,y,order,rej_lo,rej_hi,niter):
 # rej_hi = upper rejection threshold (units=sugma)
 # niter = number of sigma-clipping iterations
 
-    npts = []
     iiter = 0
     iterstatus = 1
+    x = np.asarray(x)
+    y = np.asarray(y)
+    mask = np.ones(len(x),dtype='bool')
 
 # sigma-clipping iterations
 
     while (iiter < niter and iterstatus > 0):
         iterstatus = 0
-        tmpx = []
-        tmpy = []
-        npts.append(len(x))
-        coeffs = np.polyfit(x,y,order)
-        fit = np.polyval(coeffs,x)
+        coeffs = np.polyfit(x[mask],y[mask],order)
+        resid = y[mask] - np.polyval(coeffs,x[mask])
 
 # calculate sigma of fit
 
-        sig = 0
-        for ix in range(npts[iiter]):
-            sig = sig + (y[ix] - fit[ix])**2
-        sig = math.sqrt(sig / (npts[iiter] - 1))
+        sig = math.sqrt(np.sum(resid**2) / (len(resid) - 1))
 
 # point-by-point sigma-clipping test
 
-        for ix in range(npts[iiter]):
-            if (y[ix] - fit[ix] < rej_hi * sig and
-                fit[ix] - y[ix] < rej_lo * sig):
-                tmpx.append(x[ix])
-                tmpy.append(y[ix])
-            else:
-                iterstatus = 1
-        x = tmpx
-        y = tmpy
+        keep = (resid < rej_hi * sig) & (-resid < rej_lo * sig)
+        if not keep.all():
+            iterstatus = 1
+        mask[mask] = keep
         iiter += 1
 
 # coeffs = best fit coefficients
@@ -765,6 +988,73 @@ def fitFocusMultiPRF(flux,ydim,xdim,column,row,prfn,crval1p,crval2p,cdelt1p,cdel
     return f, y, x, b, w, prfMod, prfFit, prfRes
 
 
+# -----------------------------------------------------------
+# Levenberg-Marquardt fit of the spline PRF model to pixel data, using the
+# analytic model Jacobian. Alternative to minimizing kepfunc.PRF,
+# PRFwithBackground, PRFwithFocus or PRFwithFocusAndBackground with
+# fmin_powell, same parameters and same (weighted) objective. A fit whose
+# first source leaves the box those objectives keep it centered in is
+# rejected and redone with fmin_powell
+
+def fitPRFlsq(guess,DATx,DATy,DATimg,DATerr,nsrc,border,bx,by,splineInterpolation,
+              focus,background,xtol,ftol,col,row):
+
+# weights, only the plain PRF objective is unweighted
+
+    weight = np.ones(np.shape(DATimg))
+    if focus or background:
+        weight = 1.0 / np.asarray(DATerr,dtype='float64')
+    good = np.isfinite(DATimg) & np.isfinite(weight)
+    data = np.asarray(DATimg,dtype='float64')[good]
+    weight = weight[good]
+
+# residual and Jacobian over the finite pixels
+
+    def residual(params):
+        model = kepfunc.PRFmodel(params,DATx,DATy,nsrc,border,bx,by,splineInterpolation,
+                                 focus,background)
+        return (data - model[good]) * weight
+
+    def jacobian(params):
+        model, derivs = kepfunc.PRFmodel(params,DATx,DATy,nsrc,border,bx,by,splineInterpolation,
+                                         focus,background,True)
+        return -derivs[:,good] * weight
+
+    out = leastsq(residual,np.array(guess,dtype='float64'),Dfun=jacobian,col_deriv=1,
+                  xtol=xtol,ftol=ftol,full_output=1)
+    ans = out[0]
+    niter = out[2]['njev']
+    nfev = out[2]['nfev']
+
+# keep the fit centered, same limits as the fmin_powell objectives
+
+    limit = 10.0
+    if background and not focus:
+        limit = 5.0
+    if max(abs(col - ans[nsrc]),abs(row - ans[nsrc*2])) > limit:
+        message = 'WARNING -- KEPFIT.FITPRFLSQ: fit moved more than %d pixels ' % limit
+        message += 'from the guess, refitting with fmin_powell'
+        kepmsg.warn(None,message)
+        if background:
+            args = (DATx,DATy,DATimg,DATerr,nsrc,border,bx,by,splineInterpolation,col,row)
+        else:
+            args = (DATx,DATy,DATimg,DATerr,nsrc,splineInterpolation,col,row)
+        if focus and background:
+            func = kepfunc.PRFwithFocusAndBackground
+        elif focus:
+            func = kepfunc.PRFwithFocus
+        elif background:
+            func = kepfunc.PRFwithBackground
+        else:
+            func = kepfunc.PRF
+        out = fmin_powell(func,guess,args=args,xtol=xtol,ftol=ftol,disp=False,full_output=True)
+        ans = out[0]
+        niter += out[3]
+        nfev += out[4]
+
+    return ans, niter, nfev
+
+
 
 # Fit multi-PRF model to Kepler pixel mask data
 # -----------------------------------------------------------
@@ -5,6 +5,41 @@ import matplotlib.pyplot as plt
 from copy import copy
 import kepio, kepmsg, kepkey, kepfit, kepstat
 
+# -----------------------------------------------------------
+# sigma-clipped polynomial fits over the cadence windows [cstep1,cstep2],
+# accumulated into running sums at each cadence so memory scales with the
+# data, not data x windows
+
+def flattenfit(intime,indata,cstep1,cstep2,npoly,nsig,niter):
+
+    ndata = len(indata)
+    fitsum = np.zeros((ndata))
+    sigsum = np.zeros((ndata))
+    nfit = np.zeros((ndata))
+    failed = []
+    for wins, index, valid, fit, sigma, fitted, clipmask in \
+            kepfit.lsqclipwin(intime,indata,cstep1,cstep2,npoly,nsig,nsig,niter):
+
+# windows too short to fit are left out, failed fits count as zero
+
+        short = valid.sum(axis=1) <= npoly + 1
+        bad = ~fitted & ~short
+        failed.extend(wins[bad])
+        fit[bad] = 0.0
+        sigma[bad] = 1.0e-10
+        use = valid & ~short[:,None]
+        cadence = index[use]
+        fitsum += np.bincount(cadence,weights=fit[use],minlength=ndata)
+        sigsum += np.bincount(cadence,weights=np.repeat(sigma,valid.shape[1]).reshape(valid.shape)[use],
+                              minlength=ndata)
+        nfit += np.bincount(cadence,minlength=ndata)
+
+    return fitsum, sigsum, nfit, sorted(failed)
+
+# -----------------------------------------------------------
+# core code
+
+
 def kepflatten(infile,outfile,datacol,errcol,nsig,stepsize,winsize,npoly,
                niter,ranges,plot,clobber,verbose,logfile,status,
                cmdLine=False):
@@ -130,7 +165,9 @@ def kepflatten(infile,outfile,datacol,errcol,nsig,stepsize,winsize,npoly,
 
     if status == 0:
         t1, t2, status = kepio.timeranges(ranges,logfile,verbose)
-        cadencelis, status = kepstat.filterOnRange(intime,t1,t2)
+        inrange = np.zeros((len(intime)),dtype='bool')
+        for i in range(len(t1)):
+            inrange |= (intime > t1[i]) & (intime < t2[i])
 
 # find limits of each time step
 
@@ -145,14 +182,14 @@ def kepflatten(infile,outfile,datacol,errcol,nsig,stepsize,winsize,npoly,
 # find cadence limits of each time step
 
     if status == 0:
-        cstep1 = []; cstep2 = []
-        for n in range(len(tstep1)):
-            for i in range(len(intime)-1):
-                if intime[i] <= tstep1[n] and intime[i+1] > tstep1[n]:
-                    for j in range(i,len(intime)-1):
-                        if intime[j] < tstep2[n] and intime[j+1] >= tstep2[n]:
-                            cstep1.append(i)
-                            cstep2.append(j+1)
+        tstep1 = np.array(tstep1,dtype='float64')
+        tstep2 = np.array(tstep2,dtype='float64')
+        cstep1 = np.searchsorted(intime,tstep1,side='right') - 1
+        cstep2 = np.searchsorted(intime,tstep2,side='left')
+        legal = (cstep1 >= 0) & (cstep1 < len(intime) - 1) & \
+            (cstep2 > cstep1) & (cstep2 < len(intime))
+        cstep1 = cstep1[legal]
+        cstep2 = cstep2[legal]
 
 # comment keyword in output file
 
@@ -233,46 +270,17 @@ def kepflatten(infile,outfile,datacol,errcol,nsig,stepsize,winsize,npoly,
 # loop over each time step, fit data, determine rms
 
     if status == 0:
-        fitarray = np.zeros((len(indata),len(cstep1)),dtype='float32')
-        sigarray = np.zeros((len(indata),len(cstep1)),dtype='float32')
-        fitarray[:,:] = np.nan
-        sigarray[:,:] = np.nan
-        masterfit = indata * 0.0
-        mastersigma = np.zeros(len(masterfit))
-        functype = 'poly' + str(npoly)
-        for i in range(len(cstep1)):
-            timeSeries = intime[cstep1[i]:cstep2[i]+1]-intime[cstep1[i]]
-            dataSeries = indata[cstep1[i]:cstep2[i]+1]
-            fitTimeSeries = np.array([],dtype='float32')
-            fitDataSeries = np.array([],dtype='float32')
-            pinit = [dataSeries.mean()]
-            if npoly > 0:
-                for j in range(npoly):
-                    pinit.append(0.0)
-            pinit = np.array(pinit,dtype='float32')
-            try:
-                if len(fitarray[cstep1[i]:cstep2[i]+1,i]) > len(pinit):
-                    coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
-                        kepfit.lsqclip(functype,pinit,timeSeries,dataSeries,None,nsig,nsig,niter,
-                                       logfile,verbose)
-                    fitarray[cstep1[i]:cstep2[i]+1,i] = 0.0
-                    sigarray[cstep1[i]:cstep2[i]+1,i] = sigma
-                    for j in range(len(coeffs)):
-                        fitarray[cstep1[i]:cstep2[i]+1,i] += coeffs[j] * timeSeries**j
-            except:
-                for j in range(cstep1[i],cstep2[i]+1):
-                    fitarray[cstep1[i]:cstep2[i]+1,i] = 0.0
-                    sigarray[cstep1[i]:cstep2[i]+1,i] = 1.0e-10
-                message  = 'WARNING -- KEPFLATTEN: could not fit range '
-                message += str(intime[cstep1[i]]) + '-' + str(intime[cstep2[i]])
-                kepmsg.warn(None,message)
+        fitsum, sigsum, nfit, failed = flattenfit(intime,indata,cstep1,cstep2,npoly,nsig,niter)
+        for i in failed:
+            message  = 'WARNING -- KEPFLATTEN: could not fit range '
+            message += str(intime[cstep1[i]]) + '-' + str(intime[cstep2[i]])
+            kepmsg.warn(None,message)
 
 # find mean fit for each timestamp
 
     if status == 0:
-        for i in range(len(indata)):
-            masterfit[i] = np.nanmean(fitarray[i,:])
-            mastersigma[i] = np.nanmean(sigarray[i,:])
+        masterfit = np.where(nfit > 0,fitsum / np.maximum(nfit,1),np.nan)
+        mastersigma = np.where(nfit > 0,sigsum / np.maximum(nfit,1),np.nan)
         masterfit[-1] = masterfit[-4] #fudge
         masterfit[-2] = masterfit[-4] #fudge
         masterfit[-3] = masterfit[-4] #fudge
@@ -281,13 +289,9 @@ def kepflatten(infile,outfile,datacol,errcol,nsig,stepsize,winsize,npoly,
 # reject outliers
 
     if status == 0:
-        rejtime = []; rejdata = []; naxis2 = 0
-        for i in range(len(masterfit)):
-            if abs(indata[i] - masterfit[i]) > nsig * mastersigma[i] and i in cadencelis:
-                rejtime.append(intime[i])
-                rejdata.append(indata[i])
-        rejtime = np.array(rejtime,dtype='float64')
-        rejdata = np.array(rejdata,dtype='float32')
+        rejected = (np.abs(indata - masterfit) > nsig * mastersigma) & inrange
+        rejtime = np.array(intime[rejected],dtype='float64')
+        rejdata = np.array(indata[rejected],dtype='float32')
         if plot:
             plt.plot(rejtime-intime0,rejdata / 10**nrm,'ro')
 
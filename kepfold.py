@@ -4,7 +4,7 @@ from copy import copy
 from scipy import stats
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
-import kepio, kepmsg, kepkey, kepstat, kepfit
+import kepio, kepmsg, kepkey, kepstat
 
 def kepfold(infile,outfile,period,phasezero,bindata,binmethod,threshold,niter,nbins,
             rejqual,plottype,plotlab,clobber,verbose,logfile,status,cmdLine=False):
@@ -146,7 +146,6 @@ def kepfold(infile,outfile,period,phasezero,bindata,binmethod,threshold,niter,nb
 
 # filter out NaNs and quality > 0
 
-    work1 = []; work2 = []; work3 = []; work4 = []; work5 = []; work6 = []; work8 = []; work9 = []
     if status == 0:
         if 'sap' in plottype:
             datacol = copy(sap)
@@ -160,164 +159,52 @@ def kepfold(infile,outfile,period,phasezero,bindata,binmethod,threshold,niter,nb
         if 'det' in plottype:
             datacol = copy(det)
             errcol = copy(deterr)
-        for i in range(len(barytime)):
-            if (np.isfinite(barytime[i]) and
-                np.isfinite(datacol[i]) and datacol[i] != 0.0 and
-                np.isfinite(errcol[i]) and errcol[i] > 0.0):
-                if rejqual and quality[i] == 0:
-                    work1.append(barytime[i])
-                    work2.append(sap[i])
-                    work3.append(saperr[i])
-                    work4.append(pdc[i])
-                    work5.append(pdcerr[i])
-                    work6.append(cbv[i])
-                    work8.append(det[i])
-                    work9.append(deterr[i])
-                elif not rejqual:
-                    work1.append(barytime[i])
-                    work2.append(sap[i])
-                    work3.append(saperr[i])
-                    work4.append(pdc[i])
-                    work5.append(pdcerr[i])
-                    work6.append(cbv[i])
-                    work8.append(det[i])
-                    work9.append(deterr[i])
-        barytime = np.array(work1,dtype='float64')
-        sap = np.array(work2,dtype='float32') / cadenom
-        saperr = np.array(work3,dtype='float32') / cadenom
-        pdc = np.array(work4,dtype='float32') / cadenom
-        pdcerr = np.array(work5,dtype='float32') / cadenom
-        cbv = np.array(work6,dtype='float32') / cadenom
-        det = np.array(work8,dtype='float32') / cadenom
-        deterr = np.array(work9,dtype='float32') / cadenom
+        good = (np.isfinite(barytime) &
+                np.isfinite(datacol) & (datacol != 0.0) &
+                np.isfinite(errcol) & (errcol > 0.0))
+        if rejqual:
+            good &= quality == 0
+        barytime = np.array(barytime[good],dtype='float64')
+        sap = np.array(sap[good],dtype='float32') / cadenom
+        saperr = np.array(saperr[good],dtype='float32') / cadenom
+        pdc = np.array(pdc[good],dtype='float32') / cadenom
+        pdcerr = np.array(pdcerr[good],dtype='float32') / cadenom
+        cbv = np.array(cbv[good],dtype='float32') / cadenom
+        det = np.array(det[good],dtype='float32') / cadenom
+        deterr = np.array(deterr[good],dtype='float32') / cadenom
 
 # calculate phase
 
     if status == 0:
         if phasezero < bjdref:
             phasezero += bjdref
-        date1 = (barytime1 + bjdref - phasezero)
-        phase1 = (date1 / period) - np.floor(date1/period)
-        date2 = (barytime + bjdref - phasezero)
-        phase2 = (date2 / period) - np.floor(date2/period)
+        phase1 = kepstat.foldphase(barytime1 + bjdref,period,phasezero)
+        phase2 = kepstat.foldphase(barytime + bjdref,period,phasezero)
         phase2 = np.array(phase2,'float32')
 
 # sort phases
 
     if status == 0:
-        ptuple = []
-        phase3 = [];
-        sap3 = []; saperr3 = []
-        pdc3 = []; pdcerr3 = []
-        cbv3 = []; cbverr3 = []
-        det3 = []; deterr3 = []
-        for i in range(len(phase2)):
-            ptuple.append([phase2[i], sap[i], saperr[i], pdc[i], pdcerr[i], cbv[i], saperr[i], det[i], deterr[i]])
-        phsort = sorted(ptuple,key=lambda ph: ph[0])
-        for i in range(len(phsort)):
-            phase3.append(phsort[i][0])
-            sap3.append(phsort[i][1])
-            saperr3.append(phsort[i][2])
-            pdc3.append(phsort[i][3])
-            pdcerr3.append(phsort[i][4])
-            cbv3.append(phsort[i][5])
-            cbverr3.append(phsort[i][6])
-            det3.append(phsort[i][7])
-            deterr3.append(phsort[i][8])
-        phase3 = np.array(phase3,'float32')
-        sap3 = np.array(sap3,'float32')
-        saperr3 = np.array(saperr3,'float32')
-        pdc3 = np.array(pdc3,'float32')
-        pdcerr3 = np.array(pdcerr3,'float32')
-        cbv3 = np.array(cbv3,'float32')
-        cbverr3 = np.array(cbverr3,'float32')
-        det3 = np.array(det3,'float32')
-        deterr3 = np.array(deterr3,'float32')
+        order = np.argsort(phase2,kind='mergesort')
+        phase3 = phase2[order]
+        sap3 = np.array(sap[order],'float32')
+        saperr3 = np.array(saperr[order],'float32')
+        pdc3 = np.array(pdc[order],'float32')
+        pdcerr3 = np.array(pdcerr[order],'float32')
+        cbv3 = np.array(cbv[order],'float32')
+        cbverr3 = np.array(saperr[order],'float32')
+        det3 = np.array(det[order],'float32')
+        deterr3 = np.array(deterr[order],'float32')
 
 # bin phases
 
     if status == 0 and bindata:
-        work1 = np.array([sap3[0]],'float32')
-        work2 = np.array([saperr3[0]],'float32')
-        work3 = np.array([pdc3[0]],'float32')
-        work4 = np.array([pdcerr3[0]],'float32')
-        work5 = np.array([cbv3[0]],'float32')
-        work6 = np.array([cbverr3[0]],'float32')
-        work7 = np.array([det3[0]],'float32')
-        work8 = np.array([deterr3[0]],'float32')
-        phase4 = np.array([],'float32')
-        sap4 = np.array([],'float32')
-        saperr4 = np.array([],'float32')
-        pdc4 = np.array([],'float32')
-        pdcerr4 = np.array([],'float32')
-        cbv4 = np.array([],'float32')
-        cbverr4 = np.array([],'float32')
-        det4 = np.array([],'float32')
-        deterr4 = np.array([],'float32')
-        dt = 1.0 / nbins
-        nb = 0.0
-        rng = np.append(phase3,phase3[0]+1.0)
-        for i in range(len(rng)):
-            if rng[i] < nb * dt or rng[i] >= (nb + 1.0) * dt:
-                if len(work1) > 0:
-                    phase4 = np.append(phase4,(nb + 0.5) * dt)
-                    if (binmethod == 'mean'):
-                        sap4 = np.append(sap4,kepstat.mean(work1))
-                        saperr4 = np.append(saperr4,kepstat.mean_err(work2))
-                        pdc4 = np.append(pdc4,kepstat.mean(work3))
-                        pdcerr4 = np.append(pdcerr4,kepstat.mean_err(work4))
-                        cbv4 = np.append(cbv4,kepstat.mean(work5))
-                        cbverr4 = np.append(cbverr4,kepstat.mean_err(work6))
-                        det4 = np.append(det4,kepstat.mean(work7))
-                        deterr4 = np.append(deterr4,kepstat.mean_err(work8))
-                    elif (binmethod == 'median'):
-                        sap4 = np.append(sap4,kepstat.median(work1,logfile))
-                        saperr4 = np.append(saperr4,kepstat.mean_err(work2))
-                        pdc4 = np.append(pdc4,kepstat.median(work3,logfile))
-                        pdcerr4 = np.append(pdcerr4,kepstat.mean_err(work4))
-                        cbv4 = np.append(cbv4,kepstat.median(work5,logfile))
-                        cbverr4 = np.append(cbverr4,kepstat.mean_err(work6))
-                        det4 = np.append(det4,kepstat.median(work7,logfile))
-                        deterr4 = np.append(deterr4,kepstat.mean_err(work8))
-                    else:
-                        coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
-                            kepfit.lsqclip('poly0',[nanmean(work1)],arange(0.0,float(len(work1)),1.0),work1,work2,
-                                           threshold,threshold,niter,logfile,False)
-                        sap4 = np.append(sap4,coeffs[0])
-                        saperr4 = np.append(saperr4,kepstat.mean_err(work2))
-                        coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
-                            kepfit.lsqclip('poly0',[nanmean(work3)],arange(0.0,float(len(work3)),1.0),work3,work4,
-                                           threshold,threshold,niter,logfile,False)
-                        pdc4 = np.append(pdc4,coeffs[0])
-                        pdcerr4 = np.append(pdcerr4,kepstat.mean_err(work4))
-                        coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
-                            kepfit.lsqclip('poly0',[nanmean(work5)],arange(0.0,float(len(work5)),1.0),work5,work6,
-                                           threshold,threshold,niter,logfile,False)
-                        cbv4 = np.append(cbv4,coeffs[0])
-                        cbverr4 = np.append(cbverr4,kepstat.mean_err(work6))
-                        coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
-                            kepfit.lsqclip('poly0',[nanmean(work7)],arange(0.0,float(len(work7)),1.0),work7,work8,
-                                           threshold,threshold,niter,logfile,False)
-                        det4 = np.append(det4,coeffs[0])
-                        deterr4 = np.append(deterr4,kepstat.mean_err(work8))
-                work1 = np.array([],'float32')
-                work2 = np.array([],'float32')
-                work3 = np.array([],'float32')
-                work4 = np.array([],'float32')
-                work5 = np.array([],'float32')
-                work6 = np.array([],'float32')
-                work7 = np.array([],'float32')
-                work8 = np.array([],'float32')
-                nb += 1.0
-            else:
-                work1 = np.append(work1,sap3[i])
-                work2 = np.append(work2,saperr3[i])
-                work3 = np.append(work3,pdc3[i])
-                work4 = np.append(work4,pdcerr3[i])
-                work5 = np.append(work5,cbv3[i])
-                work6 = np.append(work6,cbverr3[i])
-                work7 = np.append(work7,det3[i])
-                work8 = np.append(work8,deterr3[i])
+        phase4, data4, err4 = kepstat.binphase(phase3,[sap3,pdc3,cbv3,det3],
+                                               [saperr3,pdcerr3,cbverr3,deterr3],
+                                               nbins,binmethod,threshold,niter)
+        phase4 = np.array(phase4,'float32')
+        sap4, pdc4, cbv4, det4 = np.array(data4,'float32')
+        saperr4, pdcerr4, cbverr4, deterr4 = np.array(err4,'float32')
 
 # update HDU1 for output file
 
@@ -386,9 +273,7 @@ def kepfold(infile,outfile,period,phasezero,bindata,binmethod,threshold,niter,nb
 # clean up x-axis unit
 
     if status == 0:
-        ptime1 = np.array([],'float32')
         ptime2 = np.array([],'float32')
-        pout1 = np.array([],'float32')
         pout2 = np.array([],'float32')
         if bindata:
             work = sap4
@@ -398,16 +283,9 @@ def kepfold(infile,outfile,period,phasezero,bindata,binmethod,threshold,niter,nb
                 work = cbv4
             if plottype == 'det':
                 work = det4
-            for i in range(len(phase4)):
-                if (phase4[i] > 0.5):
-                    ptime2 = np.append(ptime2,phase4[i] - 1.0)
-                    pout2 = np.append(pout2,work[i])
-            ptime2 = np.append(ptime2,phase4)
-            pout2 = np.append(pout2,work)
-            for i in range(len(phase4)):
-                if (phase4[i] <= 0.5):
-                    ptime2 = np.append(ptime2,phase4[i] + 1.0)
-                    pout2 = np.append(pout2,work[i])
+            late = phase4 > 0.5
+            ptime2 = np.concatenate((phase4[late] - 1.0,phase4,phase4[~late] + 1.0))
+            pout2 = np.concatenate((work[late],work,work[~late]))
         work = sap3
         if plottype == 'pdc':
             work = pdc3
@@ -415,16 +293,9 @@ def kepfold(infile,outfile,period,phasezero,bindata,binmethod,threshold,niter,nb
             work = cbv3
         if plottype == 'det':
             work = det3
-        for i in range(len(phase3)):
-            if (phase3[i] > 0.5):
-                ptime1 = np.append(ptime1,phase3[i] - 1.0)
-                pout1 = np.append(pout1,work[i])
-        ptime1 = np.append(ptime1,phase3)
-        pout1 = np.append(pout1,work)
-        for i in range(len(phase3)):
-            if (phase3[i] <= 0.5):
-                ptime1 = np.append(ptime1,phase3[i] + 1.0)
-                pout1 = np.append(pout1,work[i])
+        late = phase3 > 0.5
+        ptime1 = np.concatenate((phase3[late] - 1.0,phase3,phase3[~late] + 1.0))
+        pout1 = np.concatenate((work[late],work,work[~late]))
     xlab = 'Orbital Phase ($\phi$)'
 
 # clean up y-axis units
@@ -2,12 +2,53 @@
 
 import numpy as np
 
+# number of frequency x data elements evaluated per block by the direct method
+
+BLOCKSIZE = 2**22
+
+# number of grid points each datum is extirpolated onto by the nufft method
+
+MACC = 4
+
+# FFT points per cadence of the sampling mask in the grid window method, and
+# the largest departure of the time stamps from the cadence grid it accepts,
+# in cycles of the highest frequency
+
+WINDOWPAD = 32
+WINDOWTOL = 0.01
+
 # -----------------------------------------------------------
 # Fourier Transform
+#
+# method = 'direct' - blocked NumPy evaluation of the direct sums,
+#                     identical to 'loop' to floating point rounding
+#          'nufft'  - Press & Rybicki (1989, ApJ, 338, 277) extirpolation
+#                     onto a regular grid followed by an FFT, O(N log N).
+#                     Power agrees with the direct sums to better than
+#                     1e-4 of the peak power in the spectrum
+#          'loop'   - original pure-Python double loop, kept as a reference
 
-def ft(x,y,f1,f2,df,verbose):
+def ft(x,y,f1,f2,df,verbose,method='direct'):
+
+    if method == 'loop':
+        fr, power = ft_loop(x,y,f1,f2,df)
+    elif method == 'nufft':
+        fr, power = ft_nufft(x,y,f1,f2,df)
+    else:
+        fr, power = ft_direct(x,y,f1,f2,df)
+    if verbose:
+        for i in range(len(fr)):
+            print 'Step: %5d  Period: %10.6f (d)  Power: %e' % \
+                (i + 1, 1.0 / fr[i], power[i])
 
-    ft_real = []; ft_imag = []; power = []; fr = []; nstep = 0
+    return fr, power
+
+# -----------------------------------------------------------
+# Fourier Transform by explicit loop over frequencies and data
+
+def ft_loop(x,y,f1,f2,df):
+
+    ft_real = []; ft_imag = []; power = []; fr = []
     for freq in np.arange(f1,f2,df):
         ft_real.append(0.0)
         ft_imag.append(0.0)
@@ -24,11 +65,212 @@ def ft(x,y,f1,f2,df,verbose):
             power.append((ft_real[-1]**2 + ft_imag[-1]**2) / ndata**2)
         else:
             power.append(np.nan)
-        nstep += 1
-        if verbose:
-            print 'Step: %5d  Period: %10.6f (d)  Power: %e' % \
-                (nstep, 1.0 / fr[-1], power[-1])
     fr = np.array(fr,dtype='float32')
     power = np.array(power,dtype='float32')
 
     return fr, power
+
+# -----------------------------------------------------------
+# Fourier Transform by blocks of frequencies x data matrix products
+
+def ft_direct(x,y,f1,f2,df):
+
+    freq = np.arange(f1,f2,df)
+    x = np.asarray(x,dtype='float64')
+    y = np.asarray(y,dtype='float64')
+    ndata = len(x)
+    power = np.empty(len(freq),dtype='float64')
+    if ndata == 0:
+        power[:] = np.nan
+    else:
+        nblock = max(1,BLOCKSIZE // ndata)
+        for i in range(0,len(freq),nblock):
+            expo = np.outer(2.0 * np.pi * freq[i:i+nblock],x)
+            ft_real = np.dot(np.cos(expo),y)
+            ft_imag = np.dot(np.sin(expo),y)
+            power[i:i+nblock] = (ft_real**2 + ft_imag**2) / ndata**2
+    fr = np.array(freq,dtype='float32')
+    power = np.array(power,dtype='float32')
+
+    return fr, power
+
+# -----------------------------------------------------------
+# Fourier Transform by extirpolation and FFT
+
+def ft_nufft(x,y,f1,f2,df):
+
+    freq = np.arange(f1,f2,df)
+    x = np.asarray(x,dtype='float64')
+    y = np.asarray(y,dtype='float64')
+    ndata = len(x)
+    nfreq = len(freq)
+    if ndata == 0 or nfreq == 0:
+        fr = np.array(freq,dtype='float32')
+        power = np.zeros(nfreq,dtype='float32') + np.nan
+        return fr, power
+
+# the first frequency is applied as a phase rotation of the data, the
+# remaining frequencies are integer multiples of df. One period of df is
+# sampled by a grid of ngrid points so that frequency k is k/ngrid cycles
+# per grid point. |FT| is independent of the time origin, so use x - x[0]
+
+    ngrid = 64
+    while ngrid < 8 * MACC * nfreq:
+        ngrid *= 2
+    t = x - x.min()
+    w = y * np.exp(-2j * np.pi * f1 * t)
+    tau = np.mod(t * df * ngrid,ngrid)
+
+# Lagrange extirpolation of each datum onto its MACC nearest grid points
+
+    n0 = np.floor(tau).astype('int64') - (MACC - 1) // 2
+    nodes = n0[:,None] + np.arange(MACC)[None,:]
+    dist = tau[:,None] - nodes
+    weight = np.ones((ndata,MACC),dtype='float64')
+    for j in range(MACC):
+        for k in range(MACC):
+            if k != j:
+                weight[:,j] *= dist[:,k] / float(j - k)
+    nodes = np.mod(nodes,ngrid).ravel()
+    weight = (weight * w[:,None]).ravel()
+    grid = np.bincount(nodes,weights=weight.real,minlength=ngrid) + \
+        1j * np.bincount(nodes,weights=weight.imag,minlength=ngrid)
+
+# FFT of the grid evaluates sum(w * exp(-2 pi i k tau / ngrid))
+
+    work = np.fft.fft(grid)[:nfreq]
+    fr = np.array(freq,dtype='float32')
+    power = np.array((work.real**2 + work.imag**2) / ndata**2,dtype='float32')
+
+    return fr, power
+
+# -----------------------------------------------------------
+# Fourier Transforms of a set of time slices x[i1[k]:i2[k]] by the direct
+# method, each slice having its median removed. The sums over every slice
+# are differences of prefix sums of the per-datum cosine and sine terms,
+# taken at the slice bounds, so the data are transformed once however
+# much the slices overlap. Returns one row of power per slice
+
+def ft_slices(x,y,i1,i2,f1,f2,df):
+
+    freq = np.arange(f1,f2,df)
+    x = np.asarray(x,dtype='float64')
+    y = np.asarray(y,dtype='float64')
+    i1 = np.asarray(i1,dtype='int64')
+    i2 = np.asarray(i2,dtype='int64')
+    nslice = len(i1)
+    ndata = i2 - i1
+    power = np.zeros((nslice,len(freq)),dtype='float32') + np.nan
+
+# remove the median of the whole series so that the slice medians are small
+# corrections to the prefix sums
+
+    full = ndata > 0
+    if not full.any():
+        return np.array(freq,dtype='float32'), power
+    zero = np.median(y[i1[full].min():i2[full].max()])
+    y = y - zero
+    median = np.zeros(nslice)
+    for k in np.where(full)[0]:
+        median[k] = np.median(y[i1[k]:i2[k]])
+
+# segments of data between consecutive slice bounds
+
+    bounds = np.unique(np.concatenate((i1[full],i2[full])))
+    start = bounds[:-1] - bounds[0]
+    x = x[bounds[0]:bounds[-1]]
+    y = y[bounds[0]:bounds[-1]]
+    k1 = np.searchsorted(bounds,i1[full])
+    k2 = np.searchsorted(bounds,i2[full])
+
+# sums over each segment, prefix sums over segments and slice sums
+
+    nblock = max(1,BLOCKSIZE // len(x))
+    for i in range(0,len(freq),nblock):
+        expo = np.outer(2.0 * np.pi * freq[i:i+nblock],x)
+        c = np.cos(expo)
+        s = np.sin(expo)
+        sums = []
+        for work in [c * y, s * y, c, s]:
+            work = np.cumsum(np.add.reduceat(work,start,axis=1),axis=1)
+            work = np.concatenate((np.zeros((len(work),1)),work),axis=1)
+            sums.append(work[:,k2] - work[:,k1])
+        ft_real = sums[0] - median[full] * sums[2]
+        ft_imag = sums[1] - median[full] * sums[3]
+        power[full,i:i+nblock] = ((ft_real**2 + ft_imag**2) / ndata[full]**2).T
+    fr = np.array(freq,dtype='float32')
+
+    return fr, power
+
+# -----------------------------------------------------------
+# frequency and power of the highest peak in the Fourier Transform of every
+# row of y, the rows sharing the time stamps x. The direct sums of all rows
+# are one matrix product per block of frequencies. The first of equal peaks
+# is taken, as a scan of the ft power would
+
+def ft_peaks(x,y,f1,f2,df):
+
+    freq = np.arange(f1,f2,df)
+    fr = np.array(freq,dtype='float32')
+    x = np.asarray(x,dtype='float64')
+    y = np.atleast_2d(np.asarray(y,dtype='float64'))
+    nrow, ndata = y.shape
+    fpeak = np.zeros(nrow,dtype='float32') + np.nan
+    ppeak = np.zeros(nrow,dtype='float32') + np.nan
+    if ndata == 0 or len(fr) == 0:
+        return fpeak, ppeak
+    ppeak[:] = -np.inf
+    rows = np.arange(nrow)
+    nblock = max(1,BLOCKSIZE // ndata)
+    for i in range(0,len(freq),nblock):
+        expo = np.outer(2.0 * np.pi * freq[i:i+nblock],x)
+        ft_real = np.dot(y,np.cos(expo).T)
+        ft_imag = np.dot(y,np.sin(expo).T)
+        power = np.array((ft_real**2 + ft_imag**2) / ndata**2,dtype='float32')
+        j = np.argmax(power,axis=1)
+        better = power[rows,j] > ppeak
+        ppeak[better] = power[rows,j][better]
+        fpeak[better] = fr[i + j[better]]
+
+    return fpeak, ppeak
+
+# -----------------------------------------------------------
+# spectral window of time stamps x taken on a regular grid of cadence
+# numbers, evaluated by a zero-padded FFT of the sampling mask and linearly
+# interpolated onto frequencies f1 to f2 in steps of df. Power is None if the
+# time stamps depart too far from the cadence grid, when the direct sums
+# of ft over a signal of ones should be used instead
+
+def window_grid(x,cadenceno,f1,f2,df):
+
+    freq = np.arange(f1,f2,df)
+    fr = np.array(freq,dtype='float32')
+    x = np.asarray(x,dtype='float64')
+    k = np.asarray(cadenceno,dtype='int64')
+    ndata = len(x)
+    if ndata < 2 or k.max() == k.min():
+        return fr, None
+
+# cadence interval and timing departures from the grid
+
+    order = np.argsort(k)
+    x = x[order]
+    k = k[order] - k[order[0]]
+    cadence = (x[-1] - x[0]) / k[-1]
+    if np.abs(x - x[0] - k * cadence).max() * max(abs(f1),abs(f2)) > WINDOWTOL:
+        return fr, None
+
+# FFT of the zero-padded sampling mask, symmetric about zero and periodic in
+# the sampling frequency
+
+    ngrid = 64
+    while ngrid < WINDOWPAD * (k[-1] + 1):
+        ngrid *= 2
+    work = np.fft.rfft(np.bincount(k,minlength=ngrid))
+    window = (work.real**2 + work.imag**2) / ndata**2
+    fgrid = np.arange(len(window)) / (ngrid * cadence)
+    fold = np.mod(np.abs(freq),1.0 / cadence)
+    fold = np.minimum(fold,1.0 / cadence - fold)
+    power = np.array(np.interp(fold,fgrid,window),dtype='float32')
+
+    return fr, power
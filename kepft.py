@@ -4,7 +4,7 @@ from matplotlib import pyplot as plt
 from astropy.io import fits as pyfits
 import kepio, kepmsg, kepkey, kepstat, kepfourier
 
-def kepft(infile,outfile,fcol,pmin,pmax,nfreq,plot,clobber,verbose,logfile,status, cmdLine=False):
+def kepft(infile,outfile,fcol,pmin,pmax,nfreq,ftmethod,plot,clobber,verbose,logfile,status, cmdLine=False):
 
 ## startup parameters
 
@@ -29,6 +29,7 @@ def kepft(infile,outfile,fcol,pmin,pmax,nfreq,plot,clobber,verbose,logfile,statu
     call += 'pmin='+str(pmin)+' '
     call += 'pmax='+str(pmax)+' '
     call += 'nfreq='+str(nfreq)+' '
+    call += 'ftmethod='+ftmethod+' '
     plotit = 'n'
     if (plot): plotit = 'y'
     call += 'plot='+plotit+ ' '
@@ -101,7 +102,8 @@ def kepft(infile,outfile,fcol,pmin,pmax,nfreq,plot,clobber,verbose,logfile,statu
 ## loop through frequency steps; determine FT power
 
     if status == 0:
-        fr, power = kepfourier.ft(barytime,signal,fmin,fmax,deltaf,True)
+        fr, power = kepfourier.ft(barytime,signal,fmin,fmax,deltaf,True,
+                                  ftmethod)
 
 ## write output file
 
@@ -183,6 +185,9 @@ if '--shell' in sys.argv:
                         help='Maximum search period [days]', type=float)
     parser.add_argument('--nfreq', default=100,
                         help='Number of frequency intervals', type=int)
+    parser.add_argument('--ftmethod', default='direct',
+                        help='Fourier transform method', type=str,
+                        choices=['direct','nufft','loop'])
     parser.add_argument('--clobber', action='store_true',
                         help='Overwrite output file?')
     parser.add_argument('--verbose', action='store_true',
@@ -194,7 +199,7 @@ if '--shell' in sys.argv:
     args = parser.parse_args()
     cmdLine=True
     kepft(args.infile,args.outfile, args.fcol, args.pmin, args.pmax, args.nfreq,
-        args.plot, args.clobber, args.verbose, args.logfile, args.status, cmdLine)
+        args.ftmethod, args.plot, args.clobber, args.verbose, args.logfile, args.status, cmdLine)
 else:
     from pyraf import iraf
     parfile = iraf.osfn("kepler$kepft.par")
@@ -280,32 +280,59 @@ def PRFgauss2d(params,*args):
     return res
 
 #------------------------------
-# PRF interpolation function
+# where in the pixel is the source position?
 
-def PRF2DET2(flux,OBJx,OBJy,DATx,DATy,splineInterpolation):
+def PRFoffset(OBJx,OBJy):
+
+    FRCx,INTx = modf(OBJx)
+    FRCy,INTy = modf(OBJy)
+    if FRCx > 0.5:
+        FRCx -= 1.0
+        INTx += 1.0
+    if FRCy > 0.5:
+        FRCy -= 1.0
+        INTy += 1.0
+
+    return INTx, INTy, -FRCx, -FRCy
 
-# where in the pixel is the source position?
+
+#------------------------------
+# detector pixel coordinates relative to the integer source position,
+# cached because sources rarely change pixel between fit evaluations
+
+prfgrid = {}
+
+def PRFgrid(DATx,DATy,INTx,INTy):
+
+    DATx = numpy.asarray(DATx,dtype='float64')
+    DATy = numpy.asarray(DATy,dtype='float64')
+    key = (INTx,INTy,DATx.tobytes(),DATy.tobytes())
+    try:
+        grid = prfgrid[key]
+    except KeyError:
+        if len(prfgrid) >= 256:
+            prfgrid.clear()
+        xx = DATx - INTx
+        yy = DATy - INTy
+        XX, YY = numpy.meshgrid(xx,yy)
+        grid = prfgrid[key] = (xx, yy, XX, YY)
+
+    return grid
+
+
+#------------------------------
+# PRF interpolation function, no rotation or scaling
+
+def PRF2DET2(flux,OBJx,OBJy,DATx,DATy,splineInterpolation):
 
     PRFfit = zeros((size(DATy),size(DATx)))
     for i in range(len(flux)):
-        FRCx,INTx = modf(OBJx[i])
-        FRCy,INTy = modf(OBJy[i])
-        if FRCx > 0.5:
-            FRCx -= 1.0
-            INTx += 1.0
-        if FRCy > 0.5:
-            FRCy -= 1.0
-            INTy += 1.0
-        FRCx = -FRCx
-        FRCy = -FRCy
-
-# constuct model PRF in detector coordinates
-
-        for (j,y) in enumerate(DATy):
-            for (k,x) in enumerate(DATx):
-                dy = y - INTy + FRCy
-                dx = x - INTx + FRCx
-                PRFfit[j,k] = PRFfit[j,k] + splineInterpolation(dy,dx) * flux[i]
+        INTx, INTy, FRCx, FRCy = PRFoffset(OBJx[i],OBJy[i])
+        xx, yy, XX, YY = PRFgrid(DATx,DATy,INTx,INTy)
+
+# constuct model PRF in detector coordinates, one spline call per source
+
+        PRFfit += splineInterpolation(yy + FRCy,xx + FRCx) * flux[i]
 
     return PRFfit
 
@@ -320,31 +347,99 @@ def PRF2DET(flux,OBJx,OBJy,DATx,DATy,wx,wy,a,splineInterpolation):
     cosa = cos(radians(a))
     sina = sin(radians(a))
 
-# where in the pixel is the source position?
-
     PRFfit = zeros((size(DATy),size(DATx)))
     for i in range(len(flux)):
-        FRCx,INTx = modf(OBJx[i])
-        FRCy,INTy = modf(OBJy[i])
-        if FRCx > 0.5:
-            FRCx -= 1.0
-            INTx += 1.0
-        if FRCy > 0.5:
-            FRCy -= 1.0
-            INTy += 1.0
-        FRCx = -FRCx
-        FRCy = -FRCy
-
-# constuct model PRF in detector coordinates
-
-        for (j,y) in enumerate(DATy):
-            for (k,x) in enumerate(DATx):
-                xx = x - INTx + FRCx
-                yy = y - INTy + FRCy
-                dx = xx * cosa - yy * sina
-                dy = xx * sina + yy * cosa
-                PRFfit[j,k] += PRFfit[j,k] + splineInterpolation(dy*wy,dx*wx) * flux[i]
+        INTx, INTy, FRCx, FRCy = PRFoffset(OBJx[i],OBJy[i])
+        xx, yy, XX, YY = PRFgrid(DATx,DATy,INTx,INTy)
+
+# constuct model PRF in detector coordinates, one spline call per source.
+# Without rotation the pixel grid stays rectangular and the spline can be
+# evaluated on the grid axes directly
+
+        if a == 0.0 and wx > 0.0 and wy > 0.0:
+            PRFfit += splineInterpolation((yy + FRCy) * wy,(xx + FRCx) * wx) * flux[i]
+        else:
+            XX = XX + FRCx
+            YY = YY + FRCy
+            dx = XX * cosa - YY * sina
+            dy = XX * sina + YY * cosa
+            PRFfit += splineInterpolation.ev((dy * wy).ravel(),
+                                             (dx * wx).ravel()).reshape(PRFfit.shape) * flux[i]
+
+    return PRFfit
+
+
+#------------------------------
+# PRF model and its derivatives with respect to each fit parameter, in the
+# parameter order used by PRF, PRFwithBackground, PRFwithFocus and
+# PRFwithFocusAndBackground
+
+def PRFmodel(params,DATx,DATy,nsrc,border,bx,by,splineInterpolation,focus,background,derivs=False):
 
+# parameters
+
+    params = numpy.asarray(params,dtype='float64')
+    f = params[:nsrc]
+    x = params[nsrc:nsrc*2]
+    y = params[nsrc*2:nsrc*3]
+    bterms = border + 1
+    nback = 0
+    if background:
+        nback = 1
+        if bterms > 1: nback = bterms * 2
+    wx = 1.0; wy = 1.0; a = 0.0
+    if focus:
+        wx = params[-3]
+        wy = params[-2]
+        if background: a = params[-1]
+    cosa = cos(radians(a))
+    sina = sin(radians(a))
+
+# sources
+
+    PRFfit = zeros((size(DATy),size(DATx)))
+    if derivs:
+        PRFder = zeros((len(params),size(DATy),size(DATx)))
+    for i in range(nsrc):
+        INTx, INTy, FRCx, FRCy = PRFoffset(x[i],y[i])
+        xx, yy, XX, YY = PRFgrid(DATx,DATy,INTx,INTy)
+        XX = XX + FRCx
+        YY = YY + FRCy
+        dx = XX * cosa - YY * sina
+        dy = XX * sina + YY * cosa
+        u = (dy * wy).ravel()
+        v = (dx * wx).ravel()
+        prf = splineInterpolation.ev(u,v).reshape(PRFfit.shape)
+        PRFfit += prf * f[i]
+        if derivs:
+            du = splineInterpolation.ev(u,v,dx=1).reshape(PRFfit.shape) * f[i]
+            dv = splineInterpolation.ev(u,v,dy=1).reshape(PRFfit.shape) * f[i]
+            PRFder[i] = prf
+            PRFder[nsrc+i] = -du * wy * sina - dv * wx * cosa
+            PRFder[nsrc*2+i] = -du * wy * cosa + dv * wx * sina
+            if focus:
+                PRFder[-3] += dv * dx
+                PRFder[-2] += du * dy
+                if background:
+                    PRFder[-1] += (du * wy * dx - dv * wx * dy) * numpy.pi / 180.0
+
+# background, linear in its coefficients
+
+    if background:
+        if bterms == 1:
+            PRFfit += params[nsrc*3]
+            if derivs: PRFder[nsrc*3] = 1.0
+        else:
+            b = array([params[nsrc*3:nsrc*3+bterms],params[nsrc*3+bterms:nsrc*3+bterms*2]])
+            PRFfit += polyval2d(bx,by,b)
+            if derivs:
+                for i in range(nback):
+                    b = zeros((nback))
+                    b[i] = 1.0
+                    PRFder[nsrc*3+i] = polyval2d(bx,by,b.reshape((2,bterms)))
+
+    if derivs:
+        return PRFfit, PRFder
     return PRFfit
 
 
@@ -1,9 +1,25 @@
 #!/usr/bin/env python
 import kepmsg, kepkey
-import sys, tempfile, os, shutil, glob, warnings
+import sys, tempfile, os, shutil, glob, warnings, math, collections
 import numpy as np
 from astropy.io import fits as pyfits
 
+# default number of cadences per block when streaming target pixel files
+
+BLOCKSIZE = 1024
+
+# PRF cache: targets per in-process LRU, files in the optional on-disk cache,
+# and the size in pixels of the column and row buckets sharing one
+# interpolated PRF
+
+PRFCACHESIZE = 32
+PRFDISKSIZE = 1024
+PRFBUCKET = 1
+
+# number of CBV mod.outs kept in the in-process cache
+
+CBVCACHESIZE = 16
+
 # -----------------------------------------------------------
 # delete a file
 
@@ -727,9 +743,91 @@ def filterNaN(instr,datacol,outfile,logfile,verbose):
 
 
 # -----------------------------------------------------------
-# read target pixel data file
+# target pixel file opened once, with header keywords parsed once and
+# pixel table columns served on request as memory-mapped views
 
-def readTPF(infile,colname,logfile,verbose):
+class TPF(object):
+
+    def __init__(self,infile,struct):
+
+        self.infile = infile
+        self.struct = struct
+        self.columns = {}
+
+# header keywords in the order returned by readTPF
+
+    def keywords(self):
+
+        return self.kepid, self.channel, self.skygroup, self.module, \
+            self.output, self.quarter, self.season, self.ra, self.dec, \
+            self.column, self.row, self.kepmag, self.xdim, self.ydim
+
+# read one TARGETTABLES column, 3D pixel columns are flattened to 2D
+
+    def readcol(self,colname,logfile,verbose):
+
+        status = 0
+        if colname in self.columns:
+            return self.columns[colname], status
+        try:
+            pixels = self.struct['TARGETTABLES'].data.field(colname)
+        except:
+            pixels = None
+            txt = '\nWARNING -- KEPIO.READTPF: Cannot read ' + colname + ' column in ' + self.infile + '[TARGETTABLES]'
+            status = kepmsg.err(logfile,txt,verbose)
+
+# for STSCI_PYTHON v2.12 - convert 3D data array to 2D
+
+        if status == 0 and len(np.shape(pixels)) == 3:
+            isize = np.shape(pixels)[0]
+            jsize = np.shape(pixels)[1]
+            ksize = np.shape(pixels)[2]
+            pixels = np.reshape(pixels,(isize,jsize*ksize))
+        if status == 0:
+            self.columns[colname] = pixels
+
+        return pixels, status
+
+# stream TARGETTABLES columns in blocks of nblock cadences
+
+    def readblocks(self,colnames,logfile,verbose,nblock=BLOCKSIZE):
+
+        status = 0
+        columns = []
+        for colname in colnames:
+            if status == 0:
+                pixels, status = self.readcol(colname,logfile,verbose)
+                columns.append(pixels)
+        if status == 0:
+            blocks = cadenceblocks(columns,nblock)
+        else:
+            blocks = None
+
+        return blocks, status
+
+# close the file, columns already read remain valid
+
+    def close(self,logfile,verbose):
+
+        self.columns = {}
+        return closefits(self.struct,logfile,verbose)
+
+# -----------------------------------------------------------
+# iterate over blocks of cadences within a list of equal-length columns,
+# yielding the first and last+1 cadence of each block and zero-copy views
+
+def cadenceblocks(columns,nblock=BLOCKSIZE):
+
+    nrows = len(columns[0])
+    nblock = max(int(nblock),1)
+    for i1 in range(0,nrows,nblock):
+        i2 = min(i1 + nblock,nrows)
+        yield i1, i2, [column[i1:i2] for column in columns]
+
+# -----------------------------------------------------------
+# open target pixel data file and read its header keywords
+
+def openTPF(infile,logfile,verbose):
 
     status = 0
     tpf = pyfits.open(infile,mode='readonly',memmap=True)
@@ -833,25 +931,44 @@ def readTPF(infile,colname,logfile,verbose):
             txt = 'ERROR -- KEPIO.READTPF: Cannot read 2CRV5P keyword in ' + infile + '[TARGETTABLES]'
             status = kepmsg.err(logfile,txt,verbose)
 
-# read and close TPF data pixel image
-
-    if status == 0:
-        try:
-            pixels = tpf['TARGETTABLES'].data.field(colname)[:]
-        except:
-            pixels = None
-            txt = '\nWARNING -- KEPIO.READTPF: Cannot read ' + colname + ' column in ' + infile + '[TARGETTABLES]'
-            status = kepmsg.err(logfile,txt,verbose)
     if status == 0:
-        status = closefits(tpf,logfile,verbose)
+        tpfobj = TPF(infile,tpf)
+        tpfobj.kepid = kepid
+        tpfobj.channel = channel
+        tpfobj.skygroup = skygroup
+        tpfobj.module = module
+        tpfobj.output = output
+        tpfobj.quarter = quarter
+        tpfobj.season = season
+        tpfobj.ra = ra
+        tpfobj.dec = dec
+        tpfobj.column = column
+        tpfobj.row = row
+        tpfobj.kepmag = kepmag
+        tpfobj.xdim = xdim
+        tpfobj.ydim = ydim
+    else:
+        tpfobj = None
+        closefits(tpf,logfile,verbose)
 
-# for STSCI_PYTHON v2.12 - convert 3D data array to 2D
+    return tpfobj, status
 
-    if status == 0 and len(np.shape(pixels)) == 3:
-        isize = np.shape(pixels)[0]
-        jsize = np.shape(pixels)[1]
-        ksize = np.shape(pixels)[2]
-        pixels = np.reshape(pixels,(isize,jsize*ksize))
+# -----------------------------------------------------------
+# read target pixel data file
+
+def readTPF(infile,colname,logfile,verbose):
+
+    kepid = None; channel = None; skygroup = None; module = None
+    output = None; quarter = None; season = None; ra = None; dec = None
+    column = None; row = None; kepmag = None; xdim = None; ydim = None
+    pixels = None
+    tpf, status = openTPF(infile,logfile,verbose)
+    if status == 0:
+        kepid, channel, skygroup, module, output, quarter, season, \
+            ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+        pixels, status = tpf.readcol(colname,logfile,verbose)
+    if status == 0:
+        status = tpf.close(logfile,verbose)
 
     return kepid, channel, skygroup, module, output, quarter, season, \
         ra, dec, column, row, kepmag, xdim, ydim, pixels, status
@@ -955,3 +1072,258 @@ def readPRFimage(infile,hdu,logfile,verbose):
         status = closefits(prf,logfile,verbose)
 
     return img, crpix1p, crpix2p, crval1p, crval2p, cdelt1p, cdelt2p, status
+
+
+# -----------------------------------------------------------
+# find the PRF calibration file for a module and output
+
+def findPRF(prfdir,module,output,logfile,verbose):
+
+    status = 0
+    prffile = None
+    if int(module) < 10:
+        prefix = 'kplr0'
+    else:
+        prefix = 'kplr'
+    prfglob = prfdir + '/' + prefix + str(module) + '.' + str(output) + '*' + '_prf.fits'
+    try:
+        prffile = glob.glob(prfglob)[0]
+    except:
+        message = 'ERROR -- KEPIO.FINDPRF: No PRF file found in ' + prfdir
+        status = kepmsg.err(logfile,message,verbose)
+
+    return prffile, status
+
+# -----------------------------------------------------------
+# read the five PRF calibration images in a single open, kept for the life
+# of the process until the file changes
+
+prfimages = {}
+
+def readPRFimages(infile,logfile,verbose):
+
+    status = 0
+    key = (infile,os.path.getmtime(infile))
+    if key in prfimages:
+        return prfimages[key] + (status,)
+
+# open input file
+
+    prf, status = openfits(infile,'readonly',logfile,verbose)
+
+# read the images and their WCS keywords
+
+    if status == 0:
+        prfn = [0,0,0,0,0]
+        crpix1p = np.zeros((5),dtype='float32')
+        crpix2p = np.zeros((5),dtype='float32')
+        crval1p = np.zeros((5),dtype='float32')
+        crval2p = np.zeros((5),dtype='float32')
+        cdelt1p = np.zeros((5),dtype='float32')
+        cdelt2p = np.zeros((5),dtype='float32')
+        for i in range(5):
+            if status == 0:
+                try:
+                    prfn[i] = np.array(prf[i+1].data)
+                except:
+                    txt = 'ERROR -- KEPIO.READPRFIMAGES: Cannot read PRF image in ' + infile + '[' + str(i+1) + ']'
+                    status = kepmsg.err(logfile,txt,verbose)
+            if status == 0:
+                crpix1p[i], crpix2p[i], crval1p[i], crval2p[i], cdelt1p[i], cdelt2p[i], status = \
+                    kepkey.getWCSp(infile,prf[i+1],logfile,verbose)
+
+# close input file
+
+    if status == 0:
+        status = closefits(prf,logfile,verbose)
+    if status == 0:
+        prfn = np.array(prfn)
+        for oldkey in [k for k in prfimages if k[0] == infile]:
+            del prfimages[oldkey]
+        prfimages[key] = (prfn, crpix1p, crpix2p, crval1p, crval2p, cdelt1p, cdelt2p)
+        return prfimages[key] + (status,)
+
+    return None, None, None, None, None, None, None, status
+
+# -----------------------------------------------------------
+# PRF interpolated to a target position, from the in-process LRU, the
+# on-disk cache in cachedir or the calibration file, in that order. Targets
+# within the same column and row bucket share one PRF. The disk cache is only
+# used when cachedir is given
+
+prfcache = collections.OrderedDict()
+
+def readPRF(prfdir,module,output,column,row,logfile,verbose,bucket=PRFBUCKET,cachedir=None):
+
+    status = 0
+    prffile, status = findPRF(prfdir,module,output,logfile,verbose)
+
+# cache key and target position of the bucket
+
+    if status == 0:
+        mtime = os.path.getmtime(prffile)
+        colb = int(math.floor(float(column) / bucket))
+        rowb = int(math.floor(float(row) / bucket))
+        column = colb * bucket + (bucket - 1) / 2.0
+        row = rowb * bucket + (bucket - 1) / 2.0
+        key = (int(module),int(output),int(bucket),colb,rowb)
+
+# in-process cache
+
+    if status == 0 and key in prfcache:
+        entry = prfcache.pop(key)
+        if entry[0] == prffile and entry[1] == mtime:
+            prfcache[key] = entry
+            return entry[2:] + (status,)
+
+# on-disk cache
+
+    if status == 0 and cachedir:
+        diskfile = os.path.join(cachedir,'kplr%02d.%d_%d_%d_%d_prf.npz' % key)
+        try:
+            data = np.load(diskfile)
+            if str(data['prffile']) == prffile and float(data['mtime']) == mtime:
+                entry = (prffile, mtime, data['prf'], data['PRFx'], data['PRFy'],
+                         data['cdelt1p'], data['cdelt2p'])
+                data.close()
+                os.utime(diskfile,None)
+                prfcache[key] = entry
+                while len(prfcache) > PRFCACHESIZE:
+                    prfcache.popitem(last=False)
+                return entry[2:] + (status,)
+            data.close()
+        except:
+            pass
+
+# read PRF images
+
+    if status == 0:
+        prfn, crpix1p, crpix2p, crval1p, crval2p, cdelt1p, cdelt2p, status = \
+            readPRFimages(prffile,logfile,verbose)
+    if status == 0:
+        PRFx = np.arange(0.5,np.shape(prfn[0])[1]+0.5)
+        PRFy = np.arange(0.5,np.shape(prfn[0])[0]+0.5)
+        PRFx = (PRFx - np.size(PRFx) / 2) * cdelt1p[0]
+        PRFy = (PRFy - np.size(PRFy) / 2) * cdelt2p[0]
+
+# interpolate the calibrated PRF shape to the target position
+
+    if status == 0:
+        prf = np.zeros(np.shape(prfn[0]),dtype='float32')
+        prfWeight = np.zeros((5),dtype='float32')
+        for i in xrange(5):
+            prfWeight[i] = math.sqrt((column - crval1p[i])**2 + (row - crval2p[i])**2)
+            if prfWeight[i] == 0.0:
+                prfWeight[i] = 1.0e-6
+            prf = prf + prfn[i] / prfWeight[i]
+        prf = prf / np.nansum(prf) / cdelt1p[0] / cdelt2p[0]
+        entry = (prffile, mtime, prf, PRFx, PRFy, cdelt1p, cdelt2p)
+        prfcache[key] = entry
+        while len(prfcache) > PRFCACHESIZE:
+            prfcache.popitem(last=False)
+
+# write to the on-disk cache, least recently used files are evicted first.
+# The cache is an optimization, so failures to write it are ignored
+
+    if status == 0 and cachedir:
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            tmp = tempfile.NamedTemporaryFile(dir=cachedir,suffix='.tmp',delete=False)
+            np.savez_compressed(tmp,prf=prf,PRFx=PRFx,PRFy=PRFy,cdelt1p=cdelt1p,cdelt2p=cdelt2p,
+                                prffile=prffile,mtime=mtime)
+            tmp.close()
+            os.rename(tmp.name,diskfile)
+            cached = glob.glob(os.path.join(cachedir,'*_prf.npz'))
+            if len(cached) > PRFDISKSIZE:
+                cached.sort(key=os.path.getmtime)
+                for oldfile in cached[:len(cached)-PRFDISKSIZE]:
+                    os.remove(oldfile)
+        except:
+            pass
+
+    if status == 0:
+        return entry[2:] + (status,)
+
+    return None, None, None, None, None, status
+
+# -----------------------------------------------------------
+# cotrending basis vectors of one module and output, as the CBV cadence
+# numbers and a contiguous (nvector, ncadence) array whose row i holds
+# VECTOR_i+1. Rows with undefined cadence numbers are dropped. Each mod.out
+# is kept in an in-process LRU and persisted as an npz sidecar holding the
+# quarter, cadence numbers and vectors next to the CBV file, so the CBV FITS
+# file is parsed once per mod.out
+
+cbvcache = collections.OrderedDict()
+
+def readCBV(bvfile,module,output,logfile,verbose):
+
+    status = 0
+    mtime = os.path.getmtime(bvfile)
+    extname = 'MODOUT_%s_%s' % (module,output)
+    key = (bvfile,extname)
+
+# in-process cache
+
+    if key in cbvcache:
+        entry = cbvcache.pop(key)
+        if entry[0] == mtime:
+            cbvcache[key] = entry
+            return entry[1:] + (status,)
+
+# sidecar, valid if written after the CBV file was last changed
+
+    entry = None
+    sidecar = bvfile + '.' + extname + '.cbv.npz'
+    try:
+        if os.path.getmtime(sidecar) >= mtime:
+            data = np.load(sidecar)
+            entry = (mtime, data['cadence'], data['vectors'], int(data['quarter']))
+            data.close()
+    except:
+        entry = None
+
+# read the CBV extension
+
+    if entry is None:
+        try:
+            bvfiledata = pyfits.open(bvfile)
+            quarter = bvfiledata[0].header['QUARTER']
+            bvdata = bvfiledata[extname].data
+            cadence = np.array(bvdata.field('CADENCENO'),dtype='float64')
+            names = [name for name in bvdata.columns.names if name.startswith('VECTOR_')]
+            vectors = np.zeros((max([int(name[7:]) for name in names]),len(cadence)))
+            vectors[:] = np.nan
+            for name in names:
+                vectors[int(name[7:]) - 1] = bvdata.field(name)
+            good = np.isnan(cadence) == False
+            cadence = cadence[good]
+            vectors = np.ascontiguousarray(vectors[:,good])
+            bvfiledata.close()
+        except:
+            message = 'ERROR -- KEPIO.READCBV: cannot read ' + extname + ' from ' + bvfile
+            status = kepmsg.err(logfile,message,verbose)
+
+# write the sidecar. It is an optimization, so failures are ignored
+
+    if entry is None and status == 0:
+        entry = (mtime, cadence, vectors, quarter)
+        tmp = None
+        try:
+            tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(bvfile)),
+                                              suffix='.tmp',delete=False)
+            np.savez(tmp,quarter=quarter,cadence=cadence,vectors=vectors)
+            tmp.close()
+            os.rename(tmp.name,sidecar)
+        except:
+            if tmp is not None and os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    if status == 0:
+        cbvcache[key] = entry
+        while len(cbvcache) > CBVCACHESIZE:
+            cbvcache.popitem(last=False)
+        return entry[1:] + (status,)
+
+    return None, None, None, status
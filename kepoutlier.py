@@ -93,21 +93,14 @@ def kepoutlier(infile,outfile,datacol,nsig,stepsize,npoly,niter,
         try:
             nanclean = instr[1].header['NANCLEAN']
         except:
-            naxis2 = 0
             try:
-                for i in range(len(table.field(0))):
-                    if np.isfinite(table.field('barytime')[i]) and \
-                            np.isfinite(table.field(datacol)[i]):
-                        table[naxis2] = table[i]
-                        naxis2 += 1
-                        instr[1].data = table[:naxis2]
+                finite = np.isfinite(table.field('barytime')) & \
+                    np.isfinite(table.field(datacol))
             except:
-                for i in range(len(table.field(0))):
-                    if np.isfinite(table.field('time')[i]) and \
-                            np.isfinite(table.field(datacol)[i]):
-                        table[naxis2] = table[i]
-                        naxis2 += 1
-                        instr[1].data = table[:naxis2]
+                finite = np.isfinite(table.field('time')) & \
+                    np.isfinite(table.field(datacol))
+            table = table[finite]
+            instr[1].data = table
             comment = 'NaN cadences removed from data'
             status = kepkey.new('NANCLEAN',True,comment,instr[1],outfile,logfile,verbose)
 
@@ -127,7 +120,9 @@ def kepoutlier(infile,outfile,datacol,nsig,stepsize,npoly,niter,
 
     if status == 0:
         t1, t2, status = kepio.timeranges(ranges,logfile,verbose)
-        cadencelis, status = kepstat.filterOnRange(intime,t1,t2)
+        inrange = np.zeros((len(intime)),dtype='bool')
+        for i in range(len(t1)):
+            inrange |= (intime > t1[i]) & (intime < t2[i])
 
 # find limits of each time step
 
@@ -143,16 +138,14 @@ def kepoutlier(infile,outfile,datacol,nsig,stepsize,npoly,niter,
 
     if status == 0:
         cstep1 = []; cstep2 = []
-        work1 = 0; work2 = 0
-        for i in range(len(intime)):
-            if intime[i] >= intime[work1] and intime[i] < intime[work1] + stepsize:
-                work2 = i
-            else:
-                cstep1.append(work1)
-                cstep2.append(work2)
-                work1 = i; work2 = i
-        cstep1.append(work1)
-        cstep2.append(work2)
+        work1 = 0
+        while work1 < len(intime):
+            work2 = max(np.searchsorted(intime,intime[work1] + stepsize,side='left') - 1,work1)
+            cstep1.append(work1)
+            cstep2.append(work2)
+            work1 = work2 + 1
+        cstep1 = np.array(cstep1,dtype='int')
+        cstep2 = np.array(cstep2,dtype='int')
 
         outdata = indata * 1.0
 
@@ -232,56 +225,41 @@ def kepoutlier(infile,outfile,datacol,nsig,stepsize,npoly,niter,
         plt.ylabel(ylab, {'color' : 'k'})
         plt.grid()
 
-# loop over each time step, fit data, determine rms
+# fit all time steps, determine rms
 
     if status == 0:
         masterfit = indata * 0.0
         mastersigma = np.zeros(len(masterfit))
-        functype = 'poly' + str(npoly)
-        for i in range(len(cstep1)):
-            pinit = [indata[cstep1[i]:cstep2[i]+1].mean()]
-            if npoly > 0:
-                for j in range(npoly):
-                    pinit.append(0.0)
-            pinit = np.array(pinit,dtype='float32')
-            try:
-                coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
-                    kepfit.lsqclip(functype,pinit,intime[cstep1[i]:cstep2[i]+1]-intime[cstep1[i]],
-                                   indata[cstep1[i]:cstep2[i]+1],None,nsig,nsig,niter,logfile,
-                                   verbose)
-                for j in range(len(coeffs)):
-                    masterfit[cstep1[i]:cstep2[i]+1] += coeffs[j] * \
-                        (intime[cstep1[i]:cstep2[i]+1] - intime[cstep1[i]])**j
-                for j in range(cstep1[i],cstep2[i]+1):
-                    mastersigma[j] = sigma
-                if plotfit:
-                    plt.plot(plotx+intime[cstep1[i]]-intime0,ploty / 10**nrm,
-                               'g',lw='3')
-            except:
-                for j in range(cstep1[i],cstep2[i]+1):
-                    masterfit[j] = indata[j]
-                    mastersigma[j] = 1.0e10
+        for wins, index, valid, fit, sigma, fitted, clipmask in \
+                kepfit.lsqclipwin(intime,indata,cstep1,cstep2,npoly,nsig,nsig,niter):
+            cadence = index[valid]
+            masterfit[cadence] = fit[valid]
+            mastersigma[cadence] = np.repeat(sigma,valid.shape[1]).reshape(valid.shape)[valid]
+
+# steps that could not be fit keep their data, with a very large sigma
+
+            for i in wins[~fitted]:
+                masterfit[cstep1[i]:cstep2[i]+1] = indata[cstep1[i]:cstep2[i]+1]
+                mastersigma[cstep1[i]:cstep2[i]+1] = 1.0e10
                 message  = 'WARNING -- KEPOUTLIER: could not fit range '
                 message += str(intime[cstep1[i]]) + '-' + str(intime[cstep2[i]])
                 kepmsg.warn(None,message)
+            if plotfit:
+                for i in np.where(fitted)[0]:
+                    n = valid[i].sum()
+                    plt.plot(intime[index[i,:n]]-intime0,fit[i,:n] / 10**nrm,'g',lw='3')
 
 # reject outliers
 
     if status == 0:
-        rejtime = []; rejdata = []; naxis2 = 0
-        for i in range(len(masterfit)):
-            if abs(indata[i] - masterfit[i]) > nsig * mastersigma[i] and i in cadencelis:
-                rejtime.append(intime[i])
-                rejdata.append(indata[i])
-                if operation == 'replace':
-                    [rnd] = kepstat.randarray([masterfit[i]],[mastersigma[i]])
-                    table[naxis2] = table[i]
-                    table.field(datacol)[naxis2] = rnd
-                    naxis2 += 1
-            else:
-                table[naxis2] = table[i]
-                naxis2 += 1
-        instr[1].data = table[:naxis2]
+        rejected = (np.abs(indata - masterfit) > nsig * mastersigma) & inrange
+        rejtime = intime[rejected]
+        rejdata = indata[rejected]
+        if operation == 'replace':
+            table.field(datacol)[rejected] = kepstat.randarray(masterfit[rejected],mastersigma[rejected])
+        else:
+            table = table[~rejected]
+        instr[1].data = table
         rejtime = np.array(rejtime,dtype='float64')
         rejdata = np.array(rejdata,dtype='float32')
         plt.plot(rejtime-intime0,rejdata / 10**nrm,'ro')
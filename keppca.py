@@ -1,10 +1,8 @@
-import sys, re
+import sys, re, math
 from astropy.io import fits as pyfits
 import numpy as np
-from scipy import optimize as opt
 from matplotlib import pyplot as plt
 import kepmsg, kepio, kepkey, kepplot
-import random
 
 # -----------------------------------------------------------
 # core code
@@ -12,19 +10,6 @@ import random
 def keppca(infile, maskfile, outfile, components, plotpca, nreps, clobber,
            verbose, logfile, status, cmdLine=False):
 
-    try:
-        import mdp
-    except:
-        msg = ("ERROR -- KEPPCA: this task has an external python dependency "
-               "to MDP, a Modular toolkit for Data Processing "
-               "(http://mdp-toolkit.sourceforge.net). In order to take "
-               "advantage of this PCA task, the user must first install "
-               "MDP with their current python distribution. Note carefully "
-               "that you may have more than python installation on your "
-               "machine, and ensure that MDP is installed with the same "
-               "version of python that the PyKE tools employ. Installation "
-               "instructions for MDP can be found at the URL provided above.")
-        status = kepmsg.err(None,msg,True)
 # startup parameters
 
     status = 0
@@ -88,51 +73,35 @@ def keppca(infile, maskfile, outfile, components, plotpca, nreps, clobber,
 # open input file
 
     if status == 0:
-        instr = pyfits.open(infile,mode='readonly',memmap=True)
+        tpf, status = kepio.openTPF(infile,logfile,verbose)
+    if status == 0:
+        instr = tpf.struct
         tstart, tstop, bjdref, cadence, status = kepio.timekeys(instr,infile,logfile,verbose,status)
 
-# open TPF FITS file
+# read TPF header keywords and columns
 
     if status == 0:
         kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, barytime, status = \
-            kepio.readTPF(infile,'TIME',logfile,verbose)
+            ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+        barytime, status = tpf.readcol('TIME',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, tcorr, status = \
-            kepio.readTPF(infile,'TIMECORR',logfile,verbose)
+        tcorr, status = tpf.readcol('TIMECORR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cadno, status = \
-            kepio.readTPF(infile,'CADENCENO',logfile,verbose)
+        cadno, status = tpf.readcol('CADENCENO',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, fluxpixels, status = \
-            kepio.readTPF(infile,'FLUX',logfile,verbose)
+        fluxpixels, status = tpf.readcol('FLUX',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, errpixels, status = \
-            kepio.readTPF(infile,'FLUX_ERR',logfile,verbose)
+        errpixels, status = tpf.readcol('FLUX_ERR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, flux_bkg, status = \
-            kepio.readTPF(infile,'FLUX_BKG',logfile,verbose)
+        flux_bkg, status = tpf.readcol('FLUX_BKG',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, flux_bkg_err, status = \
-            kepio.readTPF(infile,'FLUX_BKG_ERR',logfile,verbose)
+        flux_bkg_err, status = tpf.readcol('FLUX_BKG_ERR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, qual, status = \
-            kepio.readTPF(infile,'QUALITY',logfile,verbose)
+        qual, status = tpf.readcol('QUALITY',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, pcorr1, status = \
-            kepio.readTPF(infile,'POS_CORR1',logfile,verbose)
+        pcorr1, status = tpf.readcol('POS_CORR1',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, pcorr2, status = \
-            kepio.readTPF(infile,'POS_CORR2',logfile,verbose)
+        pcorr2, status = tpf.readcol('POS_CORR2',logfile,verbose)
 
 # Save original data dimensions, in case of using maskfile
 
@@ -215,101 +184,82 @@ def keppca(infile, maskfile, outfile, components, plotpca, nreps, clobber,
                     message = 'ERROR -- KEPPCA: cannot understand principal component list requested'
                     status = kepmsg.err(logfile,message,verbose)
     if status == 0:
-        pcaout = set(np.sort(pcaout))
+        pcaout = sorted(set(pcaout))
     pcarem = np.array(list(pcaout))-1    # The list of pca component numbers to be removed
 
-# Initialize arrays and variables, and apply pixel mask to the data
+# Select good cadences and initialize arrays
+
+    if status == 0:
+        good = (qual < 10000) & np.isfinite(barytime) & \
+            np.isfinite(fluxpixels[:,int(ydim*xdim/2+0.5)]) & \
+            np.isfinite(fluxpixels[:,1+int(ydim*xdim/2+0.5)])
+        ntim = good.sum()
+        time = np.array(barytime[good],dtype='float64')
+        timecorr = np.array(tcorr[good],dtype='float32')
+        cadenceno = np.array(cadno[good],dtype='int')
+        quality = np.array(qual[good],dtype='float32')
+        pos_corr1 = np.array(pcorr1[good],dtype='float32')
+        pos_corr2 = np.array(pcorr2[good],dtype='float32')
+        pixseries = np.empty((ntim,npix),dtype='float32')
+        errseries = np.empty((ntim,npix),dtype='float32')
+        bkgseries = np.empty((ntim,npix),dtype='float32')
+        berseries = np.empty((ntim,npix),dtype='float32')
+
+# Read in the data one block of cadences at a time, applying the pixel mask
+# so we are left with only the desired pixels
 
     if status == 0:
         ntim = 0
-        time = np.array([],dtype='float64')
-        timecorr = np.array([],dtype='float32')
-        cadenceno = np.array([],dtype='int')
-        pixseries = np.array([],dtype='float32')
-        errseries = np.array([],dtype='float32')
-        bkgseries = np.array([],dtype='float32')
-        berseries = np.array([],dtype='float32')
-        quality = np.array([],dtype='float32')
-        pos_corr1 = np.array([],dtype='float32')
-        pos_corr2 = np.array([],dtype='float32')
-        nrows = np.size(fluxpixels,0)
-
-# Apply the pixel mask so we are left with only the desired pixels
-    if status == 0:
-        pixseriesb = fluxpixels[:,aperb]
-        errseriesb = errpixels[:,aperb]
-        bkgseriesb = flux_bkg[:,aperb]
-        berseriesb = flux_bkg_err[:,aperb]
-
-# Read in the data to various arrays
-
-    if status == 0:
-        for i in range(nrows):
-            if qual[i] < 10000 and \
-                    np.isfinite(barytime[i]) and \
-                    np.isfinite(fluxpixels[i,int(ydim*xdim/2+0.5)]) and \
-                    np.isfinite(fluxpixels[i,1+int(ydim*xdim/2+0.5)]):
-                ntim += 1
-                time = np.append(time,barytime[i])
-                timecorr = np.append(timecorr,tcorr[i])
-                cadenceno = np.append(cadenceno,cadno[i])
-                pixseries = np.append(pixseries,pixseriesb[i])
-                errseries = np.append(errseries,errseriesb[i])
-                bkgseries = np.append(bkgseries,bkgseriesb[i])
-                berseries = np.append(berseries,berseriesb[i])
-                quality = np.append(quality,qual[i])
-                pos_corr1 = np.append(pos_corr1,pcorr1[i])
-                pos_corr2 = np.append(pos_corr2,pcorr2[i])
-        pixseries = np.reshape(pixseries,(ntim,npix))
-        errseries = np.reshape(errseries,(ntim,npix))
-        bkgseries = np.reshape(bkgseries,(ntim,npix))
-        berseries = np.reshape(berseries,(ntim,npix))
-        tmp =  np.ma.median(np.ma.masked_invalid(pixseries),axis=1)
-
-        for i in range(len(tmp)):
-             pixseries[i] = pixseries[i] - tmp[i]
-
-        pixseries = np.ma.masked_invalid(pixseries)
-
-
-# Figure out which pixels are undefined/nan and remove them. Keep track for adding back in later
-
-    if status == 0:
-        nanpixels = np.array([],dtype='int')
-        i = 0
-        while (i < npix):
-            if np.isnan(pixseries[0,i]):
-                nanpixels = np.append(nanpixels,i)
-                npix = npix - 1
-            i = i + 1
-        pixseries = np.delete(pixseries,nanpixels,1)
+        for i1, i2, (fluxblk, errblk, bkgblk, berblk, goodblk) in \
+                kepio.cadenceblocks([fluxpixels,errpixels,flux_bkg,flux_bkg_err,good]):
+            n = goodblk.sum()
+            pixseries[ntim:ntim+n] = fluxblk[goodblk][:,aperb]
+            errseries[ntim:ntim+n] = errblk[goodblk][:,aperb]
+            bkgseries[ntim:ntim+n] = bkgblk[goodblk][:,aperb]
+            berseries[ntim:ntim+n] = berblk[goodblk][:,aperb]
+            ntim += n
+        pixseries -= np.nanmedian(pixseries,axis=1)[:,None]
+
+# Figure out which pixels are undefined/nan and remove them. Keep track for adding back in later.
+# Remaining nan values are masked out of the pixel statistics
+
+    if status == 0:
+        nanpixels = np.where(np.isnan(pixseries[0]))[0]
+        pixseries = np.ma.masked_invalid(np.delete(pixseries,nanpixels,1))
         errseries = np.delete(errseries,nanpixels,1)
-        pixseries[np.isnan(pixseries)] = random.gauss(100,10)
         errseries[np.isnan(errseries)] = 10
+        npix = pixseries.shape[1]
+
 # Compute statistical weights, means, standard deviations
 
     if status == 0:
         weightseries = (pixseries/errseries)**2
-        pixMean = np.average(pixseries,axis=0,weights=weightseries)
-        pixStd  = np.std(pixseries,axis=0)
+        pixMean = np.ma.average(pixseries,axis=0,weights=weightseries).filled(0.0)
+        pixStd  = np.ma.std(pixseries,axis=0).filled(1.0)
+        pixStd[pixStd == 0.0] = 1.0
 
 # Normalize the input by subtracting the mean and divising by the standard deviation.
-# This makes it a correlation-based PCA, which is what we want.
+# This makes it a correlation-based PCA, which is what we want. Masked values are set
+# to the pixel mean
 
     if status == 0:
-        pixseriesnorm = (pixseries - pixMean) / pixStd
+        pixseriesnorm = ((pixseries - pixMean) / pixStd).filled(0.0)
 
-# Number of principal components to compute. Setting it equal to the number of pixels
+# Number of principal components to compute, enough to remove the requested components
+# and to plot the requested number of maps
 
     if status == 0:
-        nvecin = npix
+        nvecin = min(npix,max(max(pcaout),nreps))
+        if max(pcaout) > npix:
+            message = 'ERROR -- KEPPCA: cannot remove principal component ' + str(max(pcaout))
+            message += ', there are only ' + str(npix) + ' defined pixels'
+            status = kepmsg.err(logfile,message,verbose)
+        nreps = min(nreps,nvecin)
 
-# Run PCA using the MDP Whitening PCA, which produces normalized PCA components (zero mean and unit variance)
+# Run a whitening PCA, which produces normalized PCA components (zero mean and unit variance)
 
     if status == 0:
-        pcan = mdp.nodes.WhiteningNode(svd=True)
-        pcar = pcan.execute(pixseriesnorm)
-        eigvec = pcan.get_recmatrix()
+        pcar, eigvec = pca(pixseriesnorm,nvecin)
         model = pcar
 
 # Re-insert nan columns as zeros
@@ -328,37 +278,23 @@ def keppca(infile, maskfile, outfile, components, plotpca, nreps, clobber,
 # Calculate sum of all pixels to display as raw lightcurve and other quantities
 
     if status == 0:
-        pixseriessum = np.sum(pixseries,axis=1)
+        pixseriessum = np.ma.sum(pixseries,axis=1).filled(0.0)
         nrem=len(pcarem)  # Number of components to remove
         nplot = npix      # Number of pcas to plot - currently set to plot all components, but could set
                           # nplot = nrem to just plot as many components as is being removed
 
-# Subtract components by fitting them to the summed light curve
+# Subtract components by fitting them to the summed light curve, minimizing the mean
+# absolute deviation
 
     if status == 0:
-        x0 = np.tile(-1.0,1)
-        for k in range(0,nrem):
-            def f(x):
-                fluxcor = pixseriessum
-                for k in range(0,len(x)):
-                    fluxcor = fluxcor - x[k]*model[:,pcarem[k]]
-                return mad(fluxcor)
-            if k==0:
-                x0 = np.array([-1.0])
-            else:
-                x0 = np.append(x0,1.0)
-            myfit = opt.fmin(f,x0,maxiter=50000,maxfun=50000,disp=False)
-            x0 = myfit
+        c = ladfit(pixseriessum,model[:,pcarem])
 
 # Now that coefficients for all components have been found, subtract them to produce a calibrated time-series,
 # and then divide by the robust mean to produce a normalized time series as well
 
     if status == 0:
-        c = myfit
-        fluxcor = pixseriessum
-        for k in range(0,nrem):
-            fluxcor = fluxcor - c[k]*model[:,pcarem[k]]
-            normfluxcor = fluxcor/np.mean(reject_outliers(fluxcor,2))
+        fluxcor = pixseriessum - np.dot(model[:,pcarem],c)
+        normfluxcor = fluxcor/np.mean(reject_outliers(fluxcor,2))
 
 # input file data
 
@@ -536,7 +472,8 @@ def keppca(infile, maskfile, outfile, components, plotpca, nreps, clobber,
                 hdu2.header.cards[cards2[i].keyword].comment = cards2[i].comment
         outstr.append(hdu2)
 
-# construct principal component table
+# construct principal component table, one column for each of the nvecin
+# components computed, i.e. max(components, nmaps) rather than one per pixel
 
     if status == 0:
         cols = [pyfits.Column(name='TIME',format='E',unit='BJD - 2454833',array=time)]
@@ -695,6 +632,64 @@ def keppca(infile, maskfile, outfile, components, plotpca, nreps, clobber,
     return
 
 
+# -----------------------------------------------------------
+# Whitening PCA of the columns of data, equivalent to the MDP WhiteningNode. Only the
+# leading ncomp components are found, from a randomized SVD with power iterations.
+# Returns the components, with zero mean and unit variance, and the reconstruction
+# matrix whose rows are the eigenvectors scaled by the standard deviation of each component
+
+def pca(data,ncomp,oversample=10,niter=6):
+
+    ntim, npix = data.shape
+    data = np.asarray(data,dtype='float64')
+    data = data - np.mean(data,axis=0)
+    nsub = ncomp + oversample
+    if nsub >= min(ntim,npix):
+        u, s, vt = np.linalg.svd(data,full_matrices=False)
+    else:
+        omega = np.random.RandomState(0).standard_normal((npix,nsub))
+        q, r = np.linalg.qr(np.dot(data,omega))
+        for i in range(niter):
+            q, r = np.linalg.qr(np.dot(data.T,q))
+            q, r = np.linalg.qr(np.dot(data,q))
+        ub, s, vt = np.linalg.svd(np.dot(q.T,data),full_matrices=False)
+        u = np.dot(q,ub)
+    u = u[:,:ncomp]; s = s[:ncomp]; vt = vt[:ncomp]
+
+# fix the sign of each component, largest pixel weight positive
+
+    sign = np.sign(vt[np.arange(ncomp),np.argmax(np.abs(vt),axis=1)])
+    sign[sign == 0] = 1.0
+    u *= sign; vt *= sign[:,None]
+    norm = math.sqrt(max(ntim - 1,1))
+    s[s == 0.0] = 1.0
+    pcar = u * norm
+    recmatrix = vt * s[:,None] / norm
+    return pcar, recmatrix
+
+# -----------------------------------------------------------
+# Coefficients of the components that minimize the mean absolute deviation of
+# data - components * coefficients, by iteratively reweighted least squares
+
+def ladfit(data,components,niter=100,tol=1.0e-10):
+
+    data = np.asarray(data,dtype='float64') - np.mean(data)
+    components = np.asarray(components,dtype='float64')
+    components = components - np.mean(components,axis=0)
+    weight = np.ones(len(data))
+    coeffs = np.zeros(components.shape[1])
+    for i in range(niter):
+        cw = components * weight[:,None]
+        new = np.linalg.lstsq(np.dot(cw.T,components),np.dot(cw.T,data),rcond=-1)[0]
+        resid = np.abs(data - np.dot(components,new))
+        floor = max(1.0e-6 * np.median(resid),1.0e-30)
+        weight = 1.0 / np.maximum(resid,floor)
+        change = np.max(np.abs(new - coeffs)) / max(np.max(np.abs(new)),1.0e-30)
+        coeffs = new
+        if change < tol:
+            break
+    return coeffs
+
 # -----------------------------------------------------------
 # Outlier rejection for computing robust mean later
 
@@ -727,7 +722,9 @@ if '--shell' in sys.argv:
     parser.add_argument('--plotpca', action='store_true',
                         help='Create PCA plots?')
     parser.add_argument('--nmaps', default=10,
-                        help='Number of principal components to include in report',
+                        help=('Number of principal components to include in report. The '
+                              'PRINCIPAL_COMPONENTS extension holds max(components, nmaps) '
+                              'columns, not one per pixel'),
                         type=int)
     parser.add_argument('--clobber', action='store_true',
                         help='Overwrite output file?')
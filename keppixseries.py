@@ -53,29 +53,21 @@ def keppixseries(infile,outfile,plotfile,plottype,filter,function,cutoff,clobber
 # open TPF FITS file
 
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, barytime, status = \
-            kepio.readTPF(infile,'TIME',logfile,verbose)
+        tpf, status = kepio.openTPF(infile,logfile,verbose)
     if status == 0:
         kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, tcorr, status = \
-            kepio.readTPF(infile,'TIMECORR',logfile,verbose)
+            ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+        barytime, status = tpf.readcol('TIME',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cadno, status = \
-            kepio.readTPF(infile,'CADENCENO',logfile,verbose)
+        tcorr, status = tpf.readcol('TIMECORR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, fluxpixels, status = \
-            kepio.readTPF(infile,'FLUX',logfile,verbose)
+        cadno, status = tpf.readcol('CADENCENO',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, errpixels, status = \
-            kepio.readTPF(infile,'FLUX_ERR',logfile,verbose)
+        fluxpixels, status = tpf.readcol('FLUX',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, qual, status = \
-            kepio.readTPF(infile,'QUALITY',logfile,verbose)
+        errpixels, status = tpf.readcol('FLUX_ERR',logfile,verbose)
+    if status == 0:
+        qual, status = tpf.readcol('QUALITY',logfile,verbose)
 
 # read mask defintion data from TPF file
 
@@ -97,49 +89,36 @@ def keppixseries(infile,outfile,plotfile,plottype,filter,function,cutoff,clobber
         print '     Output:     %1s' % output
         print ''
 
-# how many quality = 0 rows?
+# quality = 0 rows with finite time and central pixel flux
 
     if status == 0:
-        npts = 0
-        nrows = len(fluxpixels)
-        for i in range(nrows):
-            if qual[i] == 0 and \
-                    np.isfinite(barytime[i]) and \
-                    np.isfinite(fluxpixels[i,int(ydim*xdim/2)]):
-                npts += 1
-        time = np.empty((npts))
-        timecorr = np.empty((npts))
-        cadenceno = np.empty((npts))
-        quality = np.empty((npts))
+        good = (qual == 0) & np.isfinite(barytime) & \
+            np.isfinite(fluxpixels[:,int(ydim*xdim/2)])
+        npts = good.sum()
+        time = np.array(barytime[good],dtype='float64')
+        timecorr = np.array(tcorr[good],dtype='float64')
+        cadenceno = np.array(cadno[good],dtype='float64')
+        quality = np.array(qual[good],dtype='float64')
         pixseries = np.empty((ydim,xdim,npts))
         errseries = np.empty((ydim,xdim,npts))
 
-# construct output light curves
+# construct output light curves, one block of cadences at a time
 
     if status == 0:
-        nptsx = 0
-        for i in range(ydim):
-            for j in range(xdim):
-                npts = 0
-                for k in range(nrows):
-                    if qual[k] == 0 and \
-                    np.isfinite(barytime[k]) and \
-                    np.isfinite(fluxpixels[k,int(ydim*xdim/2)]):
-                        time[npts] = barytime[k]
-                        timecorr[npts] = tcorr[k]
-                        cadenceno[npts] = cadno[k]
-                        quality[npts] = qual[k]
-                        pixseries[i,j,npts] = fluxpixels[k,nptsx]
-                        errseries[i,j,npts] = errpixels[k,nptsx]
-                        npts += 1
-                nptsx += 1
+        pixflat = pixseries.reshape((ydim*xdim,npts))
+        errflat = errseries.reshape((ydim*xdim,npts))
+        npts = 0
+        for i1, i2, (fluxblk, errblk, goodblk) in \
+                kepio.cadenceblocks([fluxpixels,errpixels,good]):
+            n = goodblk.sum()
+            pixflat[:,npts:npts+n] = fluxblk[goodblk].T
+            errflat[:,npts:npts+n] = errblk[goodblk].T
+            npts += n
 
 # define data sampling
 
     if status == 0 and filter:
-        tpf, status = kepio.openfits(infile,'readonly',logfile,verbose)
-    if status == 0 and filter:
-        cadence, status = kepkey.cadence(tpf[1],infile,logfile,verbose)
+        cadence, status = kepkey.cadence(tpf.struct[1],infile,logfile,verbose)
         tr = 1.0 / (cadence / 86400)
         timescale = 1.0 / (cutoff / tr)
 
@@ -192,7 +171,7 @@ def keppixseries(infile,outfile,plotfile,plottype,filter,function,cutoff,clobber
 # construct output file
 
     if status == 0 and ydim*xdim < 1000:
-        instruct, status = kepio.openfits(infile,'readonly',logfile,verbose)
+        instruct = tpf.struct
         status = kepkey.history(call,instruct[0],outfile,logfile,verbose)
         hdulist = pyfits.HDUList(instruct[0])
         cols = []
@@ -3,7 +3,7 @@ from matplotlib import pyplot as plt
 from matplotlib import ticker
 from astropy.io import fits as pyfits
 import kepio, kepmsg, kepkey, kepplot, kepfit, keparray, kepfunc, kepstat
-import sys, time, re, math, glob
+import sys, time, re, math
 from scipy import interpolate, optimize, ndimage, stats
 from scipy.optimize import fmin_powell
 from scipy.interpolate import RectBivariateSpline
@@ -13,7 +13,7 @@ from scipy.ndimage import interpolation
 # core code
 
 def kepprf(infile,plotfile,rownum,columns,rows,fluxes,border,background,focus,prfdir,xtol,ftol,
-           imscale,colmap,labcol,apercol,plot,verbose,logfile,status,cmdLine=False):
+           fitmethod,prfcache,imscale,colmap,labcol,apercol,plot,verbose,logfile,status,cmdLine=False):
 
 # input arguments
 
@@ -41,6 +41,8 @@ def kepprf(infile,plotfile,rownum,columns,rows,fluxes,border,background,focus,pr
     call += 'prfdir='+prfdir+' '
     call += 'xtol='+str(xtol)+' '
     call += 'ftol='+str(xtol)+' '
+    call += 'fitmethod='+fitmethod+' '
+    call += 'prfcache='+prfcache+' '
     call += 'imscale='+imscale+' '
     call += 'colmap='+colmap+' '
     call += 'labcol='+labcol+' '
@@ -120,32 +122,26 @@ def kepprf(infile,plotfile,rownum,columns,rows,fluxes,border,background,focus,pr
 
     if status == 0:
         try:
-            kepid, channel, skygroup, module, output, quarter, season, \
-                ra, dec, column, row, kepmag, xdim, ydim, barytime, status = \
-                kepio.readTPF(infile,'TIME',logfile,verbose)
+            tpf, status = kepio.openTPF(infile,logfile,verbose)
+            if status == 0:
+                kepid, channel, skygroup, module, output, quarter, season, \
+                    ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+                barytime, status = tpf.readcol('TIME',logfile,verbose)
         except:
             message = 'ERROR -- KEPPRF: is %s a Target Pixel File? ' % infile
             status = kepmsg.err(logfile,message,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, tcorr, status = \
-            kepio.readTPF(infile,'TIMECORR',logfile,verbose)
+        tcorr, status = tpf.readcol('TIMECORR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cadno, status = \
-            kepio.readTPF(infile,'CADENCENO',logfile,verbose)
+        cadno, status = tpf.readcol('CADENCENO',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, fluxpixels, status = \
-            kepio.readTPF(infile,'FLUX',logfile,verbose)
+        fluxpixels, status = tpf.readcol('FLUX',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, errpixels, status = \
-            kepio.readTPF(infile,'FLUX_ERR',logfile,verbose)
+        errpixels, status = tpf.readcol('FLUX_ERR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, qual, status = \
-            kepio.readTPF(infile,'QUALITY',logfile,verbose)
+        qual, status = tpf.readcol('QUALITY',logfile,verbose)
+    if status == 0:
+        status = tpf.close(logfile,verbose)
 
 # read mask defintion data from TPF file
 
@@ -197,50 +193,18 @@ def kepprf(infile,plotfile,rownum,columns,rows,fluxes,border,background,focus,pr
                 ERRimg[i,j] = ferr[n]
                 n += 1
 
-# determine suitable PRF calibration file
+# PRF calibration interpolated to the target position
 
     if status == 0:
-        if int(module) < 10:
-            prefix = 'kplr0'
-        else:
-            prefix = 'kplr'
-        prfglob = prfdir + '/' + prefix + str(module) + '.' + str(output) + '*' + '_prf.fits'
-        try:
-            prffile = glob.glob(prfglob)[0]
-        except:
-            message = 'ERROR -- KEPPRF: No PRF file found in ' + prfdir
-            status = kepmsg.err(logfile,message,verbose)
-
-# read PRF images
+        if prfcache.lower() == 'none':
+            prfcache = ''
+        prf, PRFx, PRFy, cdelt1p, cdelt2p, status = \
+            kepio.readPRF(prfdir,module,output,column,row,logfile,verbose,cachedir=prfcache)
 
-    if status == 0:
-        prfn = [0,0,0,0,0]
-        crpix1p = np.zeros((5),dtype='float32')
-        crpix2p = np.zeros((5),dtype='float32')
-        crval1p = np.zeros((5),dtype='float32')
-        crval2p = np.zeros((5),dtype='float32')
-        cdelt1p = np.zeros((5),dtype='float32')
-        cdelt2p = np.zeros((5),dtype='float32')
-        for i in range(5):
-            prfn[i], crpix1p[i], crpix2p[i], crval1p[i], crval2p[i], cdelt1p[i], cdelt2p[i], status \
-                = kepio.readPRFimage(prffile,i+1,logfile,verbose)
-        prfn = np.array(prfn)
-        PRFx = np.arange(0.5,np.shape(prfn[0])[1]+0.5)
-        PRFy = np.arange(0.5,np.shape(prfn[0])[0]+0.5)
-        PRFx = (PRFx - np.size(PRFx) / 2) * cdelt1p[0]
-        PRFy = (PRFy - np.size(PRFy) / 2) * cdelt2p[0]
-
-# interpolate the calibrated PRF shape to the target position
+# interpolation function over the PRF
 
     if status == 0:
-        prf = np.zeros(np.shape(prfn[0]),dtype='float32')
-        prfWeight = np.zeros((5),dtype='float32')
-        for i in xrange(5):
-            prfWeight[i] = math.sqrt((column - crval1p[i])**2 + (row - crval2p[i])**2)
-            if prfWeight[i] == 0.0:
-                prfWeight[i] = 1.0e-6
-            prf = prf + prfn[i] / prfWeight[i]
-        prf = prf / np.nansum(prf) / cdelt1p[0] / cdelt2p[0]
+        splineInterpolation = RectBivariateSpline(PRFx,PRFy,prf)
 
 # location of the data image centered on the PRF image (in PRF pixel units)
 
@@ -250,11 +214,6 @@ def kepprf(infile,plotfile,rownum,columns,rows,fluxes,border,background,focus,pr
         PRFy0 = int(np.round((np.shape(prf)[0] - prfDimY) / 2))
         PRFx0 = int(np.round((np.shape(prf)[1] - prfDimX) / 2))
 
-# interpolation function over the PRF
-
-    if status == 0:
-        splineInterpolation = RectBivariateSpline(PRFx,PRFy,prf)
-
 # construct mesh for background model
 
     if status == 0 and background:
@@ -267,23 +226,32 @@ def kepprf(infile,plotfile,rownum,columns,rows,fluxes,border,background,focus,pr
 
     if status == 0:
         start = time.time()
-        if focus and background:
+        if fitmethod == 'lm':
+            if not background:
+                xx = None; yy = None
+            ans, niter, nfev = kepfit.fitPRFlsq(guess,DATx,DATy,DATimg,ERRimg,nsrc,border,xx,yy,
+                                                splineInterpolation,focus,background,xtol,ftol,
+                                                float(x[0]),float(y[0]))
+        elif focus and background:
             args = (DATx,DATy,DATimg,ERRimg,nsrc,border,xx,yy,splineInterpolation,float(x[0]),float(y[0]))
-            ans = fmin_powell(kepfunc.PRFwithFocusAndBackground,guess,args=args,xtol=xtol,
-                              ftol=ftol,disp=False)
+            out = fmin_powell(kepfunc.PRFwithFocusAndBackground,guess,args=args,xtol=xtol,
+                              ftol=ftol,disp=False,full_output=True)
         elif focus and not background:
             args = (DATx,DATy,DATimg,ERRimg,nsrc,splineInterpolation,float(x[0]),float(y[0]))
-            ans = fmin_powell(kepfunc.PRFwithFocus,guess,args=args,xtol=xtol,
-                              ftol=ftol,disp=False)
+            out = fmin_powell(kepfunc.PRFwithFocus,guess,args=args,xtol=xtol,
+                              ftol=ftol,disp=False,full_output=True)
         elif background and not focus:
             args = (DATx,DATy,DATimg,ERRimg,nsrc,border,xx,yy,splineInterpolation,float(x[0]),float(y[0]))
-            ans = fmin_powell(kepfunc.PRFwithBackground,guess,args=args,xtol=xtol,
-                              ftol=ftol,disp=False)
+            out = fmin_powell(kepfunc.PRFwithBackground,guess,args=args,xtol=xtol,
+                              ftol=ftol,disp=False,full_output=True)
         else:
             args = (DATx,DATy,DATimg,ERRimg,nsrc,splineInterpolation,float(x[0]),float(y[0]))
-            ans = fmin_powell(kepfunc.PRF,guess,args=args,xtol=xtol,
-                              ftol=ftol,disp=False)
+            out = fmin_powell(kepfunc.PRF,guess,args=args,xtol=xtol,
+                              ftol=ftol,disp=False,full_output=True)
+        if fitmethod != 'lm':
+            ans = out[0]; niter = out[3]; nfev = out[4]
         print 'Convergence time = %.2fs\n' % (time.time() - start)
+        print 'Iterations = %d, function evaluations = %d\n' % (niter,nfev)
 
 # pad the PRF data if the PRF array is smaller than the data array
 
@@ -583,6 +551,9 @@ if '--shell' in sys.argv:
     parser.add_argument('--prfdir', help='Folder containing Point Response Function FITS files', type=str)
     parser.add_argument('--xtol', '-x', default=1.0e-4, help='Fit parameter tolerance', dest='xtol', type=float)
     parser.add_argument('--ftol', '-f', default=1.0, help='Fit minimization tolerance', dest='ftol', type=float)
+    parser.add_argument('--fitmethod', default='powell', help='PRF fit minimizer', type=str,
+                        choices=['powell','lm'])
+    parser.add_argument('--prfcache', default='', help='Folder caching interpolated PRFs between runs', type=str)
     parser.add_argument('--imscale', '-i', help='Type of image intensity scale', default='linear', dest='imscale', type=str,choices=['linear','logarithmic','squareroot'])
     parser.add_argument('--colmap', '-c', help='Image colormap', default='YlOrBr', dest='cmap', type=str,choices=['Accent','Blues','BrBG','BuGn','BuPu','Dark2','GnBu','Greens','Greys','OrRd','Oranges','PRGn','Paired','Pastel1','Pastel2','PiYG','PuBu','PuBuGn','PuOr','PuRd','Purples','RdBu','RdGy','RdPu','RdYlBu','RdYlGn','Reds','Set1','Set2','Set3','Spectral','YlGn','YlGnBu','YlOrBr','YlOrRd','afmhot','autumn','binary','bone','brg','bwr','cool','copper','flag','gist_earth','gist_gray','gist_heat','gist_ncar','gist_rainbow','gist_yarg','gnuplot','gnuplot2','gray','hot','hsv','jet','ocean','pink','prism','rainbow','seismic','spectral','spring','summer','terrain','winter','browse'])
     parser.add_argument('--labcol', help='Label color', default='#ffffff', type=str)
@@ -595,7 +566,7 @@ if '--shell' in sys.argv:
     args = parser.parse_args()
     cmdLine=True
     kepprf(args.infile,args.plotfile,args.rownum,args.columns,args.rows,args.fluxes,args.border,
-           args.background,args.focus,args.prfdir,args.xtol,args.ftol,args.imscale,args.cmap,
+           args.background,args.focus,args.prfdir,args.xtol,args.ftol,args.fitmethod,args.prfcache,args.imscale,args.cmap,
            args.labcol,args.apercol,args.plot,args.verbose,args.logfile,args.status,cmdLine)
 
 else:
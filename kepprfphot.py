@@ -4,7 +4,7 @@ from matplotlib import pyplot as plt
 import numpy as np
 from astropy.io import fits as pyfits
 import kepio, kepmsg, kepkey, kepplot, kepfit, keparray, kepfunc
-import sys, time, re, math, glob
+import sys, time, re, math
 from scipy.optimize import fmin_powell
 from scipy.interpolate import RectBivariateSpline
 
@@ -12,7 +12,7 @@ from scipy.interpolate import RectBivariateSpline
 # core code
 
 def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir,ranges,
-               tolerance,ftolerance,qualflags,plot,clobber,verbose,logfile,status,cmdLine=False):
+               tolerance,ftolerance,fitmethod,prfcache,qualflags,plot,clobber,verbose,logfile,status,cmdLine=False):
 
 # input arguments
 
@@ -40,6 +40,8 @@ def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir
     call += 'ranges='+ranges+' '
     call += 'xtol='+str(tolerance)+' '
     call += 'ftol='+str(ftolerance)+' '
+    call += 'fitmethod='+fitmethod+' '
+    call += 'prfcache='+prfcache+' '
     quality = 'n'
     if (qualflags): quality = 'y'
     call += 'qualflags='+quality+' '
@@ -133,51 +135,38 @@ def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir
 
     if status == 0:
         try:
-            kepid, channel, skygroup, module, output, quarter, season, \
-                ra, dec, column, row, kepmag, xdim, ydim, barytime, status = \
-                kepio.readTPF(infile,'TIME',logfile,verbose)
+            tpf, status = kepio.openTPF(infile,logfile,verbose)
+            if status == 0:
+                kepid, channel, skygroup, module, output, quarter, season, \
+                    ra, dec, column, row, kepmag, xdim, ydim = tpf.keywords()
+                barytime, status = tpf.readcol('TIME',logfile,verbose)
         except:
             message = 'ERROR -- KEPPRFPHOT: is %s a Target Pixel File? ' % infile
             status = kepmsg.err(logfile,message,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, tcorr, status = \
-            kepio.readTPF(infile,'TIMECORR',logfile,verbose)
+        tcorr, status = tpf.readcol('TIMECORR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, cadno, status = \
-            kepio.readTPF(infile,'CADENCENO',logfile,verbose)
+        cadno, status = tpf.readcol('CADENCENO',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, fluxpixels, status = \
-            kepio.readTPF(infile,'FLUX',logfile,verbose)
+        fluxpixels, status = tpf.readcol('FLUX',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, errpixels, status = \
-            kepio.readTPF(infile,'FLUX_ERR',logfile,verbose)
+        errpixels, status = tpf.readcol('FLUX_ERR',logfile,verbose)
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, poscorr1, status = \
-            kepio.readTPF(infile,'POS_CORR1',logfile,verbose)
+        poscorr1, status = tpf.readcol('POS_CORR1',logfile,verbose)
         if status != 0:
             poscorr1 = np.zeros((len(barytime)),dtype='float32')
             poscorr1[:] = np.nan
             status = 0
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, poscorr2, status = \
-            kepio.readTPF(infile,'POS_CORR2',logfile,verbose)
+        poscorr2, status = tpf.readcol('POS_CORR2',logfile,verbose)
         if status != 0:
             poscorr2 = np.zeros((len(barytime)),dtype='float32')
             poscorr2[:] = np.nan
             status = 0
     if status == 0:
-        kepid, channel, skygroup, module, output, quarter, season, \
-            ra, dec, column, row, kepmag, xdim, ydim, qual, status = \
-            kepio.readTPF(infile,'QUALITY',logfile,verbose)
-    if status == 0:
-        struct, status = kepio.openfits(infile,'readonly',logfile,verbose)
+        qual, status = tpf.readcol('QUALITY',logfile,verbose)
     if status == 0:
+        struct = tpf.struct
         tstart, tstop, bjdref, cadence, status = kepio.timekeys(struct,infile,logfile,verbose,status)
 
 # input file keywords and mask map
@@ -204,50 +193,18 @@ def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir
         print '     Output:     %1s' % output
         print ''
 
-# determine suitable PRF calibration file
+# PRF calibration interpolated to the target position
 
     if status == 0:
-        if int(module) < 10:
-            prefix = 'kplr0'
-        else:
-            prefix = 'kplr'
-        prfglob = prfdir + '/' + prefix + str(module) + '.' + str(output) + '*' + '_prf.fits'
-        try:
-            prffile = glob.glob(prfglob)[0]
-        except:
-            message = 'ERROR -- KEPPRFPHOT: No PRF file found in ' + prfdir
-            status = kepmsg.err(logfile,message,verbose)
+        if prfcache.lower() == 'none':
+            prfcache = ''
+        prf, PRFx, PRFy, cdelt1p, cdelt2p, status = \
+            kepio.readPRF(prfdir,module,output,column,row,logfile,verbose,cachedir=prfcache)
 
-# read PRF images
-
-    if status == 0:
-        prfn = [0,0,0,0,0]
-        crpix1p = np.zeros((5),dtype='float32')
-        crpix2p = np.zeros((5),dtype='float32')
-        crval1p = np.zeros((5),dtype='float32')
-        crval2p = np.zeros((5),dtype='float32')
-        cdelt1p = np.zeros((5),dtype='float32')
-        cdelt2p = np.zeros((5),dtype='float32')
-        for i in range(5):
-            prfn[i], crpix1p[i], crpix2p[i], crval1p[i], crval2p[i], cdelt1p[i], cdelt2p[i], status \
-                = kepio.readPRFimage(prffile,i+1,logfile,verbose)
-        PRFx = np.arange(0.5,np.shape(prfn[0])[1]+0.5)
-        PRFy = np.arange(0.5,np.shape(prfn[0])[0]+0.5)
-        PRFx = (PRFx - np.size(PRFx) / 2) * cdelt1p[0]
-        PRFy = (PRFy - np.size(PRFy) / 2) * cdelt2p[0]
-
-# interpolate the calibrated PRF shape to the target position
+# interpolation function over the PRF
 
     if status == 0:
-        prf = np.zeros(np.shape(prfn[0]),dtype='float32')
-        prfWeight = np.zeros((5),dtype='float32')
-        for i in xrange(5):
-            prfWeight[i] = math.sqrt((column - crval1p[i])**2 + (row - crval2p[i])**2)
-            if prfWeight[i] == 0.0:
-                prfWeight[i] = 1.0e6
-            prf = prf + prfn[i] / prfWeight[i]
-        prf = prf / np.nansum(prf)
-        prf = prf / cdelt1p[0] / cdelt2p[0]
+        splineInterpolation = RectBivariateSpline(PRFx,PRFy,prf)
 
 # location of the data image centered on the PRF image (in PRF pixel units)
 
@@ -263,11 +220,6 @@ def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir
         DATx = np.arange(column,column+xdim)
         DATy = np.arange(row,row+ydim)
 
-# interpolation function over the PRF
-
-    if status == 0:
-        splineInterpolation = RectBivariateSpline(PRFx,PRFy,prf,kx=3,ky=3)
-
 # construct mesh for background model
 
     if status == 0:
@@ -357,54 +309,61 @@ def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir
             except:
                 pass
             args = (fluxpixels[rownum,:],errpixels[rownum,:],DATx,DATy,nsrc,border,xx,yy,PRFx,PRFy,splineInterpolation,
-                    guess,ftol,xtol,focus,background,rownum,80,float(x[i]),float(y[i]),False)
-            guess = PRFfits(args)
+                    guess,ftol,xtol,focus,background,rownum,80,float(x[i]),float(y[i]),False,fitmethod)
+            guess, niter, nfev = PRFfits(args)
             ftol = ftolerance; xtol = tolerance; oldtime = barytime[rownum]
 
-# Fit the time series: multi-processing
+# Fit the time series: multi-processing. One pool lives for the whole run,
+# the PRF spline and static arrays reach each worker once through the pool
+# initializer, and cadences are dispatched in waves of chunks that grow as
+# the fit settles, each chunk warm-started from the latest good fit
 
     if status == 0 and cmdLine:
-        anslist = []
-        cad1 = 0; cad2 = 50
-        for i in range(int(nincl/50) + 1):
-            try:
-                fluxp = fluxpixels[cad1:cad2,:]
-                errp = errpixels[cad1:cad2,:]
-                progress = np.arange(cad1,cad2)
-            except:
-                fluxp = fluxpixels[cad1:nincl,:]
-                errp = errpixels[cad1:nincl,:]
-                progress = np.arange(cad1,nincl)
-            try:
-                args = itertools.izip(fluxp,errp,itertools.repeat(DATx),itertools.repeat(DATy),
-                                      itertools.repeat(nsrc),itertools.repeat(border),itertools.repeat(xx),
-                                      itertools.repeat(yy),itertools.repeat(PRFx),itertools.repeat(PRFy),
-                                      itertools.repeat(splineInterpolation),itertools.repeat(guess),
-                                      itertools.repeat(ftolerance),itertools.repeat(tolerance),
-                                      itertools.repeat(focus),itertools.repeat(background),progress,
-                                      itertools.repeat(np.arange(cad1,nincl)[-1]),
-                                      itertools.repeat(float(x[0])),
-                                      itertools.repeat(float(y[0])),itertools.repeat(True))
-                p = multiprocessing.Pool()
-                model = [0.0]
-                model = p.imap(PRFfits,args,chunksize=1)
-                p.close()
-                p.join()
-                cad1 += 50; cad2 += 50
-                ans = array([array(item) for item in zip(*model)])
-                try:
-                    anslist = np.concatenate((anslist,ans.transpose()),axis=0)
-                except:
-                    anslist = ans.transpose()
-                guess = anslist[-1]
-                ans = anslist.transpose()
-            except:
-                pass
+        ans = np.empty((nincl,len(guess)))
+        nproc = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(nproc,initializer=PRFinit,
+                                    initargs=(DATx,DATy,nsrc,border,xx,yy,PRFx,PRFy,
+                                              splineInterpolation,ftolerance,tolerance,
+                                              focus,background,nincl,float(x[0]),float(y[0]),fitmethod))
+        try:
+            cad1 = 0; ndone = 0; nchunk = 4; nitertot = 0; nfevtot = 0
+            while cad1 < nincl:
+                tasks = []
+                while cad1 < nincl and len(tasks) < nproc:
+                    cad2 = min(cad1 + nchunk,nincl)
+                    oldtime = 0.0
+                    if cad1 > 0: oldtime = barytime[cad1-1]
+                    tasks.append((cad1,fluxpixels[cad1:cad2,:],errpixels[cad1:cad2,:],
+                                  barytime[cad1:cad2],oldtime,guess))
+                    cad1 = cad2
+                proctime = time.time()
+                for c1, fits, errors, niter, nfev in pool.imap_unordered(PRFchunk,tasks):
+                    ans[c1:c1+len(fits)] = fits
+                    nitertot += niter; nfevtot += nfev
+                    for rownum, error in errors:
+                        message = 'WARNING -- KEPPRFPHOT: fit failed at row %d: %s' % (rownum + 1,error)
+                        kepmsg.warn(logfile,message)
+                    ndone += len(fits)
+                    if verbose:
+                        txt  = '\r%3d%% ' % (float(ndone) / float(nincl) * 100.0)
+                        txt += 'nrow = %d ' % ndone
+                        txt += 't = %.1f sec' % (time.time() - proctime)
+                        txt += ' ' * 5
+                        sys.stdout.write(txt)
+                        sys.stdout.flush()
+                fitted = np.isfinite(ans[:cad1]).all(axis=1)
+                if fitted.any():
+                    guess = ans[:cad1][fitted][-1]
+                nchunk = min(nchunk * 2,64)
+        finally:
+            pool.close()
+            pool.join()
+        ans = ans.transpose()
 
 # single processor version
 
     if status == 0 and not cmdLine:
-        oldtime = 0.0; ans = []
+        oldtime = 0.0; ans = []; nitertot = 0; nfevtot = 0
 #        for rownum in xrange(1,10):
         for rownum in xrange(nincl):
             proctime = time.time()
@@ -414,12 +373,20 @@ def kepprfphot(infile,outroot,columns,rows,fluxes,border,background,focus,prfdir
             except:
                 pass
             args = (fluxpixels[rownum,:],errpixels[rownum,:],DATx,DATy,nsrc,border,xx,yy,PRFx,PRFy,splineInterpolation,
-                    guess,ftol,xtol,focus,background,rownum,nincl,float(x[0]),float(y[0]),True)
-            guess = PRFfits(args)
+                    guess,ftol,xtol,focus,background,rownum,nincl,float(x[0]),float(y[0]),True,fitmethod)
+            guess, niter, nfev = PRFfits(args)
             ans.append(guess)
+            nitertot += niter; nfevtot += nfev
             ftol = ftolerance; xtol = tolerance; oldtime = barytime[rownum]
         ans = np.array(ans).transpose()
 
+# report fit cost
+
+    if status == 0:
+        message = '\nKEPPRFPHOT -- %d cadences fit in %d iterations and %d function evaluations' % \
+            (nincl,nitertot,nfevtot)
+        kepmsg.log(logfile,message,verbose)
+
 # unpack the best fit parameters
 
     if status == 0:
@@ -1069,22 +1036,28 @@ def PRFfits(args):
 
 # minimize data and model
 
-    if args[14] and args[15]:
-        argm = (args[2],args[3],DATimg,DATerr,args[4],args[5],args[6],args[7],args[10],args[18],args[19])
-        ans = fmin_powell(kepfunc.PRFwithFocusAndBackground,args[11],args=argm,xtol=args[12],
-                          ftol=args[13],disp=False)
-    elif args[14] and not args[15]:
-        argm = (args[2],args[3],DATimg,DATerr,args[4],args[10],args[18],args[19])
-        ans = fmin_powell(kepfunc.PRFwithFocus,args[11],args=argm,xtol=args[12],
-                          ftol=args[13],disp=False)
-    elif args[15] and not args[14]:
-        argm = (args[2],args[3],DATimg,DATerr,args[4],args[5],args[6],args[7],args[10],args[18],args[19])
-        ans = fmin_powell(kepfunc.PRFwithBackground,args[11],args=argm,xtol=args[12],
-                          ftol=args[13],disp=False)
+    if args[21] == 'lm':
+        ans, niter, nfev = kepfit.fitPRFlsq(args[11],args[2],args[3],DATimg,DATerr,args[4],args[5],
+                                            args[6],args[7],args[10],args[14],args[15],
+                                            args[12],args[13],args[18],args[19])
     else:
-        argm = (args[2],args[3],DATimg,DATerr,args[4],args[10],args[18],args[19])
-        ans = fmin_powell(kepfunc.PRF,args[11],args=argm,xtol=args[12],
-                          ftol=args[13],disp=False)
+        if args[14] and args[15]:
+            argm = (args[2],args[3],DATimg,DATerr,args[4],args[5],args[6],args[7],args[10],args[18],args[19])
+            out = fmin_powell(kepfunc.PRFwithFocusAndBackground,args[11],args=argm,xtol=args[12],
+                              ftol=args[13],disp=False,full_output=True)
+        elif args[14] and not args[15]:
+            argm = (args[2],args[3],DATimg,DATerr,args[4],args[10],args[18],args[19])
+            out = fmin_powell(kepfunc.PRFwithFocus,args[11],args=argm,xtol=args[12],
+                              ftol=args[13],disp=False,full_output=True)
+        elif args[15] and not args[14]:
+            argm = (args[2],args[3],DATimg,DATerr,args[4],args[5],args[6],args[7],args[10],args[18],args[19])
+            out = fmin_powell(kepfunc.PRFwithBackground,args[11],args=argm,xtol=args[12],
+                              ftol=args[13],disp=False,full_output=True)
+        else:
+            argm = (args[2],args[3],DATimg,DATerr,args[4],args[10],args[18],args[19])
+            out = fmin_powell(kepfunc.PRF,args[11],args=argm,xtol=args[12],
+                              ftol=args[13],disp=False,full_output=True)
+        ans = out[0]; niter = out[3]; nfev = out[4]
 
 # print progress
 
@@ -1096,7 +1069,44 @@ def PRFfits(args):
         sys.stdout.write(txt)
         sys.stdout.flush()
 
-    return ans
+    return ans, niter, nfev
+
+# -----------------------------------------------------------
+# static PRF fit data, shipped once to each worker process
+
+prfdata = {}
+
+def PRFinit(*args):
+
+    prfdata['static'] = args
+
+# -----------------------------------------------------------
+# fit a contiguous chunk of cadences, warm-starting each fit from the last
+
+def PRFchunk(args):
+
+    cad1, fluxp, errp, times, oldtime, guess = args
+    DATx, DATy, nsrc, border, xx, yy, PRFx, PRFy, splineInterpolation, \
+        ftolerance, tolerance, focus, background, nincl, col, row, fitmethod = prfdata['static']
+    ans = []; errors = []; nitertot = 0; nfevtot = 0
+    for n in range(len(fluxp)):
+        if times[n] - oldtime > 0.5:
+            ftol = 1.0e-10; xtol = 1.0e-10
+        else:
+            ftol = ftolerance; xtol = tolerance
+        try:
+            fit, niter, nfev = PRFfits((fluxp[n],errp[n],DATx,DATy,nsrc,border,xx,yy,PRFx,PRFy,
+                                        splineInterpolation,guess,ftol,xtol,focus,background,
+                                        cad1+n,nincl,col,row,False,fitmethod))
+            guess = fit
+            nitertot += niter; nfevtot += nfev
+        except Exception as e:
+            fit = np.ones((len(guess))) * np.nan
+            errors.append((cad1 + n,str(e)))
+        ans.append(fit)
+        oldtime = times[n]
+
+    return cad1, ans, errors, nitertot, nfevtot
 
 # -----------------------------------------------------------
 # main
@@ -1119,6 +1129,9 @@ if '--shell' in sys.argv:
     parser.add_argument('--ranges', default='0,0', help='Time ranges to fit', dest='ranges', type=str)
     parser.add_argument('--xtol', default=1.0e-4, help='Fit parameter tolerance', dest='tolerance', type=float)
     parser.add_argument('--ftol', default=1.0e-2, help='Fit minimization tolerance', dest='ftolerance', type=float)
+    parser.add_argument('--fitmethod', default='powell', help='PRF fit minimizer', type=str,
+                        choices=['powell','lm'])
+    parser.add_argument('--prfcache', default='', help='Folder caching interpolated PRFs between runs', type=str)
     parser.add_argument('--qualflags', action='store_true', help='Fit data that have quality flags?', default=False)
     parser.add_argument('--plot', action='store_true', help='Plot fit results?', default=False)
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?', default=False)
@@ -1130,7 +1143,7 @@ if '--shell' in sys.argv:
     cmdLine=True
     kepprfphot(args.infile,args.outroot,args.columns,args.rows,args.fluxes,args.border,
                args.background,args.focus,args.prfdir,args.ranges,args.tolerance,
-               args.ftolerance,args.qualflags,args.plot,args.clobber,args.verbose,
+               args.ftolerance,args.fitmethod,args.prfcache,args.qualflags,args.plot,args.clobber,args.verbose,
                args.logfile,args.status,cmdLine)
 
 else:
@@ -2,37 +2,43 @@
 
 from pyraf import iraf
 import numpy, sys
-from scipy.interpolate import interp1d
-from scipy import integrate
+from scipy.interpolate import make_interp_spline
 from math import *
 import kepmsg
 
 # -----------------------------------------------------------
-# rebin cadence data
+# rebin cadence data, conserving flux. Each bin is the mean of the
+# interpolated flux across the bin, taken from the cumulative integral of the
+# interpolation function at the bin bounds
 
 # method -- the method of interpolation, options are:
 #       'linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic' or
 #	 an integer (i), which interpolates using a spline of order (i)
 
-# interpm -- method of performing the integration
-#	 can either be 'quad' or 'romberg'
+# error -- optional 1-sigma flux errors. Binned errors are propagated through
+#       the fraction of each bin closer to every cadence than to its neighbours
 
-def rebin(date,flux,logfile,verbose,nbins=None,binwidth=None,ownbins=None,method='linear',interpm='quad'):
+def rebin(date,flux,logfile,verbose,nbins=None,binwidth=None,ownbins=None,method='linear',error=None):
 
     status = 0
+    bdate = []
     bflux = []
+    berror = None
 
 # catch wrong sized input arrays
 
     if numpy.shape(date) != numpy.shape(flux):
         txt = 'ERROR -- KEPREBIN.REBIN: Time and flux arrays are different lengths'
         status = kepmsg.err(logfile,txt,verbose)
+    if status == 0 and error is not None and numpy.shape(error) != numpy.shape(flux):
+        txt = 'ERROR -- KEPREBIN.REBIN: Flux and error arrays are different lengths'
+        status = kepmsg.err(logfile,txt,verbose)
 
 # catch multipe rebinning methods
 
     if status == 0:
-	i = 0
-	for binMethod in [nbins,binwidth,ownbins]:
+        i = 0
+        for binMethod in [nbins,binwidth,ownbins]:
             if binMethod is None:
                 i += 1
         if i != 2:
@@ -41,114 +47,115 @@ def rebin(date,flux,logfile,verbose,nbins=None,binwidth=None,ownbins=None,method
 
 # catch bad choice of interpolation method
 
-    if status == 0 and not method in [i for i in ['linear','nearest', 'zero', 'slinear',
-                                                  'quadratic' or 'cubic']]:
+    if status == 0 and method not in ['linear','nearest','zero','slinear','quadratic','cubic']:
         try:
-            testcase =  "Integer %d" % int(method)
+            method = int(method)
         except:
             txt = 'ERROR -- KEPREBIN.REBIN: Method needs to be one of: linear, nearest, zero, slinear, '
             txt += 'quadratic, cubic or an integer (i), which interpolates using a  spline of order (i)'
-        status = kepmsg.err(logfile,txt,verbose)
-
-# catch bad choice of integration method
-
-    if status == 0 and not interpm in [i for i in ['quad','romberg']]:
-        txt = 'ERROR -- KEPREBIN.REBIN: Integration method must either be quad or romberg'
-        status = kepmsg.err(logfile,txt,verbose)
+            status = kepmsg.err(logfile,txt,verbose)
 
-# perform the interpolation on the data
+# time-ordered, finite data
 
     if status == 0:
-        try:
-            intpl = scipy.interpolate.interp1d(date,flux,kind=method)
-        except:
-            txt = 'ERROR -- KEPREBIN.REBIN: Cannot define interpolation function with scipy.interpolate.interp1d'
+        date = numpy.asarray(date,dtype='float64')
+        flux = numpy.asarray(flux,dtype='float64')
+        good = numpy.isfinite(date) & numpy.isfinite(flux)
+        if error is not None:
+            error = numpy.asarray(error,dtype='float64')
+            good &= numpy.isfinite(error)
+        order = numpy.argsort(date[good],kind='mergesort')
+        date = date[good][order]
+        flux = flux[good][order]
+        if error is not None:
+            error = error[good][order]
+        if len(date) < 2:
+            txt = 'ERROR -- KEPREBIN.REBIN: Fewer than two finite data points to rebin'
             status = kepmsg.err(logfile,txt,verbose)
 
 # calculate bin bounds, should be of length nbins+1
 
     if status == 0:
-	if binwidth is not None:
+        if binwidth is not None:
             bounds = numpy.arange(date[0],date[-1] + 1.0e-10,binwidth)
-            bdate = numpy.arange(date[0] + 0.5 * binwidth,date[-1] - 0.5 * binwidth,binwidth)
-	elif nbins is not None:
-            bounds = numpy.arange(date[0],date[-1] + 1.0e-10,(date[-1] - date[0]) / nbins)
-            bdate = numpy.arange(date[0] + 0.5 * ((date[-1] - date[0]) / nbins), \
-                                     date[-1],(date[-1] - date[0]) / nbins)
-	elif ownbins is not None:
-            bounds = ownbins
-            bdate = numpy.zeros(len(bounds) - 1)
-            for i in range(len(bdate)):
-                bdate[i] = bounds[i] + (0.5 * (bounds[i+1] - bounds[i]))
-        minbin = []
-	for i in range(1,len(bounds)):
-            minbin.append(bounds[i] - bounds[i-1])
-        mincad = []
-	for i in range(1,len(date)):
-            mincad.append(date[i] - date[i-1])
-	
-# iterate over the bins starting with bounds[1]
+        elif nbins is not None:
+            bounds = numpy.linspace(date[0],date[-1],nbins + 1)
+        elif ownbins is not None:
+            bounds = numpy.asarray(ownbins,dtype='float64')
+        if len(bounds) < 2 or (numpy.diff(bounds) <= 0.0).any():
+            txt = 'ERROR -- KEPREBIN.REBIN: Bin bounds must be increasing and define at least one bin'
+            status = kepmsg.err(logfile,txt,verbose)
+        elif bounds[0] < date[0] or bounds[-1] > date[-1]:
+            txt = 'ERROR -- KEPREBIN.REBIN: Bin bounds lie outside the range of the data'
+            status = kepmsg.err(logfile,txt,verbose)
+
+# cells of data closer to each cadence than to its neighbours
+
+    if status == 0:
+        cells = numpy.concatenate(([date[0]],0.5 * (date[1:] + date[:-1]),[date[-1]]))
+
+# cumulative integral of the interpolation function at the bin bounds
+
+    if status == 0:
+        if method in ['linear','slinear']:
+            integral = cumlinear(date,flux,bounds)
+        elif method == 'nearest':
+            integral = cumstep(cells,flux,bounds)
+        elif method == 'zero':
+            integral = cumstep(date,flux[:-1],bounds)
+        else:
+            if method == 'quadratic':
+                method = 2
+            if method == 'cubic':
+                method = 3
+            try:
+                spline = make_interp_spline(date,flux,k=method).antiderivative()
+                integral = spline(bounds)
+            except:
+                txt = 'ERROR -- KEPREBIN.REBIN: Cannot define a spline of order ' + str(method)
+                status = kepmsg.err(logfile,txt,verbose)
+
+# mean flux within each bin
 
     if status == 0:
-	for i in range(1,len(bounds)):
-            bin = []
-            t = []
-            extrabitHigh = 0.0
-            extrabitLow = 0.0
-            eb1 = None
-            eb2 = None
-		
-# iterate over the length of the flux array
-
-            for j in range(len(flux)):
-
-# catch all date bins within the bounds of the bin
-
-                if date[j] >= bounds[i-1] and date[j] < bounds[i]:
-                    bin.append(flux[j])
-                    t.append(j)
-		try:
-                    tmin = min(t)
-                    tmax = max(t)
-		
-# deal with the bits either side of date[tmin] and date[tmax], first the bit between date[tmax] and bounds[i]
-		
-                    if bounds[i] > date[tmax] + 1.0e-6:
-                        if interpm == 'quad':
-                            extrabitHigh = scipy.integrate.quad(intpl,date[tmax],bounds[i])[0]
-                        elif interpm == 'romberg':
-                            extrabitHigh = scipy.integrate.romberg(intpl,date[tmax],bounds[i])
-
-# now the bit between bound[i-1] and t[min]
-
-                    if bounds[i-1] < date[tmin] - 1.0e-6:
-                        if interpm == 'quad':
-                            extrabitLow = scipy.integrate.quad(intpl,bounds[i-1],date[tmin])[0]
-                        elif interpm == 'romberg':
-                            extrabitLow = scipy.integrate.romberg(intpl,bounds[i-1],date[tmin])
-					
-# scale the extrabits as if they were the size of a full bin, catch error if there is no extrabit
-
-                    try:
-                        eb1 = (extrabitHigh / (float(bounds[i] - date[tmax])))
-                        bin.append(eb1)
-                    except ZeroDivisionError:
-                        pass
-                    try:
-                        eb2 = (extrabitLow / (float(date[tmin] - bounds[i-1])))
-                        bin.append(eb2)
-                    except ZeroDivisionError:
-                        pass
-		
-                except ValueError:
-                    if interpm == 'quad':
-                        totbin = scipy.integrate.quad(intpl,bounds[i-1],bounds[i])[0]
-                    elif interpm == 'romberg':
-                        totbin =  integrate.romberg(intpl,bounds[i-1],bounds[i])
-                    eb = (totbin / (float(bounds[i] - bounds[i-1])))
-                    bin.append(eb)
-		
-                binflux = numpy.mean(bin)
-		bflux.append(binflux)
-
-    return bdate, bflux
+        width = numpy.diff(bounds)
+        bdate = bounds[:-1] + 0.5 * width
+        bflux = numpy.diff(integral) / width
+
+# binned errors, from the overlap of each bin with the cadence cells
+
+    if status == 0 and error is not None:
+        weight = numpy.diff(cells) * error
+        cumvar = numpy.concatenate(([0.0],numpy.cumsum(weight**2)))
+        icell = numpy.clip(numpy.searchsorted(cells,bounds,'right') - 1,0,len(date) - 1)
+        ilo = icell[:-1]
+        ihi = icell[1:]
+        lo = (cells[ilo + 1] - bounds[:-1]) * error[ilo]
+        hi = (bounds[1:] - cells[ihi]) * error[ihi]
+        var = lo**2 + hi**2 + cumvar[ihi] - cumvar[numpy.minimum(ilo + 1,ihi)]
+        var = numpy.where(ilo == ihi,(width * error[ilo])**2,var)
+        berror = numpy.sqrt(var) / width
+
+    return bdate, bflux, berror, status
+
+# -----------------------------------------------------------
+# cumulative integral of a linear interpolation function from date[0]
+
+def cumlinear(date,flux,x):
+
+    step = numpy.diff(date)
+    cum = numpy.concatenate(([0.0],numpy.cumsum(0.5 * (flux[1:] + flux[:-1]) * step)))
+    k = numpy.clip(numpy.searchsorted(date,x,'right') - 1,0,len(date) - 2)
+    dx = x - date[k]
+    slope = (flux[k+1] - flux[k]) / step[k]
+    return cum[k] + flux[k] * dx + 0.5 * slope * dx**2
+
+# -----------------------------------------------------------
+# cumulative integral of a step function from edges[0], equal to value[i]
+# between edges[i] and edges[i+1]
+
+def cumstep(edges,value,x):
+
+    cum = numpy.concatenate(([0.0],numpy.cumsum(value * numpy.diff(edges))))
+    k = numpy.clip(numpy.searchsorted(edges,x,'right') - 1,0,len(value) - 1)
+    return cum[k] + value[k] * (x - edges[k])
@@ -22,6 +22,17 @@ def sumerr(a):
     err = sqrt(work)
     return err
 
+# -----------------------------------------------------------
+# sum of errors in quadrature along the last axis of an array, accumulated
+# in the same order as sumerr
+
+def sumerrs(a):
+
+    a = numpy.asarray(a,dtype='float64')
+    if a.shape[-1] == 0:
+        return numpy.zeros(a.shape[:-1])
+    return numpy.sqrt(numpy.cumsum(a**2,axis=-1)[...,-1])
+
 # -----------------------------------------------------------
 # calculate mean of numeric list
 
@@ -116,9 +127,7 @@ def rms(array1,array2,logfile,verbose):
         message += 'Array1 = ' + str(len(array1)) + ', array2 = ' + str(len(array2))
         status = kepmsg.err(logfile,message,verbose)
     if (status == 0):
-        for i in range(len(array1)):
-            sigma += (array1[i] - array2[i])**2
-        sigma = math.sqrt(sigma / len(array1))
+        sigma = math.sqrt(numpy.sum((numpy.asarray(array1) - numpy.asarray(array2))**2) / len(array1))
     return sigma, status
 
 # -----------------------------------------------------------
@@ -387,18 +396,151 @@ def savitzky_golay(y,window_size,order,deriv=0):
 
 
 # -----------------------------------------------------------
+# bounds of the running windows of width wid centred on each time stamp, in
+# ascending order. Data i1[i]:i2[i] lie strictly within wid/2 of time[i]
+
+def runningbounds(time,wid):
+
+    time = numpy.asarray(time,dtype='float64')
+    i1 = numpy.searchsorted(time,time - wid / 2,'right')
+    i2 = numpy.searchsorted(time,time + wid / 2,'left')
+    return i1, i2
+
+# -----------------------------------------------------------
+# running mean and standard deviation within windows of width wid, from
+# cumulative sums and sums of squares about the median of the data. wid is
+# a width or a list of widths, when one row is returned per width. use
+# optionally masks the data included in the statistics
+
+def running_mean_std(time,flux,wid,use=None):
+
+    flux = numpy.asarray(flux,dtype='float64')
+    zero = 0.0
+    if len(flux) > 0:
+        zero = numpy.median(flux)
+    work = flux - zero
+    count = numpy.arange(len(flux) + 1)
+    if use is not None:
+        work = numpy.where(use,work,0.0)
+        count = numpy.concatenate(([0],numpy.cumsum(use)))
+    s1 = numpy.concatenate(([0.0],numpy.cumsum(work)))
+    s2 = numpy.concatenate(([0.0],numpy.cumsum(work**2)))
+    runmean = []; runstd = []
+    for width in numpy.atleast_1d(wid):
+        i1, i2 = runningbounds(time,width)
+        n = count[i2] - count[i1]
+        mean = (s1[i2] - s1[i1]) / n
+        runmean.append(mean + zero)
+        runstd.append(numpy.sqrt(numpy.maximum((s2[i2] - s2[i1]) / n - mean**2,0.0)))
+    if numpy.ndim(wid) == 0:
+        return runmean[0], runstd[0]
+    return numpy.array(runmean), numpy.array(runstd)
+
+# -----------------------------------------------------------
+# calculate running fractional standard deviation across the array flux
+# within a window of width wid, or one row per width for a list of widths.
+# With sig, each window is sigma-clipped on its own: data further than sig
+# standard deviations from the window median are excluded from that window's
+# standard deviation. Clipping is done window by window, so only the
+# unclipped statistics scale as O(N)
+
 def running_frac_std(time,flux,wid,sig=None):
 
-# calculate running fractional standard deviation across the array flux within a window of width wid
+    flux = numpy.asarray(flux,dtype='float64')
+    runmean, runstd = running_mean_std(time,flux,wid)
+    if sig is not None:
+        widths = numpy.atleast_1d(wid)
+        runstd = numpy.atleast_2d(runstd)
+        for i in range(len(widths)):
+            i1, i2 = runningbounds(time,widths[i])
+            for j in range(len(flux)):
+                work = flux[i1[j]:i2[j]]
+                work = work[numpy.abs(work - numpy.median(work)) <= sig * runstd[i,j]]
+                runstd[i,j] = work.std()
+        if numpy.ndim(wid) == 0:
+            runstd = runstd[0]
+
+    return runstd / runmean
 
-    hwid = wid / 2
-    runstd = zeros(len(flux))
-    for i in range(len(time)):
-        valsinwid = flux[logical_and(time < time[i] + hwid, time > time[i] - hwid)]
-        if sig is None:
-            runstd[i] = std(valsinwid) / mean(valsinwid)
-        else:
-            runstd[i] = std(sig_clip(valsinwid,sig)) / mean(valsinwid)
+# -----------------------------------------------------------
+# phase of each time stamp folded upon a period. An array of trial periods
+# returns one row of phases per period
+
+def foldphase(time,period,phasezero):
 
-    return array(runstd)
+    date = numpy.asarray(time,dtype='float64') - phasezero
+    cycles = date / numpy.asarray(period,dtype='float64')[...,None]
+    return cycles - numpy.floor(cycles)
 
+# -----------------------------------------------------------
+# bin phased data into nbins equal phase bins. data and error hold one row
+# per data column. binmethod is mean, median or sigclip, where sigclip is the
+# iterative sigma-clipped weighted mean of kepfit.lsqclip with a poly0 function.
+# Returns the centers of the populated bins, the binned data and the binned
+# errors, which are the errors of the mean for every method
+
+def binphase(phase,data,error,nbins,binmethod,threshold,niter):
+
+    phase = numpy.asarray(phase)
+    data = numpy.atleast_2d(data)
+    error = numpy.atleast_2d(error)
+
+# sort phases and find the first data point of every populated bin
+
+    order = numpy.argsort(phase,kind='mergesort')
+    dt = 1.0 / nbins
+    edges = numpy.searchsorted(phase[order],numpy.arange(nbins + 1) * dt)
+    counts = numpy.diff(edges)
+    full = counts > 0
+    phasebin = (numpy.arange(nbins)[full] + 0.5) * dt
+    if not full.any():
+        empty = numpy.zeros((len(data),0))
+        return phasebin, empty, empty
+    npts = counts[full]
+    start = edges[:-1][full] - edges[0]
+    ibin = numpy.repeat(numpy.arange(len(npts)),npts)
+    order = order[edges[0]:edges[-1]]
+    data = numpy.array(data[:,order],dtype='float64')
+    error = numpy.array(error[:,order],dtype='float64')
+
+# error of the mean and mean ignoring NaNs within each bin
+
+    binerr = numpy.sqrt(numpy.add.reduceat(error**2,start,axis=1)) / npts
+    finite = numpy.isfinite(data)
+    binned = (numpy.add.reduceat(numpy.where(finite,data,0.0),start,axis=1) /
+              numpy.add.reduceat(finite,start,axis=1,dtype='int'))
+
+# median of bins with three or more points, taking the upper of the two
+# middle values as kepstat.median does
+
+    if binmethod == 'median':
+        srt = numpy.lexsort((data,numpy.broadcast_to(ibin,data.shape)))
+        middle = data[numpy.arange(len(data))[:,None],srt][:,start + npts // 2]
+        binned = numpy.where(npts >= 3,middle,binned)
+
+# sigma-clipped weighted mean, iterating each bin until no more points are
+# rejected or fewer than two points remain
+
+    if binmethod == 'sigclip':
+        weight = 1.0 / error**2
+        mask = numpy.ones(data.shape,dtype='bool')
+        active = numpy.repeat((npts > 1)[None,:],len(data),axis=0)
+        binned = (numpy.add.reduceat(weight * data,start,axis=1) /
+                  numpy.add.reduceat(weight,start,axis=1))
+        for i in range(niter):
+            if not active.any():
+                break
+            fit = (numpy.add.reduceat(numpy.where(mask,weight * data,0.0),start,axis=1) /
+                   numpy.add.reduceat(numpy.where(mask,weight,0.0),start,axis=1))
+            binned = numpy.where(active,fit,binned)
+            resid = data - fit[:,ibin]
+            nused = numpy.add.reduceat(mask,start,axis=1,dtype='int')
+            sigma = numpy.sqrt(numpy.add.reduceat(numpy.where(mask,resid**2,0.0),start,axis=1) / nused)
+            limit = threshold * sigma[:,ibin]
+            keep = mask & (resid < limit) & (-resid < limit)
+            keep = numpy.where(active[:,ibin],keep,mask)
+            changed = numpy.add.reduceat(mask & ~keep,start,axis=1,dtype='int') > 0
+            mask = keep
+            active = active & changed & (numpy.add.reduceat(mask,start,axis=1,dtype='int') > 1)
+
+    return phasebin, binned, binerr
@@ -78,46 +78,56 @@ def kepstddev(infile,outfile,datacol,timescale,clobber,verbose,logfile,status,cm
     if status == 0:
         table, status = kepio.readfitstab(infile,instr[1],logfile,verbose)
 
+# CDPP timescales
+
+    if status == 0:
+        try:
+            timescales = [float(work) for work in str(timescale).split(',')]
+        except:
+            message = 'ERROR -- KEPSTDDEV: timescale must be a number or comma-separated list of numbers'
+            status = kepmsg.err(logfile,message,verbose)
+    if status == 0:
+        for work in timescales:
+            if work < 1.0 or work > 48.0:
+                message = 'ERROR -- KEPSTDDEV: timescale %s hr is outside the range 1.0-48.0 hr' % work
+                status = kepmsg.err(logfile,message,verbose)
+                break
+
 # filter input data table
 
     if status == 0:
-        work1 = np.array([table.field('time'), table.field(datacol)])
-        work1 = np.rot90(work1,3)
-        work1 = work1[~np.isnan(work1).any(1)]
+        good = np.isfinite(table.field('time')) & np.isfinite(table.field(datacol))
 
 # read table columns
 
     if status == 0:
-        intime = work1[:,1] + bjdref
-        indata = work1[:,0]
+        intime = np.array(table.field('time')[good],dtype='float64') + bjdref
+        indata = np.array(table.field(datacol)[good],dtype='float64')
 
-# calculate STDDEV in units of ppm
+# calculate STDDEV in units of ppm, one row per timescale
 
     if status == 0:
-        stddev = running_frac_std(intime,indata,timescale/24) * 1.0e6
+        stddev = running_frac_std(intime,indata,np.array(timescales) / 24) * 1.0e6
         astddev = np.std(indata) * 1.0e6
-        cdpp = stddev / math.sqrt(timescale * 3600.0 / cadence)
+        cdpp = stddev / np.sqrt(np.array(timescales)[:,None] * 3600.0 / cadence)
         print '\nStandard deviation = %d ppm' % astddev
 
-# filter cdpp
+# filter cdpp, replacing outliers with the previous value
 
     if status == 0:
-        for i in range(len(cdpp)):
-            if cdpp[i] > np.median(cdpp) * 10.0: cdpp[i] = cdpp[i-1]
+        for i in range(len(timescales)):
+            work1 = np.arange(cdpp.shape[1])
+            work1[cdpp[i] > np.median(cdpp[i]) * 10.0] = 0
+            cdpp[i] = cdpp[i][np.maximum.accumulate(work1)]
 
-# calculate median STDDEV
+# calculate median and RMS STDDEV
 
     if status == 0:
-        med = np.median(cdpp[:])
-        medcdpp = np.ones((len(cdpp)),dtype='float32') * med
-        print 'Median %.1fhr CDPP = %d ppm' % (timescale, med)
-
-# calculate RMS STDDEV
-
-    if status == 0:
-        rms, status = kepstat.rms(cdpp,np.zeros(len(stddev)),logfile,verbose)
-        rmscdpp = np.ones((len(cdpp)),dtype='float32') * rms
-        print '   RMS %.1fhr CDPP = %d ppm\n' % (timescale, rms)
+        medcdpp = np.median(cdpp,axis=1)
+        rmscdpp = np.sqrt(np.mean(cdpp**2,axis=1))
+        for i in range(len(timescales)):
+            print 'Median %.1fhr CDPP = %d ppm' % (timescales[i], medcdpp[i])
+            print '   RMS %.1fhr CDPP = %d ppm\n' % (timescales[i], rmscdpp[i])
 
 # clean up x-axis unit
 
@@ -129,16 +139,18 @@ def kepstddev(infile,outfile,datacol,timescale,clobber,verbose,logfile,status,cm
 # clean up y-axis units
 
     if status == 0:
-        pout = copy(cdpp)
-        nrm = math.ceil(math.log10(np.median(cdpp))) - 1.0
-        ylab = '%.1fhr $\sigma$ (ppm)' % timescale
+        pout = copy(cdpp[0])
+        nrm = math.ceil(math.log10(np.median(cdpp[0]))) - 1.0
+        ylab = '%.1fhr $\sigma$ (ppm)' % timescales[0]
+        if len(timescales) > 1:
+            ylab = '%shr $\sigma$ (ppm)' % ','.join(['%.1f' % work for work in timescales])
 
 # data limits
 
         xmin = ptime.min()
         xmax = ptime.max()
-        ymin = pout.min()
-        ymax = pout.max()
+        ymin = cdpp.min()
+        ymax = cdpp.max()
         xr = xmax - xmin
         yr = ymax - ymin
         ptime = np.insert(ptime,[0],[ptime[0]])
@@ -171,20 +183,11 @@ def kepstddev(infile,outfile,datacol,timescale,clobber,verbose,logfile,status,cm
 
 # plot flux vs time
 
-        ltime = np.array([],dtype='float64')
-        ldata = np.array([],dtype='float32')
-        dt = 0
-        work1 = 2.0 * cadence / 86400
-        for i in range(1,len(ptime)-1):
-            dt = ptime[i] - ptime[i-1]
-            if dt < work1:
-                ltime = np.append(ltime,ptime[i])
-                ldata = np.append(ldata,pout[i])
-            else:
-                plt.plot(ltime,ldata,color='#0000ff',linestyle='-',linewidth=1.0)
-                ltime = np.array([],dtype='float64')
-                ldata = np.array([],dtype='float32')
-        plt.plot(ltime,ldata,color='#0000ff',linestyle='-',linewidth=1.0)
+        gaps = np.where(np.diff(ptime[1:-1]) >= 2.0 * cadence / 86400)[0] + 1
+        colors = ['#0000ff','#ff0000','#008000','#ff00ff','#00c0c0','#808000']
+        for i in range(len(timescales)):
+            for ltime, ldata in zip(np.split(ptime[1:-1],gaps),np.split(cdpp[i],gaps)):
+                plt.plot(ltime,ldata,color=colors[i % len(colors)],linestyle='-',linewidth=1.0)
 
 # plot the fill color below data time series, with no data gaps
 
@@ -215,28 +218,22 @@ def kepstddev(infile,outfile,datacol,timescale,clobber,verbose,logfile,status,cm
 # add NaNs back into data
 
     if status == 0:
-        n = 0
-        work1 = np.array([],dtype='float32')
-        instr, status = kepio.openfits(infile,'readonly',logfile,verbose)
-        table, status = kepio.readfitstab(infile,instr[1],logfile,verbose)
-        for i in range(len(table.field(0))):
-            if isfinite(table.field('time')[i]) and isfinite(table.field(datacol)[i]):
-                work1 = np.append(work1,cdpp[n])
-                n += 1
-            else:
-                work1 = np.append(work1,nan)
-
-# write output file
+        work1 = np.zeros((len(timescales),len(good)),dtype='float32') + np.nan
+        work1[:,good] = cdpp
+
+# write output file, one CDPP column per timescale
+
     if status == 0:
-        status = kepkey.new('MCDPP%d' % (timescale * 10.0),medcdpp[0],
-                            'Median %.1fhr CDPP (ppm)' % timescale,
-                            instr[1],outfile,logfile,verbose)
-        status = kepkey.new('RCDPP%d' % (timescale * 10.0),rmscdpp[0],
-                            'RMS %.1fhr CDPP (ppm)' % timescale,
-                            instr[1],outfile,logfile,verbose)
-        colname = 'CDPP_%d' % (timescale * 10)
-        col1 = pyfits.Column(name=colname,format='E13.7',array=work1)
-        cols = instr[1].data.columns + col1
+        cols = instr[1].data.columns
+        for i in range(len(timescales)):
+            status = kepkey.new('MCDPP%d' % (timescales[i] * 10.0),float(medcdpp[i]),
+                                'Median %.1fhr CDPP (ppm)' % timescales[i],
+                                instr[1],outfile,logfile,verbose)
+            status = kepkey.new('RCDPP%d' % (timescales[i] * 10.0),float(rmscdpp[i]),
+                                'RMS %.1fhr CDPP (ppm)' % timescales[i],
+                                instr[1],outfile,logfile,verbose)
+            colname = 'CDPP_%d' % (timescales[i] * 10)
+            cols = cols + pyfits.Column(name=colname,format='E13.7',array=work1[i])
         instr[1] = pyfits.BinTableHDU.from_columns(cols,header=instr[1].header)
         instr.writeto(outfile)
 # comment keyword in output file
@@ -267,7 +264,8 @@ if '--shell' in sys.argv:
     parser.add_argument('infile', help='Name of input FITS file', type=str)
     parser.add_argument('outfile', help='Name of output FITS file', type=str)
     parser.add_argument('--datacol', default='PDCSAP_FLUX', help='Name of data column to plot', type=str)
-    parser.add_argument('--timescale', '-t', default=6.5, help='CDPP timescale', dest='timescale', type=float)
+    parser.add_argument('--timescale', '-t', default='6.5', help='CDPP timescale or comma-separated list of timescales [hours]',
+                        dest='timescale', type=str)
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?')
     parser.add_argument('--verbose', action='store_true', help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file', default='kepstddev.log', dest='logfile', type=str)
@@ -60,7 +60,7 @@ def get_chi2(obs,model,error):
 
     return chi2
 
-def fit_tmod(params, LDparams, time, flux, error, fixed_dict, guess_params):
+def fit_tmod(params, LDparams, time, flux, error, fixed_dict, guess_params, tabulate=False):
     period_d, rprs, T0, Ecc, ars, inc, omega, sec, fluxoffset = params
 
     #fix things and stop params going crazy
@@ -92,13 +92,13 @@ def fit_tmod(params, LDparams, time, flux, error, fixed_dict, guess_params):
         return 10**(12.)
 
     mod_output = tmod.lightcurve(time, period_d, rprs, T0, Ecc, ars, inc,
-                                 omega, LDparams, sec)
+                                 omega, LDparams, sec, tabulate)
     model = mod_output
     chi2 = get_chi2(flux, model, error)
 
     return chi2
 
-def fit_tmod2(params,LDparams,time,flux,error,fixed_dict,guess_params):
+def fit_tmod2(params,LDparams,time,flux,error,fixed_dict,guess_params,tabulate=False):
     period_d,rprs,T0, Ecc,ars, inc, omega, sec, fluxoffset = params
 
     #fix things and stop params going crazy
@@ -129,7 +129,7 @@ def fit_tmod2(params,LDparams,time,flux,error,fixed_dict,guess_params):
     if omega > np.pi * 2.:
         return 10**(12.)
 
-    mod_output = tmod.lightcurve(time,period_d,rprs,T0,Ecc,ars, inc, omega, LDparams, sec)
+    mod_output = tmod.lightcurve(time,period_d,rprs,T0,Ecc,ars, inc, omega, LDparams, sec, tabulate)
     model = mod_output
 
     chi2 = get_chi2(flux,model,error)
@@ -251,9 +251,9 @@ def keptransit(inputfile, outputfile, datacol, errorcol, periodini_d,
                rprsini, T0ini, Eccini, arsini, incini, omegaini,
                LDparams, secini,fixperiod, fixrprs, fixT0, fixEcc, fixars,
                fixinc, fixomega, fixsec, fixfluxoffset, removeflaggeddata,
-               ftol=0.0001, fitter='nothing', norm=False, clobber=False,
-               plot=True, verbose=0, logfile='logfile.dat', status=0,
-               cmdLine=False):
+               ftol=0.0001, fitter='nothing', norm=False, tabulate=False,
+               clobber=False, plot=True, verbose=0, logfile='logfile.dat',
+               status=0, cmdLine=False):
     """
     tmod.lightcurve(xdata,period,rprs,T0,Ecc,ars, incl, omega, ld, sec)
 
@@ -311,6 +311,7 @@ def keptransit(inputfile, outputfile, datacol, errorcol, periodini_d,
     call += 'ftol='+str(ftol)+' '
     call += 'fitter='+str(fitter)+' '
     call += 'norm='+str(norm)+' '
+    call += 'tabulate='+str(tabulate)+' '
 
     plotit = 'n'
     if plot: plotit = 'y'
@@ -406,11 +407,11 @@ def keptransit(inputfile, outputfile, datacol, errorcol, periodini_d,
         if fitter == 'leastsq':
             fit_output = leastsq(fit_tmod, guess_params,
                                  args=(LDparams, intime, indata, inerr,
-                                       fixed_dict, guess_params),
+                                       fixed_dict, guess_params, tabulate),
                                  full_output=True, ftol=ftol)
         elif fitter == 'fmin':
             fit_output = fmin(fit_tmod2,guess_params,
-                              args=(LDparams,intime,indata,inerr,fixed_dict,guess_params),
+                              args=(LDparams,intime,indata,inerr,fixed_dict,guess_params,tabulate),
                               full_output=True,ftol=ftol,xtol=ftol)
 
     if status == 0:
@@ -467,7 +468,7 @@ def keptransit(inputfile, outputfile, datacol, errorcol, periodini_d,
             print 'Fit flux offset = ' + str(newfluxoffset)
 
         modelfit = tmod.lightcurve(intime,newperiod,newrprs,newT0,newEcc,
-            newars,newinc,newomega,LDparams,newsec)
+            newars,newinc,newomega,LDparams,newsec,tabulate)
 
         if fixfluxoffset == False:
             modelfit += newfluxoffset
@@ -530,6 +531,8 @@ if '--shell' in sys.argv:
     parser.add_argument('--ftol', help='Fix period?')
     parser.add_argument('--fitter', help='Fix period?')
     parser.add_argument('--norm', action='store_true', help='Normalize data to unity')
+    parser.add_argument('--tabulate', action='store_true',
+        help='Interpolate quadratic limb-darkened models from a precomputed table?')
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?')
     parser.add_argument('--plot', '-p', action='store_true', help='Plot result?', dest='plot')
     parser.add_argument('--verbose', action='store_true', help='Write to a log file?')
@@ -544,7 +547,7 @@ if '--shell' in sys.argv:
                args.fixperiod, args.fixrprs, args.fixT0,
                args.fixEcc, args.fixars, args.fixinc, args.fixomega, args.fixsec, args.fixfluxoffset,
                args.removeflaggeddata, args.ftol,
-               args.fitter, args.norm,
+               args.fitter, args.norm, args.tabulate,
                args.clobber, args.plot, args.verbose, args.logfile, args.status,
                cmdLine)
 else:
@@ -1,11 +1,103 @@
 import sys, time, math, re
+import multiprocessing
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
 import numpy as np
 import kepio, kepmsg, kepkey, kepfit, kepfunc, kepstat, kepfourier
 
+# -----------------------------------------------------------
+# peak frequency and power of the Fourier Transforms of ntrials realizations
+# of a time series, each adjusted at random within its error bars.
+#
+# Trials are drawn in chunks of light curves held as 2-d arrays and the
+# direct method transforms a whole chunk at once. With nproc > 1 the chunks
+# are run by a pool of nproc worker processes which share the time series.
+# nproc = 0 uses every available core
+
+def trialsearch(time,signal,err,ntrials,fmin,fmax,deltaf,ftmethod,nproc=1):
+
+    freq = np.zeros(ntrials,dtype='float32')
+    pmax = np.zeros(ntrials,dtype='float32')
+    if nproc < 1:
+        nproc = multiprocessing.cpu_count()
+    nchunk = max(1,min(kepfourier.BLOCKSIZE // max(len(time),1),
+                       (ntrials + nproc - 1) // nproc))
+    chunks = [(i,min(nchunk,ntrials - i),np.random.randint(2**31),fmin,fmax,deltaf,ftmethod)
+              for i in range(0,ntrials,nchunk)]
+    if nproc == 1 or len(chunks) < 2:
+        for i1, fr, power in map(trialchunk,[(time,signal,err) + chunk for chunk in chunks]):
+            freq[i1:i1+len(fr)] = fr
+            pmax[i1:i1+len(fr)] = power
+    else:
+        shared = []
+        for work in [time, signal, err]:
+            array = multiprocessing.RawArray('d',len(work))
+            np.frombuffer(array,dtype='float64')[:] = work
+            shared.append(array)
+        pool = multiprocessing.Pool(nproc,initializer=trialinit,initargs=shared)
+        try:
+            for i1, fr, power in pool.imap_unordered(trialworker,chunks):
+                freq[i1:i1+len(fr)] = fr
+                pmax[i1:i1+len(fr)] = power
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    return freq, pmax
+
+# -----------------------------------------------------------
+# peak frequency and power of one chunk of trials
+
+def trialchunk(args):
+
+    time, signal, err, i1, ntrial, seed, fmin, fmax, deltaf, ftmethod = args
+
+# adjust data within the error bars
+
+    random = np.random.RandomState(seed)
+    work = np.array(signal + err * random.standard_normal((ntrial,len(signal))),dtype='float32')
+
+# determine FT power peaks
+
+    if ftmethod == 'direct':
+        fr, power = kepfourier.ft_peaks(time,work,fmin,fmax,deltaf)
+    else:
+        fr = np.zeros(ntrial,dtype='float32')
+        power = np.zeros(ntrial,dtype='float32')
+        for i in range(ntrial):
+            f, p = kepfourier.ft(time,work[i],fmin,fmax,deltaf,False,ftmethod)
+            j = np.argmax(p)
+            fr[i] = f[j]
+            power[i] = p[j]
+
+    return i1, fr, power
+
+# -----------------------------------------------------------
+# time series shared read-only by the trial worker processes
+
+trialdata = {}
+
+def trialinit(time,signal,err):
+
+    trialdata['time'] = np.frombuffer(time,dtype='float64')
+    trialdata['signal'] = np.frombuffer(signal,dtype='float64')
+    trialdata['err'] = np.frombuffer(err,dtype='float64')
+
+# -----------------------------------------------------------
+# one chunk of trials within a worker
+
+def trialworker(args):
+
+    return trialchunk((trialdata['time'],trialdata['signal'],trialdata['err']) + args)
+
+# -----------------------------------------------------------
+# Monte Carlo period error task
+
 def keptrial(infile,outfile,datacol,errcol,fmin,fmax,nfreq,method,
-             ntrials,plot,clobber,verbose,logfile,status,cmdLine=False):
+             ftmethod,ntrials,nproc,plot,clobber,verbose,logfile,status,cmdLine=False):
 
 # startup parameters
 
@@ -32,7 +124,9 @@ def keptrial(infile,outfile,datacol,errcol,fmin,fmax,nfreq,method,
     call += 'fmax='+str(fmax)+' '
     call += 'nfreq='+str(nfreq)+' '
     call += 'method='+method+' '
+    call += 'ftmethod='+ftmethod+' '
     call += 'ntrials='+str(ntrials)+' '
+    call += 'nproc='+str(nproc)+' '
     plotit = 'n'
     if (plot): plotit = 'y'
     call += 'plot='+plotit+ ' '
@@ -96,78 +190,54 @@ def keptrial(infile,outfile,datacol,errcol,fmin,fmax,nfreq,method,
 
     if status == 0:
         deltaf = (fmax - fmin) / nfreq
-        freq = []; pmax = []; trial = []
-        for i in range(ntrials):
-            trial.append(i+1)
+        trial = np.arange(1,ntrials + 1)
+        freq, pmax = trialsearch(barytime,signal,err,ntrials,fmin,fmax,deltaf,ftmethod,nproc)
 
-# adjust data within the error bars
+# fit normal distribution to the histogram of peak frequencies
 
-            work1 = kepstat.randarray(signal,err)
-
-# determine FT power
-            fr, power = kepfourier.ft(barytime,work1,fmin,fmax,deltaf,False)
-
-# determine peak in FT
-
-            pmax.append(-1.0e30)
-            for j in range(len(fr)):
-                if (power[j] > pmax[-1]):
-                    pmax[-1] = power[j]
-                    f1 = fr[j]
-            freq.append(f1)
-
-# plot stop-motion histogram
-
-            plt.ion()
-            plt.figure(1,figsize=[7,10])
-            plt.clf()
-            plt.axes([0.08,0.08,0.88,0.89])
-            plt.gca().xaxis.set_major_formatter(plt.ScalarFormatter(useOffset=False))
-            plt.gca().yaxis.set_major_formatter(plt.ScalarFormatter(useOffset=False))
-            n,bins,patches = plt.hist(freq,bins=nfreq,range=[fmin,fmax],
-                                      align='mid',rwidth=1,ec='#0000ff',
-                                      fc='#ffff00',lw=2)
-
-# fit normal distribution to histogram
-
-            x = np.zeros(len(bins))
-            for j in range(1,len(bins)):
-                x[j] = (bins[j] + bins[j-1]) / 2
-            pinit = np.array([float(i),freq[-1],deltaf])
-            if i > 3:
-                n = np.array(n,dtype='float32')
-                coeffs, errors, covar, sigma, chi2, dof, fit, plotx, ploty, status = \
-                    kepfit.leastsquare('gauss',pinit,x[1:],n,None,logfile,verbose)
-                fitfunc = kepfunc.gauss()
-                f = np.arange(fmin,fmax,(fmax-fmin)/100)
-                fit = fitfunc(coeffs,f)
-                plt.plot(f,fit,'r-',linewidth=2)
-                plt.xlabel(r'Frequency (1/d)', {'color' : 'k'})
-            plt.ylabel('N', {'color' : 'k'})
-            plt.xlim(fmin,fmax)
-            plt.grid()
+    if status == 0 and ntrials < 5:
+        message = 'ERROR -- KEPTRIAL: at least 5 trials are needed to fit the peak distribution'
+        status = kepmsg.err(logfile,message,verbose)
+    if status == 0:
+        n, bins = np.histogram(freq,bins=nfreq,range=[fmin,fmax])
+        n = np.array(n,dtype='float32')
+        x = (bins[1:] + bins[:-1]) / 2
+        pinit = np.array([n.max(),x[np.argmax(n)],deltaf])
+        coeffs, errors, covar, sigma, chi2, dof, fit, plotx, ploty, status = \
+            kepfit.leastsquare('gauss',pinit,x,n,None,logfile,verbose,False)
+
+# plot histogram and fit
+
+    if status == 0 and plot:
+        plt.ion()
+        plt.figure(1,figsize=[7,10])
+        plt.clf()
+        plt.axes([0.08,0.08,0.88,0.89])
+        plt.gca().xaxis.set_major_formatter(plt.ScalarFormatter(useOffset=False))
+        plt.gca().yaxis.set_major_formatter(plt.ScalarFormatter(useOffset=False))
+        plt.hist(freq,bins=nfreq,range=[fmin,fmax],align='mid',rwidth=1,ec='#0000ff',
+                 fc='#ffff00',lw=2)
+        fitfunc = kepfunc.gauss()
+        f = np.arange(fmin,fmax,(fmax-fmin)/100)
+        plt.plot(f,fitfunc(coeffs,f),'r-',linewidth=2)
+        plt.xlabel(r'Frequency (1/d)', {'color' : 'k'})
+        plt.ylabel('N', {'color' : 'k'})
+        plt.xlim(fmin,fmax)
+        plt.grid()
 
 # render plot
 
-        if plot:
-            plt.ion()
-            plt.show()
+        plt.ion()
+        plt.show()
+
 # period results
 
     if status == 0:
         p = 1.0 / coeffs[1]
         perr = p * coeffs[2] / coeffs[1]
-        f1 = fmin; f2 = fmax
-        gotbin = False
-        for i in range(len(n)):
-            if n[i] > 0 and not gotbin:
-                f1 = bins[i]
-                gotbin = True
-        gotbin = False
-        for i in range(len(n)-1,0,-1):
-            if n[i] > 0 and not gotbin:
-                f2 = bins[i+1]
-                gotbin = True
+        full = np.where(n > 0)[0]
+        f1 = bins[full[0]]
+        f2 = bins[full[-1] + 1]
         powave, powstdev = kepstat.stdev(pmax)
 
 # print result
@@ -259,7 +329,13 @@ if '--shell' in sys.argv:
     parser.add_argument('--nfreq', default=100, help='Number of frequency intervals', type=int)
     parser.add_argument('--method', default='ft',
                         help='Frequency search method', type=int, choices=['ft'])
+    parser.add_argument('--ftmethod', default='direct',
+                        help='Fourier transform method', type=str,
+                        choices=['direct','nufft','loop'])
     parser.add_argument('--ntrials', default=1000, help='Number of search trials', type=int)
+    parser.add_argument('--nproc', default=1,
+                        help='Number of processes running search trials (0 = all cores)',
+                        type=int)
     parser.add_argument('--plot', action='store_true', help='Plot result?')
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?')
     parser.add_argument('--verbose', action='store_true', help='Write to a log file?')
@@ -270,7 +346,7 @@ if '--shell' in sys.argv:
     args = parser.parse_args()
     cmdLine=True
     keptrial(args.infile, args.outfile, args.datacol, args.errcol, args.fmin,
-             args.fmax, args.nfreq, args.method, args.ntrials, args.plot,
+             args.fmax, args.nfreq, args.method, args.ftmethod, args.ntrials, args.nproc, args.plot,
              args.clobber, args.verbose, args.logfile, args.status, cmdLine)
 else:
     from pyraf import iraf
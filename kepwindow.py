@@ -5,7 +5,7 @@ from matplotlib import pyplot as plt
 from math import *
 import kepio, kepmsg, kepkey, kepstat, kepfourier
 
-def kepwindow(infile,outfile,fcol,fmax,nfreq,plot,clobber,verbose,logfile,status, cmdLine=False):
+def kepwindow(infile,outfile,fcol,fmax,nfreq,ftmethod,plot,clobber,verbose,logfile,status, cmdLine=False):
 
 ## startup parameters
 
@@ -29,6 +29,7 @@ def kepwindow(infile,outfile,fcol,fmax,nfreq,plot,clobber,verbose,logfile,status
     call += 'fcol='+fcol+' '
     call += 'fmax='+str(fmax)+' '
     call += 'nfreq='+str(nfreq)+' '
+    call += 'ftmethod='+ftmethod+' '
     plotit = 'n'
     if (plot): plotit = 'y'
     call += 'plot='+plotit+ ' '
@@ -82,14 +83,19 @@ def kepwindow(infile,outfile,fcol,fmax,nfreq,plot,clobber,verbose,logfile,status
         except:
             barytime, status = kepio.readfitscol(infile,instr[1].data,'time',logfile,verbose)
         signal, status = kepio.readfitscol(infile,instr[1].data,fcol,logfile,verbose)
+        try:
+            cadenceno = instr[1].data.field('CADENCENO')
+        except:
+            cadenceno = np.zeros(len(barytime))
 
 ## remove infinite data from time series
 
     if status == 0:
-        incols = [barytime, signal]
+        incols = [barytime, signal, cadenceno]
         outcols = kepstat.removeinfinlc(signal, incols)
         barytime = outcols[0]
         signal = outcols[1]
+        cadenceno = outcols[2]
 
 ## reset signal data to zero
 
@@ -101,24 +107,27 @@ def kepwindow(infile,outfile,fcol,fmax,nfreq,plot,clobber,verbose,logfile,status
     if status == 0:
         deltaf = fmax / nfreq
 
-## loop through frequency steps; determine FT power
+## FFT of the cadence sampling mask, or FT power of the constant signal if the
+## time stamps are irregular
 
     if status == 0:
-        fr, power = kepfourier.ft(barytime,signal,0.0,fmax,deltaf,True)
+        power = None
+        if ftmethod == 'grid':
+            fr, power = kepfourier.window_grid(barytime,cadenceno,0.0,fmax,deltaf)
+            if power is None:
+                message = 'WARNING -- KEPWINDOW: time stamps are not on a regular cadence grid, '
+                message += 'using the direct method'
+                kepmsg.warn(logfile,message)
+        if power is None:
+            fr, power = kepfourier.ft(barytime,signal,0.0,fmax,deltaf,True,
+                                      ftmethod)
         power[0] = 1.0
 
 ## mirror window function around ordinate
 
     if status == 0:
-        work1 = []; work2 = []
-        for i in range(len(fr)-1, 0, -1):
-            work1.append(-fr[i])
-            work2.append(power[i])
-        for i in range(len(fr)):
-            work1.append(fr[i])
-            work2.append(power[i])
-        fr = np.array(work1,dtype='float32')
-        power = np.array(work2,dtype='float32')
+        fr = np.array(np.concatenate((-fr[:0:-1],fr)),dtype='float32')
+        power = np.array(np.concatenate((power[:0:-1],power)),dtype='float32')
 
 ## write output file
 
@@ -204,6 +213,9 @@ if '--shell' in sys.argv:
                         type=float)
     parser.add_argument('--nfreq', default=100,
                         help='Number of frequency intervals', type=int)
+    parser.add_argument('--ftmethod', default='grid',
+                        help='Fourier transform method', type=str,
+                        choices=['grid','direct','nufft','loop'])
     parser.add_argument('--plot', action='store_true', help='Plot result?')
     parser.add_argument('--clobber', action='store_true', help='Overwrite output file?')
     parser.add_argument('--verbose', action='store_true', help='Write to a log file?')
@@ -214,7 +226,7 @@ if '--shell' in sys.argv:
     args = parser.parse_args()
     cmdLine=True
     kepwindow(args.infile, args.outfile, args.fcol, args.fmax, args.nfreq,
-              args.plot, args.clobber, args.verbose, args.logfile,
+              args.ftmethod, args.plot, args.clobber, args.verbose, args.logfile,
               args.status, cmdLine)
 else:
     from pyraf import iraf
@@ -6,13 +6,14 @@ from matplotlib import pyplot as plt
 
 def lightcurve(JD, P, p, Ttr = 0, Ecc = 0, a = 10, \
                incl = numpy.pi/2, \
-               omega = 0, limbd = [0, 0], sec = 0):
+               omega = 0, limbd = [0, 0], sec = 0, tabulate = False):
     """Calculate transit / eclipse light curve according to Mandel &
     Agol (2002), with linear, quadratic or 4-parameter non-linear limb-darkening.
     TSB: modified the code to calculate the model on a finer grid than the
     original data is sampled on. The model is then averaged over the finer data.
     This accounts for non-linear changes in the brightnesses during ingress
-    and egress. """
+    and egress. If tabulate is True, quadratic limb-darkened models are
+    interpolated from a precomputed table (see ma02.occultquad_interp). """
     #try binning model
     JD = numpy.array(JD)
     avediff = numpy.median(JD[1:] - JD[0:-1])
@@ -40,6 +41,8 @@ def lightcurve(JD, P, p, Ttr = 0, Ecc = 0, a = 10, \
         f_tr = f_uni
     elif numpy.size(limbd) == 4:
         f_tr = ma02.occultnonlin(r, p, limbd)
+    elif tabulate:
+        f_tr = ma02.occultquad_interp(r, p, limbd)
     else:
         f_tr = ma02.occultquad(r, p, limbd)
     f_sec = 1.0 - (1.0 - f_uni) * sec / p**2
@@ -7,6 +7,10 @@ The Mandel & Agol (2002) transit light curve equations.
 
    :func:`occultquad` -- quadratic limb-darkening
 
+   :func:`occultquad_interp` -- quadratic limb-darkening, interpolated
+                                from a table built by
+                                :func:`occultquad_table`
+
    :func:`occultnonlin` -- full (4-parameter) nonlinear limb-darkening
 
    :func:`occultnonlin_small` -- small-planet approximation with full
@@ -65,6 +69,7 @@ import pdb
 
 eps = np.finfo(float).eps
 zeroval = eps*1e6
+quadtables = {}
 
 def appelf1_ac(a, b1, b2, c, z1, z2, **kwargs):
     """Analytic continuations of the Appell hypergeometric function of 2 variables.
@@ -462,7 +467,7 @@ def occultuniform(z, p, complement=False):
         acosarg2[acosarg2 > 1] = 1.  # quick fix for numerical precision errors
         k0 = np.arccos(acosarg1)
         k1 = np.arccos(acosarg2)
-        k2 = 0.5*np.sqrt(4*z2-(1+z2-p2)**2)
+        k2 = 0.5*np.sqrt(np.maximum(4*z2-(1+z2-p2)**2, 0.))  # zero at contact, up to rounding
 
         fsecondary[i1] = 0.
         fsecondary[i2] = (1./np.pi)*(p2*k0 + k1 - k2)
@@ -481,7 +486,7 @@ def occultuniform(z, p, complement=False):
             z2 = z**2
             k0 = np.arccos((p2+z2-1)/(2.*p*z))
             k1 = np.arccos((1-p2+z2)/(2*z))
-            k2 = 0.5*np.sqrt(4*z2-(1+z2-p2)**2)
+            k2 = 0.5*np.sqrt(max(4*z2-(1+z2-p2)**2, 0.))
             fsecondary = (1./np.pi)*(p2*k0 + k1 - k2)
         elif z<= (1-p):
             fsecondary = p2
@@ -731,6 +736,14 @@ def occultquad(z,p0, gamma, retall=False, verbose=False):
 
     p = np.abs(p0) # Save the original input
 
+    # Offsets within rounding of z = p or of a contact lose all
+    # precision in the elliptic integrals of Lambda_1 and Lambda_2 (or
+    # stall them altogether); use the exact cases:
+    z[np.abs(z - p) < 1e-9 * p] = p
+    z[np.abs(z - (1. + p)) < 1e-9 * (1. + p)] = 1. + p
+    if p < 1:
+        z[np.abs(z - (1. - p)) < 1e-9 * (1. - p)] = 1. - p
+
 
     # Define limb-darkening coefficients:
     c2 = gamma[0] + 2 * gamma[1]
@@ -757,7 +770,7 @@ def occultquad(z,p0, gamma, retall=False, verbose=False):
     i01 = (p > 0) * (z >= (1. + p))
     i02 = (p > 0) * (z > (.5 + np.abs(p - 0.5))) * (z < (1. + p))
     i03 = (p > 0) * (p < 0.5) * (z > p) * (z < (1. - p))
-    i04 = (p > 0) * (p < 0.5) * (z == (1. - p))
+    i04 = (p > 0) * (p < 1) * (p != 0.5) * (z == (1. - p))
     i05 = (p > 0) * (p < 0.5) * (z == p)
     i06 = (p == 0.5) * (z == 0.5)
     i07 = (p > 0.5) * (z == p)
@@ -765,6 +778,11 @@ def occultquad(z,p0, gamma, retall=False, verbose=False):
     i09 = (p > 0) * (p < 1) * (z > 0) * (z < (0.5 - np.abs(p - 0.5)))
     i10 = (p > 0) * (p < 1) * (z == 0)
     i11 = (p > 1) * (z >= 0.) * (z < (p - 1.))
+    # Keep the contact points out of the open intervals, which rounding
+    # in (.5 +/- abs(p - .5)) can otherwise let them into:
+    i02 = i02 * ~(i04 + i07)
+    i08 = i08 * ~i04
+    i09 = i09 * ~i05
     if verbose:
         allind = i01 + i02 + i03 + i04 + i05 + i06 + i07 + i08 + i09 + i10 + i11
         nused = (i01.sum() + i02.sum() + i03.sum() + i04.sum() + \
@@ -890,6 +908,181 @@ def occultquad(z,p0, gamma, retall=False, verbose=False):
     #pdb.set_trace()
     return ret
 
+def occultquad_table(pmax=0.5, npgrid=251, nzgrid=1000, verbose=False):
+    """Tabulate the components of :func:`occultquad` on a grid in
+    planet/star radius ratio and positional offset.
+
+    :INPUTS:
+        pmax -- float.
+           Largest radius ratio covered by the table.
+
+        npgrid -- int.
+           Number of grid points in radius ratio, from 0 to pmax.
+
+        nzgrid -- int.
+           Number of grid intervals in z between the center of the
+           star and second contact, and again between second and
+           first contact.
+
+    :OUTPUTS:
+        table -- dict, with keys:
+           'pgrid', 'xgrid' -- the grid axes.  x is z scaled so that
+           second and first contact fall at x = 1 and x = 2, with
+           cosine spacing in between to resolve the (z - z_c)^1.5
+           behavior at both contacts,
+
+           'comps' -- (3, npgrid, 2*nzgrid+1) array holding lambda^e,
+           lambda^d + 2/3 (p > z) and eta^d,
+
+           'error' -- maximum absolute interpolation error of each
+           component, measured at the centers of the grid cells.
+
+    :NOTES:
+       Tables are cached by their arguments, so only the first call
+       for a given grid pays for the elliptic integrals (about a
+       second for the default grid, which takes 12 MB).  The error
+       on a quadratic limb-darkened light curve is bounded by
+       (|1-c2| error[0] + |c2| error[1] + |c4| error[2]) / (4 Omega);
+       see :func:`occultquad_interp`.
+
+    :SEE ALSO:
+       :func:`occultquad`, :func:`occultquad_interp`
+    """
+    key = (float(pmax), int(npgrid), int(nzgrid))
+    if key in quadtables:
+        return quadtables[key]
+
+    pgrid = np.linspace(0., pmax, npgrid)
+    xgrid = np.linspace(0., 2., 2*nzgrid + 1)
+    comps = occultquad_rows(pgrid, xgrid)
+
+    # Interpolation error at the cell centers, where it is largest:
+    pmid = 0.5 * (pgrid[1:] + pgrid[:-1])
+    xmid = 0.5 * (xgrid[1:] + xgrid[:-1])
+    exact = occultquad_rows(pmid, xmid)
+    w = ((pmid**2 - pgrid[:-1]**2) / (pgrid[1:]**2 - pgrid[:-1]**2))[:,np.newaxis]
+    interp = 0.5 * ((1. - w) * (comps[:,:-1,1:] + comps[:,:-1,:-1]) + \
+                        w * (comps[:,1:,1:] + comps[:,1:,:-1]))
+    error = np.abs(interp - exact).reshape(3, -1).max(1)
+
+    table = dict(pgrid=pgrid, xgrid=xgrid, comps=comps, error=error)
+    quadtables[key] = table
+    if verbose:
+        print "occultquad table, p <= %g: max errors %.2e (lambda^e), %.2e (lambda^d), %.2e (eta^d)" % \
+            ((pmax,) + tuple(error))
+
+    return table
+
+def occultquad_rows(pgrid, xgrid):
+    """Exact :func:`occultquad` components for each radius ratio in
+    pgrid, at the scaled offsets xgrid.  See :func:`occultquad_table`.
+    """
+    # Everything is zero from first contact (x = 2) outward; rounding
+    # in z there would otherwise stall the elliptic integrals.
+    comps = np.zeros((3, len(pgrid), len(xgrid)), float)
+    intransit = xgrid < 2
+    for j in range(len(pgrid)):
+        p = pgrid[j]
+        if p == 0:
+            continue
+        z = occultquad_xtoz(xgrid[intransit], p)
+        junk, lambdae, lambdad, etad = occultquad(z, p, [0., 0.], retall=True)
+        comps[0,j,intransit] = lambdae
+        comps[1,j,intransit] = lambdad + (2./3.) * (p > z)
+        comps[2,j,intransit] = etad
+
+    return comps
+
+def occultquad_xtoz(x, p):
+    """Convert scaled offsets x (see :func:`occultquad_table`) to z."""
+    z1 = np.abs(1. - p)
+    return np.where(x < 1, x * z1, z1 + 0.5 * (1. - np.cos(np.pi * (x - 1.))) * (1. + p - z1))
+
+def occultquad_ztox(z, p):
+    """Convert offsets z to scaled offsets x (see :func:`occultquad_table`)."""
+    z1 = np.abs(1. - p)
+    ingress = np.clip(1. - 2. * (z - z1) / (1. + p - z1), -1., 1.)
+    return np.where(z < z1, z / max(z1, zeroval), 1. + np.arccos(ingress) / np.pi)
+
+def occultquad_interp(z, p0, gamma, retall=False, table=None):
+    """Quadratic limb-darkening light curve interpolated from a
+    precomputed table; a faster stand-in for :func:`occultquad`.
+
+    :INPUTS:
+        z -- sequence of positional offset values
+
+        p0 -- planet/star radius ratio
+
+        gamma -- two-sequence.
+           quadratic limb darkening coefficients, as for :func:`occultquad`.
+
+    :OPTIONS:
+        retall -- bool.
+           If True, in addition to the light curve return the
+           uniform-disk light curve, lambda^d, and eta^d parameters.
+
+        table -- dict.
+           Table from :func:`occultquad_table`; the default table is
+           built (and cached) on the first call.  Radius ratios beyond
+           the table fall back on :func:`occultquad`.
+
+    :EXAMPLE:
+       ::
+
+         import transit
+         table = transit.occultquad_table(pmax=0.2, verbose=True)
+         z = linspace(0, 1.2, 100000)
+         f = transit.occultquad_interp(z, 0.1, [.25, .75], table=table)
+
+    :NOTES:
+       The radius ratio is fixed within a call, so the table rows
+       bracketing p are combined once with the limb-darkening
+       coefficients into a single row, and the light curve is one
+       linear interpolation of that row.  With the default table the
+       components are good to about 5e-7.  The error is bounded by
+       the 'error' entry of the table, as described in
+       :func:`occultquad_table`.
+
+    :SEE ALSO:
+       :func:`occultquad`, :func:`occultquad_table`
+    """
+    if table is None:
+        table = occultquad_table()
+
+    p = np.abs(p0)
+    pgrid = table['pgrid']
+    if p == 0 or p > pgrid[-1]:
+        return occultquad(z, p0, gamma, retall=retall)
+
+    gamma = np.array(gamma, copy=True)
+    if gamma.size < 2:  # Linear limb-darkening
+        gamma = np.array([gamma.ravel()[0], 0.])
+    c2 = gamma[0] + 2 * gamma[1]
+    c4 = -gamma[1]
+    fourOmega = 1. - gamma[0]/3. - gamma[1]/6.
+
+    z = np.abs(np.array(z, dtype=float))
+    x = occultquad_ztox(z, p)
+
+    # Bracketing rows in p, weighted in p**2 (the depth scales as p**2):
+    j = min(np.searchsorted(pgrid, p) - 1, len(pgrid) - 2)
+    w = (p**2 - pgrid[j]**2) / (pgrid[j+1]**2 - pgrid[j]**2)
+    rows = (1. - w) * table['comps'][:,j] + w * table['comps'][:,j+1]
+
+    if retall:
+        lambdae = np.interp(x, table['xgrid'], rows[0], right=0.)
+        lambdad = np.interp(x, table['xgrid'], rows[1], right=0.) - (2./3.) * (p > z)
+        etad = np.interp(x, table['xgrid'], rows[2], right=0.)
+        F = 1. - ((1. - c2) * lambdae + \
+                      c2 * (lambdad + (2./3.) * (p > z)) - \
+                      c4 * etad) / fourOmega
+        ret = F, lambdae, lambdad, etad
+    else:
+        row = ((1. - c2) * rows[0] + c2 * rows[1] - c4 * rows[2]) / fourOmega
+        ret = 1. - np.interp(x, table['xgrid'], row, right=0.)
+
+    return ret
+
 def occultnonlin(z,p0, cn):
     """Nonlinear limb-darkening light curve; cf. Section 3 of Mandel & Agol (2002).
 
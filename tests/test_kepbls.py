@@ -0,0 +1,60 @@
+import math
+import numpy as np
+
+from ..kepbls import periodgrid, blsperiod, blssearch
+
+
+def box_transit(seed=12):
+    rng = np.random.RandomState(seed)
+    time = np.arange(0.0, 30.0, 0.02)
+    flux = 1.0 + 1.0e-3 * rng.randn(len(time))
+    flux[np.mod(time - 0.7, 3.1) < 0.2] -= 0.01
+    err = 1.0e-3 * (1.0 + 0.1 * rng.rand(len(time)))
+    return time, flux - np.mean(flux), err
+
+
+def reference_period(time, flux, err, trialPeriod, nbins, mindur, maxdur):
+    trialFrequency = 1.0 / trialPeriod
+    duration1 = max(int(float(nbins) * mindur / 24.0 / trialPeriod), 2)
+    duration2 = max(int(float(nbins) * maxdur / 24.0 / trialPeriod) + 1, duration1 + 1)
+    halfHour = int(0.02083333 / trialPeriod * nbins + 1)
+    phase = np.array(((time * trialFrequency) - np.floor(time * trialFrequency)) * float(nbins), dtype='int')
+    work4 = np.zeros(nbins, dtype='float32')
+    work5 = np.zeros(nbins, dtype='float32')
+    for i in range(nbins):
+        work4[i] = np.mean(flux[phase == i])
+        work5[i] = math.sqrt(np.sum(err[phase == i]**2) / np.sum(phase == i))
+    work4 = np.append(work4, work4[:duration2])
+    work5 = np.append(work5, work5[:duration2])
+    omega = np.power(work5, -2) / np.nansum(np.power(work5, -2))
+    s = omega * work4
+    best = (0.0, np.nan, np.nan)
+    for i1 in range(nbins):
+        for duration in range(duration1, duration2 + 1, halfHour):
+            i2 = i1 + duration
+            sr1 = np.sum(np.power(s[i1:i2], 2))
+            sr2 = np.sum(omega[i1:i2])
+            sr = math.sqrt(sr1 / (sr2 * (1.0 - sr2)))
+            if sr > best[0]:
+                best = (sr, float(duration), float((i1 + i2) // 2))
+    return best
+
+
+def test_blsperiod_matches_triple_loop():
+    time, flux, err = box_transit()
+    for trialPeriod in periodgrid(2.5, 3.5, 10, 'linear'):
+        sr, duration, phase = blsperiod(time, flux, err, trialPeriod, 200, 2.0, 6.0)
+        refsr, refduration, refphase = reference_period(time, flux, err, trialPeriod, 200, 2.0, 6.0)
+        assert np.allclose(sr, refsr, rtol=1.0e-5)
+        np.testing.assert_array_equal([duration, phase], [refduration, refphase])
+
+
+def test_blssearch_pool_matches_serial():
+    time, flux, err = box_transit()
+    trialPeriods = periodgrid(2.0, 5.0, 60, 'frequency')
+    serial = blssearch(time, flux, err, trialPeriods, 200, 2.0, 6.0, False, nproc=1)
+    pooled = blssearch(time, flux, err, trialPeriods, 200, 2.0, 6.0, False, nproc=2)
+    for a, b in zip(serial, pooled):
+        np.testing.assert_array_equal(a, b)
+    best = np.argmax(serial[0])
+    assert abs(trialPeriods[best] - 3.1) < 0.05
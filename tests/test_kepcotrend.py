@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+from ..kepcotrend import do_lsq_uhat, do_lsq_uhat_batch, fit_targets, pair_files
+
+
+def test_do_lsq_uhat_batch_matches_do_lsq_uhat():
+    rng = np.random.RandomState(10)
+    cad = np.arange(300)
+    pcomps = rng.randn(4, 300)
+    fluxes = rng.randn(6, 300)
+    coeffs = do_lsq_uhat_batch(pcomps, fluxes)
+    assert coeffs.shape == (4, 6)
+    for i in range(6):
+        assert np.allclose(coeffs[:, i:i+1], do_lsq_uhat(pcomps, cad, fluxes[i]))
+
+
+def test_fit_targets_matches_per_target_fits():
+    rng = np.random.RandomState(11)
+    bases = {'a': rng.randn(3, 200), 'b': rng.randn(5, 150)}
+    targets = []
+    for key in ['a', 'b', 'a', 'a', 'b']:
+        ncad = bases[key].shape[1]
+        targets.append({'designkey': key, 'lc_cad_masked': np.arange(ncad),
+                        'n_flux_masked': rng.randn(ncad)})
+    fit_targets(targets, bases, 'llsq', 1.0, False, None)
+    for target in targets:
+        reference = do_lsq_uhat(bases[target['designkey']], target['lc_cad_masked'],
+                                target['n_flux_masked'])
+        assert target['coeffs'].shape == reference.shape
+        assert np.allclose(target['coeffs'], reference)
+
+
+def test_pair_files(tmpdir):
+    logfile = os.path.join(str(tmpdir), 'test.log')
+    indir = tmpdir.mkdir('in')
+    outdir = str(tmpdir.mkdir('out'))
+    names = [str(indir.join(name)) for name in ['c_llc.fits', 'a_llc.fits', 'b_llc.fits']]
+    for name in names:
+        open(name, 'w').close()
+
+# single file and comma-separated lists are paired in order
+
+    infiles, outfiles, status = pair_files(names[0], 'one.fits', logfile, False)
+    assert status == 0 and infiles == [names[0]] and outfiles == ['one.fits']
+    infiles, outfiles, status = pair_files(','.join(names[:2]), 'x.fits,y.fits', logfile, False)
+    assert status == 0 and infiles == names[:2] and outfiles == ['x.fits', 'y.fits']
+
+# wildcards are sorted and named after their inputs in an output directory
+
+    infiles, outfiles, status = pair_files(str(indir.join('*.fits')), outdir, logfile, False)
+    assert status == 0
+    assert infiles == sorted(names)
+    assert outfiles == [os.path.join(outdir, os.path.basename(name)) for name in sorted(names)]
+
+# rejected pairings
+
+    assert pair_files(str(indir.join('*.fits')), 'x.fits,y.fits,z.fits', logfile, False)[2] != 0
+    assert pair_files(','.join(names[:2]), 'out*.fits', logfile, False)[2] != 0
+    assert pair_files(','.join(names[:2]), 'x.fits', logfile, False)[2] != 0
+    assert pair_files(names[0], names[0], logfile, False)[2] != 0
+    assert pair_files(','.join(names[:2]), str(indir), logfile, False)[2] != 0
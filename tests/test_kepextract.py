@@ -0,0 +1,148 @@
+import os
+import numpy as np
+from astropy.io import fits as pyfits
+from scipy.optimize import leastsq
+
+from .. import kepfunc
+from ..kepextract import kepextract
+from .test_kepio import write_tpf
+
+COLUMNS = ['TIME', 'TIMECORR', 'CADENCENO', 'SAP_FLUX', 'SAP_FLUX_ERR', 'SAP_BKG', 'SAP_BKG_ERR',
+           'PDCSAP_FLUX', 'PDCSAP_FLUX_ERR', 'SAP_QUALITY', 'PSF_CENTR1', 'PSF_CENTR1_ERR',
+           'PSF_CENTR2', 'PSF_CENTR2_ERR', 'MOM_CENTR1', 'MOM_CENTR1_ERR', 'MOM_CENTR2',
+           'MOM_CENTR2_ERR', 'POS_CORR1', 'POS_CORR2', 'RAW_FLUX']
+
+
+def write_mask(filename, pixels):
+    items = ';'.join('%d,%d' % (row - 500, col - 300) for row, col in pixels)
+    open(filename, 'w').write('NEW|CCD|blank|500|300|' + items + '\n')
+
+
+def reference_extract(infile, maskfile, subback):
+    struct = pyfits.open(infile)
+    table = struct['TARGETTABLES'].data
+    ntime = len(table)
+    flux = table.field('FLUX').reshape((ntime, -1))
+    flux_err = table.field('FLUX_ERR').reshape((ntime, -1))
+    flux_bkg = table.field('FLUX_BKG').reshape((ntime, -1))
+    flux_bkg_err = table.field('FLUX_BKG_ERR').reshape((ntime, -1))
+    raw_cnts = table.field('RAW_CNTS').reshape((ntime, -1))
+    maskmap = np.array(struct['APERTURE'].data)
+    struct.close()
+
+# aperture bitmap, pixel by pixel
+
+    aperx = []
+    apery = []
+    aperb = []
+    for i in range(maskmap.shape[0]):
+        for j in range(maskmap.shape[1]):
+            aperx.append(300.0 + j)
+            apery.append(500.0 + i)
+            if maskfile == 'aper':
+                aperb.append(maskmap[i, j])
+            elif maskmap[i, j] == 0:
+                aperb.append(0)
+            elif maskfile == 'all' or (500 + i, 300 + j) in maskfile:
+                aperb.append(3)
+                maskmap[i, j] = 3
+            else:
+                aperb.append(1)
+                maskmap[i, j] = 1
+    apix = [j for j in range(len(aperb)) if aperb[j] == 3]
+    naper = len(apix)
+    modx = np.array([aperx[j] for j in apix])
+    mody = np.array([apery[j] for j in apix])
+
+# cadence by cadence
+
+    columns = dict((name, np.zeros(ntime)) for name in COLUMNS)
+    for i in range(ntime):
+        sky = 0.0
+        if subback:
+            sky = np.median(flux[i])
+        f = np.array([flux[i, j] for j in apix], dtype='float64')
+        fe = np.array([flux_err[i, j] for j in apix], dtype='float64')
+        columns['SAP_FLUX'][i] = np.sum(f - sky)
+        columns['SAP_FLUX_ERR'][i] = np.sqrt(np.sum(fe**2))
+        columns['SAP_BKG'][i] = np.sum([flux_bkg[i, j] for j in apix])
+        columns['SAP_BKG_ERR'][i] = np.sqrt(np.sum(np.array([flux_bkg_err[i, j] for j in apix])**2))
+        columns['RAW_FLUX'][i] = np.sum([raw_cnts[i, j] for j in apix])
+        fsum = np.sum(f)
+        fsume = np.sqrt(np.sum(fe**2) / naper)
+        for axis, pos in [('1', modx), ('2', mody)]:
+            centr = np.sum(pos * f) / fsum
+            poserr = np.sqrt(np.sum((pos * fe)**2) / naper) / np.sum(pos * f)
+            columns['MOM_CENTR' + axis][i] = centr
+            columns['MOM_CENTR' + axis + '_ERR'][i] = np.sqrt(poserr**2 + (fsume / fsum)**2) * centr
+        guess = [columns['MOM_CENTR1'][i], columns['MOM_CENTR2'][i], np.nanmax(flux[i:]),
+                 1.0, 1.0, 0.0, 0.0]
+        try:
+            ans = leastsq(kepfunc.PRFgauss2d, guess, args=(modx, mody, f), xtol=1.0e-8, ftol=1.0e-4,
+                          full_output=True)
+            columns['PSF_CENTR1'][i] = ans[0][0]
+            columns['PSF_CENTR2'][i] = ans[0][1]
+        except TypeError:
+            pass
+    columns['PDCSAP_FLUX'] = columns['SAP_FLUX']
+    columns['PDCSAP_FLUX_ERR'] = columns['SAP_FLUX_ERR']
+    columns['PSF_CENTR1_ERR'][:] = np.nan
+    columns['PSF_CENTR2_ERR'][:] = np.nan
+    for name, colname in [('TIME', 'TIME'), ('TIMECORR', 'TIMECORR'), ('CADENCENO', 'CADENCENO'),
+                          ('SAP_QUALITY', 'QUALITY'), ('POS_CORR1', 'POS_CORR1'),
+                          ('POS_CORR2', 'POS_CORR2')]:
+        columns[name] = table.field(colname)
+    return columns, maskmap
+
+
+def read_extract(outfile):
+    struct = pyfits.open(outfile)
+    columns = dict((name, np.array(struct['LIGHTCURVE'].data.field(name))) for name in COLUMNS)
+    maskmap = np.array(struct[2].data)
+    struct.close()
+    return columns, maskmap
+
+
+def test_kepextract_matches_pixel_loop(tmpdir):
+    infile = str(tmpdir.join('kplr001234567-2010078095331_lpd-targ.fits'))
+    logfile = str(tmpdir.join('test.log'))
+    write_tpf(infile)
+    pixels = [(500, 300), (500, 301), (500, 302), (501, 301), (501, 302), (501, 303),
+              (502, 302), (502, 303), (503, 303)]
+    maskfile = str(tmpdir.join('mask.txt'))
+    write_mask(maskfile, pixels)
+    for mask, reference in [(maskfile, pixels), ('aper', 'aper'), ('all', 'all')]:
+        for subback in [False, True]:
+            outfile = str(tmpdir.join('out.fits'))
+            kepextract(infile, mask, outfile, subback, True, False, logfile, 0)
+            columns, maskmap = read_extract(outfile)
+            refcolumns, refmaskmap = reference_extract(infile, reference, subback)
+            assert np.array_equal(maskmap, refmaskmap)
+            for name in COLUMNS:
+                expected = np.array(refcolumns[name], dtype=columns[name].dtype)
+                assert np.allclose(columns[name], expected, rtol=1.0e-6, atol=0.0, equal_nan=True), name
+
+
+def test_kepextract_multiple_masks_match_single_runs(tmpdir):
+    infile = str(tmpdir.join('kplr001234567-2010078095331_lpd-targ.fits'))
+    logfile = str(tmpdir.join('test.log'))
+    write_tpf(infile, ntime=40)
+    masks = [str(tmpdir.join('mask1.txt')), 'aper', str(tmpdir.join('mask2.txt'))]
+    write_mask(masks[0], [(501, 301), (501, 302), (502, 302), (502, 303), (501, 303),
+                          (502, 301), (503, 302)])
+    write_mask(masks[2], [(501, 302)])
+    outfiles = [str(tmpdir.join('multi%d.fits' % i)) for i in range(3)]
+    kepextract(infile, ','.join(masks), ','.join(outfiles), True, False, False, logfile, 0)
+    for mask, outfile in zip(masks, outfiles):
+        single = str(tmpdir.join('single.fits'))
+        kepextract(infile, mask, single, True, True, False, logfile, 0)
+        columns, maskmap = read_extract(outfile)
+        refcolumns, refmaskmap = read_extract(single)
+        assert np.array_equal(maskmap, refmaskmap)
+        for name in COLUMNS:
+            np.testing.assert_array_equal(columns[name], refcolumns[name])
+
+# one output per mask
+
+    kepextract(infile, ','.join(masks), str(tmpdir.join('one.fits')), True, True, False, logfile, 0)
+    assert not os.path.exists(str(tmpdir.join('one.fits')))
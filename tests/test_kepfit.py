@@ -0,0 +1,136 @@
+import math
+import numpy as np
+from scipy import optimize
+
+from .. import kepfit
+
+
+def noisy_polynomial(functype, seed=2, npts=120):
+    rng = np.random.RandomState(seed)
+    x = np.sort(rng.uniform(0.0, 5.0, npts))
+    y = np.polyval([0.03, -0.2, 0.4, 3.0][-kepfit.LINEARFUNCS[functype]-1:], x) + 0.05 * rng.randn(npts)
+    if functype == 'poly1con':
+        y = y + x
+    y[rng.rand(npts) < 0.08] += 0.6
+    yerr = 0.05 * (1.0 + rng.rand(npts))
+    return x, y, yerr
+
+
+def reference_leastsquare(functype, pinit, xdata, ydata, yerr):
+    fitfunc = kepfit.fitfunction(functype)
+    errfunc = lambda p, x, y, err: (y - fitfunc(p, x)) / err
+    single = functype in ['poly0', 'poly1con']
+    if yerr is None:
+        out = optimize.leastsq(errfunc, pinit, args=(xdata, ydata, np.zeros(len(ydata)) + 1.e10),
+                               full_output=1)
+        coeffs = out[0]
+        if len(coeffs) > 1:
+            fit = fitfunc(coeffs, xdata)
+        else:
+            fit = np.zeros(len(xdata)) + coeffs[0]
+        yerr = np.zeros(len(ydata)) + math.sqrt(np.mean((ydata - fit)**2))
+    out = optimize.leastsq(errfunc, pinit, args=(xdata, ydata, yerr), full_output=1)
+    coeffs = out[0]
+    covar = out[1]
+    if single:
+        errors = [coeffs[0]]
+        fit = np.zeros(len(xdata)) + coeffs[0]
+    else:
+        errors = [math.sqrt(abs(covar[i][i])) for i in range(len(coeffs))]
+        fit = fitfunc(coeffs, xdata)
+    sigma = math.sqrt(np.mean((ydata - fit)**2))
+    dof = len(ydata) - len(coeffs)
+    chi2 = np.sum((ydata - fit)**2 / yerr) / dof
+    return coeffs, errors, covar, sigma, chi2, dof, fit
+
+
+def reference_lsqclip(functype, pinit, x, y, yerr, rej_lo, rej_hi, niter):
+    iiter = 0
+    iterstatus = 1
+    while iiter < niter and len(x) > len(pinit) and iterstatus > 0:
+        coeffs, errors, covar, sigma, chi2, dof, fit = reference_leastsquare(functype, pinit, x, y, yerr)
+        pinit = coeffs
+        keep = (y - fit < rej_hi * sigma) & (fit - y < rej_lo * sigma)
+        iterstatus = int(not keep.all())
+        usedx = x
+        x = x[keep]
+        y = y[keep]
+        if yerr is not None:
+            yerr = yerr[keep]
+        iiter += 1
+    return coeffs, errors, covar, iiter, sigma, chi2, dof, fit, usedx
+
+
+def test_linearleastsq_matches_leastsq(tmpdir):
+    logfile = str(tmpdir.join('test.log'))
+    for functype in ['poly0', 'poly1', 'poly2', 'poly3', 'poly1con']:
+        x, y, yerr = noisy_polynomial(functype)
+        pinit = np.ones(kepfit.LINEARFUNCS[functype] + 1)
+        for err in [yerr, None]:
+            result = kepfit.leastsquare(functype, pinit, x, y, err, logfile, False, False)
+            coeffs, errors, covar, sigma, chi2, dof, fit = reference_leastsquare(functype, pinit, x, y, err)
+            assert np.allclose(np.ravel(result[0]), coeffs, rtol=1.0e-5, atol=1.0e-7)
+            assert np.allclose(np.ravel(result[1]), errors, rtol=1.0e-4)
+            assert np.allclose(result[3], sigma, rtol=1.0e-6)
+            assert np.allclose(result[4], chi2, rtol=1.0e-6)
+            assert result[5] == dof
+            assert np.allclose(result[6], fit, rtol=1.0e-5)
+
+
+def test_lsqclip_matches_iterative_fit(tmpdir):
+    logfile = str(tmpdir.join('test.log'))
+    for functype in ['poly0', 'poly1', 'poly2', 'poly3', 'poly1con']:
+        x, y, yerr = noisy_polynomial(functype, seed=3)
+        pinit = np.ones(kepfit.LINEARFUNCS[functype] + 1)
+        for err in [yerr, None]:
+            coeffs, errors, covar, iiter, sigma, chi2, dof, fit, usedx = \
+                reference_lsqclip(functype, pinit, x, y, err, 2.5, 2.5, 10)
+            result = kepfit.lsqclip(functype, pinit, x, y, err, 2.5, 2.5, 10, logfile, False, False)
+            assert result[3] == iiter
+
+# poly1con residuals are taken against the offset alone, as they always
+# were, so nothing is clipped
+
+            assert iiter > 1 or functype == 'poly1con'
+            assert np.allclose(np.ravel(result[0]), coeffs, rtol=1.0e-5, atol=1.0e-7)
+            assert np.allclose(np.ravel(result[1]), errors, rtol=1.0e-4)
+            assert np.allclose(result[4], sigma, rtol=1.0e-6)
+            assert np.allclose(result[5], chi2, rtol=1.0e-6)
+            assert result[6] == dof
+            assert np.allclose(result[7], fit, rtol=1.0e-5)
+            used, mask = kepfit.lsqclipmask(functype, pinit, x, y, err, 2.5, 2.5, 10, logfile, False)[8:10]
+            assert np.array_equal(x[used], usedx)
+            assert not (mask & ~used).any()
+
+
+def test_lsqclipwin_matches_lsqclip_per_window(tmpdir):
+    logfile = str(tmpdir.join('test.log'))
+    rng = np.random.RandomState(8)
+    x = np.cumsum(rng.uniform(0.01, 0.03, 600))
+    x[300:] += 2.0
+    y = np.sin(x) + 0.01 * rng.randn(len(x))
+    y[rng.rand(len(x)) < 0.03] += 0.2
+    cstep1 = np.arange(0, 560, 7)
+    cstep2 = np.minimum(cstep1 + rng.randint(2, 60, len(cstep1)), len(x) - 1)
+    npoly = 2
+    seen = np.zeros(len(cstep1), dtype='bool')
+    clipped = 0
+    for wins, index, valid, fit, sigma, fitted, mask in \
+            kepfit.lsqclipwin(x, y, cstep1, cstep2, npoly, 3.0, 3.0, 5):
+        for k, win in enumerate(wins):
+            seen[win] = True
+            nlen = valid[k].sum()
+            assert np.array_equal(index[k][:nlen], np.arange(cstep1[win], cstep2[win] + 1))
+            if nlen <= npoly + 1:
+                assert not fitted[k]
+                continue
+            xw = x[cstep1[win]:cstep2[win]+1] - x[cstep1[win]]
+            yw = y[cstep1[win]:cstep2[win]+1]
+            coeffs, errors, covar, iiter, sig, chi2, dof, wfit, used, wmask, status = \
+                kepfit.lsqclipmask('poly2', np.ones(3), xw, yw, None, 3.0, 3.0, 5, logfile, False)
+            assert fitted[k]
+            assert np.allclose(fit[k][:nlen], kepfit.fitfunction('poly2')(coeffs, xw), rtol=1.0e-6, atol=1.0e-9)
+            assert np.allclose(sigma[k], sig, rtol=1.0e-6)
+            assert np.array_equal(mask[k][:nlen], wmask)
+            clipped += (~wmask).sum()
+    assert seen.all() and clipped > 0
@@ -0,0 +1,64 @@
+import numpy as np
+
+from .. import kepfit
+from ..kepflatten import flattenfit
+
+
+def gapped_light_curve(seed=16):
+    rng = np.random.RandomState(seed)
+    intime = np.arange(0.0, 12.0, 0.0204)
+    intime = intime[(intime < 4.0) | (intime > 4.6)]
+    indata = 1.0e4 * (1.0 + 0.01 * np.sin(intime) + 1.0e-4 * rng.randn(len(intime)))
+    outliers = rng.rand(len(intime)) < 0.02
+    indata[outliers] += 50.0 * rng.choice([-1.0, 1.0], outliers.sum())
+    return intime, indata
+
+
+def reference_flatten(intime, indata, cstep1, cstep2, npoly, nsig, niter):
+    fitarray = np.zeros((len(indata), len(cstep1)), dtype='float32')
+    sigarray = np.zeros((len(indata), len(cstep1)), dtype='float32')
+    fitarray[:, :] = np.nan
+    sigarray[:, :] = np.nan
+    for i in range(len(cstep1)):
+        timeSeries = intime[cstep1[i]:cstep2[i]+1] - intime[cstep1[i]]
+        dataSeries = indata[cstep1[i]:cstep2[i]+1]
+        pinit = np.array([dataSeries.mean()] + [0.0] * npoly, dtype='float32')
+        if len(timeSeries) > len(pinit):
+            coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
+                kepfit.lsqclip('poly' + str(npoly), pinit, timeSeries, dataSeries, None, nsig, nsig,
+                               niter, None, False)
+            fitarray[cstep1[i]:cstep2[i]+1, i] = 0.0
+            sigarray[cstep1[i]:cstep2[i]+1, i] = sigma
+            for j in range(len(coeffs)):
+                fitarray[cstep1[i]:cstep2[i]+1, i] += coeffs[j] * timeSeries**j
+    masterfit = np.zeros(len(indata))
+    mastersigma = np.zeros(len(indata))
+    for i in range(len(indata)):
+        if np.isfinite(fitarray[i]).any():
+            masterfit[i] = np.nanmean(fitarray[i])
+            mastersigma[i] = np.nanmean(sigarray[i])
+        else:
+            masterfit[i] = mastersigma[i] = np.nan
+    return masterfit, mastersigma
+
+
+def test_flattenfit_matches_window_loop():
+    intime, indata = gapped_light_curve()
+    npts = len(intime)
+    for npoly, winsize, stepsize in [(3, 2.0, 0.5), (1, 0.5, 0.3), (2, 1.0, 0.1)]:
+        cstep1 = np.searchsorted(intime, np.arange(intime[0], intime[-1], stepsize))
+        cstep2 = np.minimum(np.searchsorted(intime, intime[cstep1] + winsize) - 1, npts - 1)
+        cstep2 = np.maximum(cstep2, cstep1)
+
+# plus a window too short to fit
+
+        cstep1 = np.append(cstep1, 10)
+        cstep2 = np.append(cstep2, 10 + npoly)
+        fitsum, sigsum, nfit, failed = flattenfit(intime, indata, cstep1, cstep2, npoly, 3.0, 5)
+        assert failed == []
+        masterfit = np.where(nfit > 0, fitsum / np.maximum(nfit, 1), np.nan)
+        mastersigma = np.where(nfit > 0, sigsum / np.maximum(nfit, 1), np.nan)
+        reffit, refsigma = reference_flatten(intime, indata, cstep1, cstep2, npoly, 3.0, 5)
+        np.testing.assert_array_equal(np.isnan(masterfit), np.isnan(reffit))
+        assert np.allclose(masterfit, reffit, rtol=1.0e-6, equal_nan=True)
+        assert np.allclose(mastersigma, refsigma, rtol=1.0e-6, equal_nan=True)
@@ -0,0 +1,85 @@
+import numpy as np
+
+from ..kepfourier import ft, ft_slices, ft_peaks, window_grid
+
+
+def light_curve(npts=300, seed=4):
+    rng = np.random.RandomState(seed)
+    x = np.sort(rng.uniform(0.0, 10.0, npts))
+    y = 5.0 + np.sin(2.0 * np.pi * 1.3 * x) + 0.3 * rng.randn(npts)
+    return x, y
+
+
+def test_ft_direct_matches_loop():
+    x, y = light_curve()
+    for f1, f2, df in [(0.1, 3.0, 0.01), (0.0, 20.0, 0.05)]:
+        fr, power = ft(x, y - y.mean(), f1, f2, df, False, method='direct')
+        reffr, refpower = ft(x, y - y.mean(), f1, f2, df, False, method='loop')
+        assert np.array_equal(fr, reffr)
+        assert np.allclose(power, refpower, rtol=1.0e-5, atol=1.0e-7 * refpower.max())
+
+
+def test_ft_nufft_within_stated_tolerance():
+    rng = np.random.RandomState(13)
+    for npts, f1, f2, df in [(300, 0.1, 3.0, 0.001), (2000, 0.0, 24.0, 0.002), (500, 5.0, 50.0, 0.01)]:
+        x = np.sort(rng.uniform(100.0, 190.0, npts))
+        y = np.sin(2.0 * np.pi * 0.5 * (f1 + f2) * x) + rng.randn(npts)
+        fr, power = ft(x, y, f1, f2, df, False, method='nufft')
+        reffr, refpower = ft(x, y, f1, f2, df, False, method='direct')
+        assert np.array_equal(fr, reffr)
+        assert np.abs(power - refpower).max() < 1.0e-4 * refpower.max()
+
+
+def test_ft_slices_matches_ft_of_each_slice():
+    x, y = light_curve()
+    i1 = np.array([0, 20, 50, 120, 120, 200, 10])
+    i2 = np.array([60, 100, 50, 300, 180, 260, 11])
+    fr, power = ft_slices(x, y, i1, i2, 0.1, 3.0, 0.05)
+    assert power.shape == (len(i1), len(fr))
+    peak = np.nanmax(power)
+    for k in range(len(i1)):
+        if i2[k] == i1[k]:
+            assert np.isnan(power[k]).all()
+            continue
+        work = y[i1[k]:i2[k]] - np.median(y[i1[k]:i2[k]])
+        reffr, refpower = ft(x[i1[k]:i2[k]], work, 0.1, 3.0, 0.05, False, method='loop')
+        assert np.allclose(fr, reffr)
+        assert np.allclose(power[k], refpower, rtol=1.0e-4, atol=1.0e-6 * peak)
+
+
+def test_ft_peaks_matches_argmax_of_ft():
+    x, y = light_curve()
+    rng = np.random.RandomState(5)
+    rows = np.vstack([y, np.cos(2.0 * np.pi * 0.7 * x), rng.randn(len(x)), np.ones(len(x))])
+    fpeak, ppeak = ft_peaks(x, rows, 0.1, 3.0, 0.01)
+    for j in range(len(rows)):
+        fr, power = ft(x, rows[j], 0.1, 3.0, 0.01, False, method='loop')
+        assert np.allclose(fpeak[j], fr[np.argmax(power)])
+        assert np.allclose(ppeak[j], power.max(), rtol=1.0e-5)
+    fpeak, ppeak = ft_peaks(x, y - y.mean(), 0.1, 3.0, 0.01)
+    assert fpeak.shape == (1,)
+    assert np.allclose(fpeak[0], 1.3, atol=0.01)
+
+
+def gapped_cadences(seed=6):
+    rng = np.random.RandomState(seed)
+    cadenceno = np.arange(1000, 3000)
+    cadenceno = cadenceno[(cadenceno < 1400) | (cadenceno > 1500)]
+    cadenceno = cadenceno[rng.rand(len(cadenceno)) > 0.1]
+    return 100.0 + cadenceno * 0.0204335, cadenceno
+
+
+def test_window_grid_matches_ft_of_ones():
+    x, cadenceno = gapped_cadences()
+    for f1, f2, df in [(0.0, 5.0, 0.001), (0.0, 60.0, 0.01), (20.0, 30.0, 0.002)]:
+        fr, power = window_grid(x[::-1], cadenceno[::-1], f1, f2, df)
+        reffr, refpower = ft(x, np.ones(len(x)), f1, f2, df, False)
+        assert np.allclose(fr, reffr)
+        assert np.allclose(power, refpower, rtol=0.0, atol=2.0e-3)
+
+
+def test_window_grid_rejects_irregular_timing():
+    x, cadenceno = gapped_cadences()
+    jitter = np.random.RandomState(7).randn(len(x)) * 1.0e-3
+    assert window_grid(x + jitter, cadenceno, 0.0, 5.0, 0.01)[1] is None
+    assert window_grid(x[:1], cadenceno[:1], 0.0, 5.0, 0.01)[1] is None
@@ -0,0 +1,69 @@
+import numpy as np
+from scipy.interpolate import RectBivariateSpline
+
+from .. import kepfunc
+from ..kepfit import fitPRFlsq
+
+
+def gaussian_prf(width=1.2):
+    PRFx = np.arange(-12.0, 12.05, 0.1)
+    PRFy = np.arange(-12.0, 12.05, 0.1)
+    prf = np.exp(-(PRFy[:, None]**2 / (2.0 * width**2) + PRFx[None, :]**2 / (2.0 * (width * 1.3)**2)))
+    return RectBivariateSpline(PRFx, PRFy, prf)
+
+
+def test_PRFmodel_derivs_match_finite_differences():
+    spline = gaussian_prf()
+    DATx = np.arange(100.0, 111.0)
+    DATy = np.arange(200.0, 209.0)
+    bx, by = np.meshgrid(np.linspace(1.0, 11.0, 11), np.linspace(1.0, 9.0, 9))
+    for focus in [False, True]:
+        for background in [False, True]:
+            for border in [0, 1]:
+                params = [900.0, 300.0, 104.71, 107.23, 203.38, 205.87]
+                if background:
+                    params += [5.0, 0.3, -0.2, 0.1][:2 * (border + 1) if border else 1]
+                if focus:
+                    params += [1.04, 0.97, 2.5 if background else 0.0]
+                params = np.array(params)
+                model, derivs = kepfunc.PRFmodel(params, DATx, DATy, 2, border, bx, by, spline,
+                                                 focus, background, True)
+                assert np.allclose(model, kepfunc.PRFmodel(params, DATx, DATy, 2, border, bx, by,
+                                                           spline, focus, background))
+                for k in range(len(params)):
+                    if focus and not background and k == len(params) - 1:
+                        continue
+                    h = 1.0e-5 * max(abs(params[k]), 1.0)
+                    up = params.copy()
+                    up[k] += h
+                    down = params.copy()
+                    down[k] -= h
+                    numeric = (kepfunc.PRFmodel(up, DATx, DATy, 2, border, bx, by, spline, focus, background) -
+                               kepfunc.PRFmodel(down, DATx, DATy, 2, border, bx, by, spline, focus, background)) / (2.0 * h)
+                    assert np.allclose(derivs[k], numeric, rtol=1.0e-4, atol=1.0e-4 * np.abs(numeric).max() + 1.0e-8)
+
+
+def test_fitPRFlsq_stays_within_powell_limit():
+    spline = gaussian_prf(3.0)
+    DATx = np.arange(100.0, 130.0)
+    DATy = np.arange(200.0, 230.0)
+    truth = kepfunc.PRFmodel([1000.0, 124.2, 224.3], DATx, DATy, 1, 0, None, None, spline, False, False)
+    err = np.ones(truth.shape)
+
+# a clean fit is left alone
+
+    ans = fitPRFlsq([800.0, 123.5, 223.6], DATx, DATy, truth, err, 1, 0, None, None, spline,
+                    False, False, 1.0e-6, 1.0e-6, 123.5, 223.6)[0]
+    assert np.allclose(ans, [1000.0, 124.2, 224.3], rtol=1.0e-4)
+
+# a fit that runs off past the centering limit is redone inside it
+
+    for focus, background, limit in [(False, False, 10.0), (False, True, 5.0)]:
+        guess = [800.0, 116.0, 216.0]
+        if background:
+            guess += [0.0]
+        if focus:
+            guess += [1.0, 1.0, 0.0]
+        ans = fitPRFlsq(guess, DATx, DATy, truth, err, 1, 0, None, None, spline,
+                        focus, background, 1.0e-6, 1.0e-6, 112.0, 212.0)[0]
+        assert max(abs(ans[1] - 112.0), abs(ans[2] - 212.0)) <= limit
@@ -0,0 +1,165 @@
+import os
+import numpy as np
+from astropy.io import fits as pyfits
+
+from .. import kepio
+
+
+def write_prf(filename, width):
+    x = np.arange(25) - 12.0
+    hdus = [pyfits.PrimaryHDU()]
+    for i in range(5):
+        image = np.exp(-(x[:, None]**2 + x[None, :]**2) / (2.0 * (width + 0.1 * i)**2))
+        hdu = pyfits.ImageHDU(image)
+        for key, value in [('CRPIX1P', 13.0), ('CRPIX2P', 13.0), ('CRVAL1P', 100.0 + 100.0 * i),
+                           ('CRVAL2P', 200.0 + 50.0 * i), ('CDELT1P', 0.1), ('CDELT2P', 0.1)]:
+            hdu.header[key] = value
+        hdus.append(hdu)
+    pyfits.HDUList(hdus).writeto(filename, overwrite=True)
+
+
+def write_tpf(filename, ntime=30, xdim=5, ydim=4, seed=21):
+    rng = np.random.RandomState(seed)
+    npix = xdim * ydim
+    dim = '(%d,%d)' % (xdim, ydim)
+    yy, xx = np.mgrid[0:ydim, 0:xdim]
+    star = 1000.0 * np.exp(-((xx - 2.2)**2 + (yy - 1.6)**2) / 1.5)
+    flux = star[None] * (1.0 + 0.01 * rng.randn(ntime, 1, 1)) + 5.0 * rng.randn(ntime, ydim, xdim) + 20.0
+    columns = [pyfits.Column(name='TIME', format='D', array=100.0 + 0.0204 * np.arange(ntime)),
+               pyfits.Column(name='TIMECORR', format='E', array=1.0e-3 * rng.rand(ntime)),
+               pyfits.Column(name='CADENCENO', format='J', array=np.arange(ntime) + 5000),
+               pyfits.Column(name='RAW_CNTS', format='%dJ' % npix, dim=dim,
+                             array=np.array(flux * 6.0, dtype='int32')),
+               pyfits.Column(name='FLUX', format='%dE' % npix, dim=dim, array=flux),
+               pyfits.Column(name='FLUX_ERR', format='%dE' % npix, dim=dim,
+                             array=np.sqrt(np.abs(flux))),
+               pyfits.Column(name='FLUX_BKG', format='%dE' % npix, dim=dim,
+                             array=20.0 + rng.randn(ntime, ydim, xdim)),
+               pyfits.Column(name='FLUX_BKG_ERR', format='%dE' % npix, dim=dim,
+                             array=1.0 + 0.1 * rng.rand(ntime, ydim, xdim)),
+               pyfits.Column(name='COSMIC_RAYS', format='%dE' % npix, dim=dim,
+                             array=np.zeros((ntime, ydim, xdim))),
+               pyfits.Column(name='QUALITY', format='J', array=rng.randint(0, 2, ntime) * 128),
+               pyfits.Column(name='POS_CORR1', format='E', array=0.01 * rng.randn(ntime)),
+               pyfits.Column(name='POS_CORR2', format='E', array=0.01 * rng.randn(ntime))]
+    primary = pyfits.PrimaryHDU()
+    for key, value in [('KEPLERID', 1234567), ('CHANNEL', 5), ('SKYGROUP', 17), ('MODULE', 3),
+                       ('OUTPUT', 1), ('QUARTER', 4), ('SEASON', 2), ('RA_OBJ', 290.1),
+                       ('DEC_OBJ', 44.5), ('KEPMAG', 12.3), ('OBSMODE', 'long cadence')]:
+        primary.header[key] = value
+    table = pyfits.BinTableHDU.from_columns(columns, name='TARGETTABLES')
+    for key, value in [('1CRV5P', 300), ('2CRV5P', 500), ('TSTART', 100.0),
+                       ('TSTOP', 100.0 + 0.0204 * ntime), ('BJDREFI', 2454833), ('BJDREFF', 0.0)]:
+        table.header[key] = value
+    maskmap = np.ones((ydim, xdim), dtype='int32')
+    maskmap[0, 0] = 0
+    maskmap[1:3, 1:4] = 3
+    aperture = pyfits.ImageHDU(maskmap, name='APERTURE')
+    for key, value in [('CRPIX1P', 1.0), ('CRPIX2P', 1.0), ('CRVAL1P', 300.0), ('CRVAL2P', 500.0),
+                       ('CDELT1P', 1.0), ('CDELT2P', 1.0)]:
+        aperture.header[key] = value
+    pyfits.HDUList([primary, table, aperture]).writeto(filename)
+    return flux.reshape((ntime, npix))
+
+
+def test_readPRF_disk_cache_is_opt_in_and_follows_mtime(tmpdir, monkeypatch):
+    prfdir = str(tmpdir.mkdir('prf'))
+    cachedir = os.path.join(str(tmpdir), 'cache')
+    logfile = os.path.join(str(tmpdir), 'test.log')
+    prffile = os.path.join(prfdir, 'kplr02.1_2011265_prf.fits')
+    write_prf(prffile, 2.0)
+    kepio.prfcache.clear()
+
+    first = kepio.readPRF(prfdir, 2, 1, 150.0, 210.0, logfile, False)
+    assert first[-1] == 0
+    assert os.listdir(prfdir) == ['kplr02.1_2011265_prf.fits']
+    assert not os.path.exists(cachedir)
+
+    kepio.prfcache.clear()
+    cached = kepio.readPRF(prfdir, 2, 1, 150.0, 210.0, logfile, False, cachedir=cachedir)
+    assert len(os.listdir(cachedir)) == 1
+    assert np.array_equal(cached[0], first[0])
+
+# a disk hit does not read the calibration file
+
+    def fail(*args):
+        raise AssertionError('calibration file read')
+    kepio.prfcache.clear()
+    monkeypatch.setattr(kepio, 'readPRFimages', fail)
+    hit = kepio.readPRF(prfdir, 2, 1, 150.0, 210.0, logfile, False, cachedir=cachedir)
+    assert np.array_equal(hit[0], first[0])
+    monkeypatch.undo()
+
+# a new calibration file invalidates both the in-process and the disk cache
+
+    mtime = os.path.getmtime(prffile)
+    write_prf(prffile, 3.0)
+    os.utime(prffile, (mtime + 10.0, mtime + 10.0))
+    changed = kepio.readPRF(prfdir, 2, 1, 150.0, 210.0, logfile, False, cachedir=cachedir)
+    assert not np.allclose(changed[0], first[0])
+    kepio.prfcache.clear()
+    reread = kepio.readPRF(prfdir, 2, 1, 150.0, 210.0, logfile, False, cachedir=cachedir)
+    assert np.array_equal(reread[0], changed[0])
+
+
+def test_readCBV_sidecar(tmpdir, monkeypatch):
+    bvfile = os.path.join(str(tmpdir), 'kplr2011-q07-d25_lcbv.fits')
+    logfile = os.path.join(str(tmpdir), 'test.log')
+    rng = np.random.RandomState(9)
+    cadence = np.arange(100, 140, dtype='float64')
+    cadence[5] = np.nan
+    vectors = rng.randn(3, len(cadence))
+    columns = [pyfits.Column(name='CADENCENO', format='D', array=cadence)]
+    for i in range(3):
+        columns.append(pyfits.Column(name='VECTOR_%d' % (i + 1), format='D', array=vectors[i]))
+    primary = pyfits.PrimaryHDU()
+    primary.header['QUARTER'] = 7
+    table = pyfits.BinTableHDU.from_columns(columns, name='MODOUT_2_1')
+    pyfits.HDUList([primary, table]).writeto(bvfile)
+    kepio.cbvcache.clear()
+
+    bvcad, bvvectors, quarter, status = kepio.readCBV(bvfile, 2, 1, logfile, False)
+    assert status == 0 and quarter == 7
+    assert np.array_equal(bvcad, np.delete(cadence, 5))
+    assert np.array_equal(bvvectors, np.delete(vectors, 5, axis=1))
+
+# a sidecar hit does not open the CBV file
+
+    def fail(*args, **kwargs):
+        raise AssertionError('CBV file opened')
+    kepio.cbvcache.clear()
+    monkeypatch.setattr(kepio.pyfits, 'open', fail)
+    hit = kepio.readCBV(bvfile, 2, 1, logfile, False)
+    assert hit[2] == 7 and hit[3] == 0
+    assert np.array_equal(hit[0], bvcad)
+    assert np.array_equal(hit[1], bvvectors)
+
+
+def test_readTPF_and_cadenceblocks(tmpdir):
+    infile = os.path.join(str(tmpdir), 'kplr001234567-2010078095331_lpd-targ.fits')
+    logfile = os.path.join(str(tmpdir), 'test.log')
+    flux = write_tpf(infile)
+    out = kepio.readTPF(infile, 'FLUX', logfile, False)
+    assert out[-1] == 0
+    assert out[:14] == ('1234567', '5', '17', '3', '1', '4', '2', '290.1', '44.5', 300, 500, '12.3', 5, 4)
+    assert np.array_equal(out[14], np.array(flux, dtype='float32'))
+    struct = pyfits.open(infile)
+    for colname in ['TIME', 'CADENCENO', 'RAW_CNTS', 'QUALITY']:
+        pixels = kepio.readTPF(infile, colname, logfile, False)[14]
+        column = struct['TARGETTABLES'].data.field(colname)
+        assert np.array_equal(pixels, column.reshape((len(column), -1)) if column.ndim == 3 else column)
+    struct.close()
+
+# blocks cover every cadence once, the last one partial
+
+    tpf, status = kepio.openTPF(infile, logfile, False)
+    assert status == 0 and tpf.keywords() == out[:14]
+    blocks, status = tpf.readblocks(['FLUX', 'TIME'], logfile, False, nblock=7)
+    assert status == 0
+    blocks = list(blocks)
+    assert [(i1, i2) for i1, i2, columns in blocks] == [(0, 7), (7, 14), (14, 21), (21, 28), (28, 30)]
+    assert np.array_equal(np.concatenate([columns[0] for i1, i2, columns in blocks]), out[14])
+    assert np.array_equal(np.concatenate([columns[1] for i1, i2, columns in blocks]),
+                          kepio.readTPF(infile, 'TIME', logfile, False)[14])
+    assert tpf.readblocks(['NOSUCHCOL'], logfile, False)[1] != 0
+    assert tpf.close(logfile, False) == 0
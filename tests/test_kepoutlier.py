@@ -0,0 +1,74 @@
+import numpy as np
+from astropy.io import fits as pyfits
+
+from .. import kepfit
+from ..kepoutlier import kepoutlier
+from .test_kepflatten import gapped_light_curve
+
+
+def write_light_curve(filename, intime, indata):
+    primary = pyfits.PrimaryHDU()
+    primary.header['FILEVER'] = '2.0'
+    primary.header['OBSMODE'] = 'long cadence'
+    flux = np.array(indata)
+    flux[[7, 300]] = np.nan
+    columns = [pyfits.Column(name='TIME', format='D', array=intime),
+               pyfits.Column(name='SAP_FLUX', format='E', array=flux)]
+    table = pyfits.BinTableHDU.from_columns(columns, name='LIGHTCURVE')
+    table.header['TSTART'] = intime[0]
+    table.header['TSTOP'] = intime[-1]
+    pyfits.HDUList([primary, table]).writeto(filename)
+
+
+def reference_outliers(intime, indata, nsig, stepsize, npoly, niter, t1, t2):
+    cstep1 = []
+    cstep2 = []
+    work1 = 0
+    work2 = 0
+    for i in range(len(intime)):
+        if intime[i] >= intime[work1] and intime[i] < intime[work1] + stepsize:
+            work2 = i
+        else:
+            cstep1.append(work1)
+            cstep2.append(work2)
+            work1 = i
+            work2 = i
+    cstep1.append(work1)
+    cstep2.append(work2)
+    masterfit = indata * 0.0
+    mastersigma = np.zeros(len(masterfit))
+    for i in range(len(cstep1)):
+        x = intime[cstep1[i]:cstep2[i]+1] - intime[cstep1[i]]
+        pinit = np.array([indata[cstep1[i]:cstep2[i]+1].mean()] + [0.0] * npoly, dtype='float32')
+        try:
+            coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty, status = \
+                kepfit.lsqclip('poly' + str(npoly), pinit, x, indata[cstep1[i]:cstep2[i]+1], None,
+                               nsig, nsig, niter, None, False)
+            for j in range(len(coeffs)):
+                masterfit[cstep1[i]:cstep2[i]+1] += coeffs[j] * x**j
+            mastersigma[cstep1[i]:cstep2[i]+1] = sigma
+        except:
+            masterfit[cstep1[i]:cstep2[i]+1] = indata[cstep1[i]:cstep2[i]+1]
+            mastersigma[cstep1[i]:cstep2[i]+1] = 1.0e10
+    inrange = (intime > t1) & (intime < t2)
+    return (np.abs(indata - masterfit) > nsig * mastersigma) & inrange
+
+
+def test_kepoutlier_matches_window_loop(tmpdir):
+    intime, indata = gapped_light_curve()
+    infile = str(tmpdir.join('lc.fits'))
+    outfile = str(tmpdir.join('out.fits'))
+    logfile = str(tmpdir.join('test.log'))
+    write_light_curve(infile, intime, indata)
+    finite = np.ones(len(intime), dtype='bool')
+    finite[[7, 300]] = False
+    intime = intime[finite]
+    indata = np.array(indata[finite], dtype='float32')
+    for npoly, stepsize, ranges, t1, t2 in [(3, 1.0, '0,0', 0.0, 1.0e8), (1, 0.4, '2.0,9.0', 2.0, 9.0)]:
+        rejected = reference_outliers(intime, indata, 3.0, stepsize, npoly, 10, t1, t2)
+        assert rejected.sum() > 0
+        kepoutlier(infile, outfile, 'SAP_FLUX', 3.0, stepsize, npoly, 10, 'remove', ranges,
+                   False, False, True, False, logfile, 0)
+        struct = pyfits.open(outfile)
+        assert np.array_equal(struct[1].data.field('TIME'), intime[~rejected])
+        struct.close()
@@ -0,0 +1,52 @@
+import numpy as np
+from scipy.optimize import fmin
+
+from ..keppca import pca, ladfit, mad
+
+
+def correlated_pixels(ntim=300, npix=40, seed=14):
+    rng = np.random.RandomState(seed)
+    signals = rng.randn(ntim, 5) * np.array([10.0, 6.0, 3.0, 2.0, 1.0])
+    return np.dot(signals, rng.randn(5, npix)) + 0.05 * rng.randn(ntim, npix)
+
+
+def test_pca_matches_full_svd():
+    data = correlated_pixels()
+    centred = data - data.mean(axis=0)
+    u, s, vt = np.linalg.svd(centred, full_matrices=False)
+    norm = np.sqrt(len(data) - 1.0)
+    for ncomp in [1, 3, 5, 35]:
+        pcar, recmatrix = pca(data, ncomp)
+        assert pcar.shape == (len(data), ncomp) and recmatrix.shape == (ncomp, data.shape[1])
+        for k in range(min(ncomp, 5)):
+            sign = np.sign(np.dot(vt[k], recmatrix[k]))
+            assert np.allclose(pcar[:, k], sign * u[:, k] * norm, atol=1.0e-6)
+            assert np.allclose(recmatrix[k], sign * vt[k] * s[k] / norm, atol=1.0e-6)
+        assert np.allclose(pcar.mean(axis=0), 0.0, atol=1.0e-10)
+        assert np.allclose(pcar.std(axis=0, ddof=1), 1.0)
+    pcar, recmatrix = pca(data, 5)
+    assert np.allclose(np.dot(pcar, recmatrix), centred, atol=0.5)
+
+
+def test_ladfit_recovers_planted_coefficients():
+    rng = np.random.RandomState(15)
+    components = rng.randn(500, 3)
+    truth = np.array([4.0, -2.5, 0.7])
+    data = 100.0 + np.dot(components, truth) + 0.01 * rng.randn(500)
+
+# outliers in pairs of opposite sign, leaving the mean the objective is taken
+# about unchanged
+
+    outliers = rng.permutation(500)[:50]
+    data[outliers[:25]] += 50.0
+    data[outliers[25:]] -= 50.0
+    coeffs = ladfit(data, components)
+    assert np.allclose(coeffs, truth, atol=0.01)
+    lsq = np.linalg.lstsq(components - components.mean(axis=0), data - data.mean(), rcond=-1)[0]
+    assert np.abs(lsq - truth).max() > 0.1
+
+# at least as good as the simplex minimization of the mean absolute deviation
+
+    objective = lambda c: mad(data - np.dot(components, c))
+    simplex = fmin(objective, np.zeros(3), maxiter=50000, maxfun=50000, disp=False)
+    assert objective(coeffs) <= objective(simplex) * (1.0 + 1.0e-5)
@@ -0,0 +1,43 @@
+import numpy as np
+from scipy.integrate import quad
+from scipy.interpolate import interp1d
+
+from ..keprebin import rebin
+
+
+def cadence_data(npts=60, seed=2):
+    rng = np.random.RandomState(seed)
+    date = np.cumsum(0.02 + 0.01 * rng.rand(npts))
+    flux = np.sin(date * 5.0) + 0.1 * rng.randn(npts)
+    error = 0.05 + 0.05 * rng.rand(npts)
+    return date, flux, error
+
+
+def test_rebin_matches_integrated_interpolant():
+    date, flux, error = cadence_data()
+    bounds = np.linspace(date[0], date[-1], 18)
+    knots = np.sort(np.concatenate((date, 0.5 * (date[1:] + date[:-1]))))
+    for method in ['linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic']:
+        bdate, bflux, berror, status = rebin(date, flux, 'test.log', False,
+                                             nbins=17, method=method)
+        assert status == 0
+        assert np.allclose(bdate, 0.5 * (bounds[1:] + bounds[:-1]))
+        function = interp1d(date, flux, kind=method)
+        for i in range(17):
+            inside = knots[(knots > bounds[i]) & (knots < bounds[i+1])]
+            integral = quad(function, bounds[i], bounds[i+1], points=inside,
+                            limit=200, epsabs=1.0e-12, epsrel=1.0e-12)[0]
+            assert np.allclose(bflux[i], integral / (bounds[i+1] - bounds[i]), rtol=0.0, atol=1.0e-8)
+
+
+def test_rebin_ownbins_and_errors():
+    date, flux, error = cadence_data()
+    bounds = np.sort(np.random.RandomState(3).uniform(date[0], date[-1], 12))
+    bdate, bflux, berror, status = rebin(date, flux, 'test.log', False,
+                                         ownbins=bounds, error=error)
+    assert status == 0
+    cells = np.concatenate(([date[0]], 0.5 * (date[1:] + date[:-1]), [date[-1]]))
+    for i in range(len(bounds) - 1):
+        overlap = np.clip(np.minimum(cells[1:], bounds[i+1]) - np.maximum(cells[:-1], bounds[i]), 0.0, None)
+        reference = np.sqrt(((overlap * error)**2).sum()) / (bounds[i+1] - bounds[i])
+        assert np.allclose(berror[i], reference)
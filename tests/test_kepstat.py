@@ -0,0 +1,111 @@
+import numpy as np
+
+from ..kepstat import foldphase, binphase, running_mean_std, running_frac_std
+from .. import kepfit
+
+
+def phased_data(npts=2000, nbins=40, seed=1):
+    rng = np.random.RandomState(seed)
+    time = np.sort(rng.uniform(0.0, 30.0, npts))
+    data = np.vstack([1.0 + 0.01 * rng.randn(npts), rng.randn(npts)])
+    data[0, rng.randint(0, npts, 20)] += 0.5
+    error = 0.01 + 0.01 * rng.rand(2, npts)
+    return time, data, error
+
+
+def reference_bins(phase, nbins):
+    index = np.floor(phase * nbins).astype(int)
+    return [np.where(index == i)[0] for i in range(nbins)]
+
+
+def test_foldphase():
+    time, data, error = phased_data()
+    phase = foldphase(time, 2.7, 0.3)
+    reference = np.array([(t - 0.3) / 2.7 - np.floor((t - 0.3) / 2.7) for t in time])
+    assert np.allclose(phase, reference, rtol=0.0, atol=1.0e-12)
+    periods = np.array([1.3, 2.7])
+    assert np.allclose(foldphase(time, periods, 0.3)[1], phase, rtol=0.0, atol=1.0e-12)
+
+
+def test_binphase_mean():
+    time, data, error = phased_data()
+    phase = foldphase(time, 2.7, 0.3)
+    phasebin, binned, binerr = binphase(phase, data, error, 40, 'mean', 3.0, 10)
+    bins = reference_bins(phase, 40)
+    assert np.allclose(phasebin, (np.arange(40) + 0.5) / 40.0)
+    for i in range(40):
+        assert np.allclose(binned[:, i], data[:, bins[i]].mean(axis=1))
+        assert np.allclose(binerr[:, i], np.sqrt((error[:, bins[i]]**2).sum(axis=1)) / len(bins[i]))
+
+
+def test_binphase_median():
+    time, data, error = phased_data()
+    phase = foldphase(time, 2.7, 0.3)
+    phasebin, binned, binerr = binphase(phase, data, error, 40, 'median', 3.0, 10)
+    bins = reference_bins(phase, 40)
+    for i in range(40):
+        work = np.sort(data[:, bins[i]], axis=1)
+        assert np.allclose(binned[:, i], work[:, len(bins[i]) // 2])
+
+
+def test_binphase_sigclip():
+    time, data, error = phased_data()
+    phase = foldphase(time, 2.7, 0.3)
+    phasebin, binned, binerr = binphase(phase, data, error, 40, 'sigclip', 3.0, 10)
+    bins = reference_bins(phase, 40)
+    for i in range(40):
+        for j in range(2):
+            y = data[j, bins[i]]
+            x = np.arange(0.0, float(len(y)), 1.0)
+            coeffs = kepfit.lsqclip('poly0', [y.mean()], x, y, error[j, bins[i]],
+                                    3.0, 3.0, 10, 'test.log', False, False)[0]
+            assert np.allclose(binned[j, i], coeffs[0])
+
+
+def test_binphase_empty_bins():
+    phase = np.array([0.05, 0.06, 0.55])
+    data = np.array([[1.0, 3.0, 5.0]])
+    phasebin, binned, binerr = binphase(phase, data, np.ones((1, 3)), 10, 'mean', 3.0, 10)
+    assert np.allclose(phasebin, [0.05, 0.55])
+    assert np.allclose(binned, [[2.0, 5.0]])
+
+
+def running_data(seed=8):
+    rng = np.random.RandomState(seed)
+    time = np.sort(np.concatenate((np.arange(0.0, 10.0, 0.25), rng.uniform(0.0, 10.0, 80))))
+    flux = 100.0 + rng.randn(len(time))
+    flux[rng.randint(0, len(time), 5)] += 10.0
+    return time, flux
+
+
+def window(time, t, wid):
+    return (time > t - wid / 2) & (time < t + wid / 2)
+
+
+def test_running_mean_std():
+    time, flux = running_data()
+    runmean, runstd = running_mean_std(time, flux, [1.0, 2.5])
+    assert runmean.shape == (2, len(time))
+    for j, wid in enumerate([1.0, 2.5]):
+        for i, t in enumerate(time):
+            work = flux[window(time, t, wid)]
+            assert np.allclose(runmean[j, i], work.mean())
+            assert np.allclose(runstd[j, i], work.std())
+    use = flux < 105.0
+    runmean, runstd = running_mean_std(time, flux, 1.0, use)
+    for i, t in enumerate(time):
+        work = flux[window(time, t, 1.0) & use]
+        assert np.allclose(runmean[i], work.mean())
+        assert np.allclose(runstd[i], work.std())
+
+
+def test_running_frac_std():
+    time, flux = running_data()
+    fracstd = running_frac_std(time, flux, [1.0, 2.5], sig=2.0)
+    for j, wid in enumerate([1.0, 2.5]):
+        for i, t in enumerate(time):
+            work = flux[window(time, t, wid)]
+            clipped = work[np.abs(work - np.median(work)) <= 2.0 * work.std()]
+            assert np.allclose(fracstd[j, i], clipped.std() / work.mean())
+    runstd = np.array([flux[window(time, t, 1.0)].std() for t in time])
+    assert np.allclose(running_frac_std(time, flux, 1.0), runstd / running_mean_std(time, flux, 1.0)[0])
@@ -0,0 +1,16 @@
+import os
+
+from ..kepstddev import kepstddev
+from .test_kepflatten import gapped_light_curve
+from .test_kepoutlier import write_light_curve
+
+
+def test_kepstddev_timescale_range(tmpdir):
+    intime, indata = gapped_light_curve()
+    infile = str(tmpdir.join('lc.fits'))
+    logfile = str(tmpdir.join('test.log'))
+    write_light_curve(infile, intime, indata)
+    for timescale, written in [('6.5', True), ('1.0,12,48', True), ('0.5', False), ('6.5,60', False)]:
+        outfile = str(tmpdir.join('cdpp%s.fits' % timescale.replace(',', '_')))
+        kepstddev(infile, outfile, 'SAP_FLUX', timescale, True, True, logfile, 0)
+        assert os.path.exists(outfile) == written
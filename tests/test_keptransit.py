@@ -0,0 +1,22 @@
+import numpy as np
+
+from .. import lightcurve
+from ..keptransit import fit_tmod2
+
+
+def test_fit_tmod2_tabulate():
+    time = np.arange(0.0, 6.0, 0.0204)
+    params = [2.4706, 0.1275, 1.3, 0.0, 7.981, 83.812 * np.pi / 180.0, 0.0, 0.0, 0.0]
+    LDparams = [0.372, 0.278]
+    flux = lightcurve.lightcurve(time, 2.4706, 0.1275, 1.3, 0.0, 7.981, 83.812 * np.pi / 180.0,
+                                 0.0, LDparams, 0.0)
+    error = np.zeros(len(time)) + 1.0e-4
+    fixed = dict((key, False) for key in ['period', 'rprs', 'T0', 'Ecc', 'ars', 'inc', 'omega',
+                                          'sec', 'fluxoffset'])
+    trial = list(params)
+    trial[1] = 0.12
+    exact = fit_tmod2(trial, LDparams, time, flux, error, fixed, params)
+    tabulated = fit_tmod2(trial, LDparams, time, flux, error, fixed, params, True)
+    assert exact > 100.0
+    assert np.allclose(tabulated, exact, rtol=1.0e-3)
+    assert fit_tmod2(params, LDparams, time, flux, error, fixed, params, True) < 1.0e-3 * exact
@@ -0,0 +1,40 @@
+import numpy as np
+
+from .. import ma02
+
+
+def small_table():
+    return ma02.occultquad_table(pmax=0.2, npgrid=51, nzgrid=300)
+
+
+def test_occultquad_interp_within_table_error():
+    table = small_table()
+    e0, e1, e2 = table['error']
+    z = np.concatenate((np.linspace(-1.3, 1.3, 20001), [0.0, 0.1, 0.9, 1.1]))
+    for p in [0.013, 0.05, 0.0777, 0.1, 0.1234, 0.2]:
+        for gamma in [[0.0, 0.0], [0.4, 0.25], [0.8, -0.1], [0.3]]:
+            g1, g2 = (list(gamma) + [0.0])[:2]
+            c2 = g1 + 2 * g2
+            c4 = -g2
+            bound = (abs(1 - c2) * e0 + abs(c2) * e1 + abs(c4) * e2) / (1 - g1 / 3. - g2 / 6.)
+            exact = ma02.occultquad(np.abs(z), p, gamma)
+            assert np.abs(ma02.occultquad_interp(z, p, gamma, table=table) - exact).max() <= bound
+
+
+def test_occultquad_interp_components():
+    table = small_table()
+    z = np.linspace(0.0, 1.3, 5001)
+    for p in [0.03, 0.1234]:
+        interp = ma02.occultquad_interp(z, p, [0.4, 0.25], retall=True, table=table)
+        exact = ma02.occultquad(z, p, [0.4, 0.25], retall=True)
+        assert np.allclose(interp[0], ma02.occultquad_interp(z, p, [0.4, 0.25], table=table))
+        for k in range(3):
+            assert np.abs(interp[k+1] - exact[k+1]).max() <= table['error'][k]
+
+
+def test_occultquad_interp_falls_back_beyond_table():
+    table = small_table()
+    z = np.linspace(0.0, 1.5, 301)
+    assert np.array_equal(ma02.occultquad_interp(z, 0.3, [0.4, 0.25], table=table),
+                          ma02.occultquad(z, 0.3, [0.4, 0.25]))
+    assert np.array_equal(ma02.occultquad_interp(z, 0.0, [0.4, 0.25], table=table), np.ones(len(z)))